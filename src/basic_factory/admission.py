@@ -0,0 +1,239 @@
+"""Admission control for the tool server.
+
+Every tool endpoint passes two gates: its own concurrency limit, then a
+server-wide limit shared by all endpoints. Each gate has a bounded wait queue
+ordered by priority, so cheap reads are let in ahead of queued writes. A
+request is shed with 429 and Retry-After when the queue is full or when its
+expected wait would exceed its deadline, instead of waiting to time out.
+`/health` and `/metrics` are never gated.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Mapping, Optional, Tuple
+
+from loguru import logger
+
+from basic_factory.metrics import metrics
+
+# Priorities: higher is admitted first
+READ = 10
+WRITE = 0
+
+
+@dataclass(frozen=True)
+class EndpointRule:
+    """Limits for one endpoint, or for every path under a prefix ending in "/"."""
+    concurrency: int
+    priority: int = WRITE
+
+
+# Defaults sized so writes can't exhaust git subprocesses or GitHub quota
+DEFAULT_RULES: Dict[str, EndpointRule] = {
+    "/tools/git/create-branch": EndpointRule(2),
+    "/tools/git/commit-files": EndpointRule(4),
+    "/tools/git/push-branch": EndpointRule(4),
+    "/tools/git/create-pr": EndpointRule(4),
+    "/tools/git/batch": EndpointRule(2),
+    "/tools/git/workflow-status": EndpointRule(8, READ),
+    "/tools/git/status": EndpointRule(8, READ),
+    "/tools/repo/": EndpointRule(16, READ),
+}
+
+
+class Overloaded(Exception):
+    """A request was shed instead of queued."""
+
+    def __init__(self, gate: str, reason: str, retry_after: float):
+        self.gate = gate
+        self.retry_after = retry_after
+        super().__init__(f"{gate}: {reason}")
+
+
+class AdmissionGate:
+    """Concurrency limit with a bounded, priority-ordered wait queue."""
+
+    def __init__(self, name: str, concurrency: int, max_queue: int = 64, max_wait: float = 10.0):
+        """
+        Args:
+            name: Used in metrics and errors
+            concurrency: Requests allowed in at once
+            max_queue: Requests allowed to wait; lower-priority waiters are
+                shed to make room for higher-priority ones
+            max_wait: Longest a request may wait before being shed
+        """
+        self.name = name
+        self.concurrency = max(concurrency, 1)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.service_time = 0.05  # Moving average of how long a slot is held
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []  # (-priority, seq, future)
+        self._sequence = itertools.count()
+
+    def _queued(self) -> List[Tuple[int, int, asyncio.Future]]:
+        return [w for w in self._waiters if not w[2].done()]
+
+    def expected_wait(self, ahead: int) -> float:
+        """Rough wait for a request with `ahead` requests queued in front of it."""
+        return (ahead + 1) * self.service_time / self.concurrency
+
+    async def acquire(self, priority: int = WRITE, timeout: Optional[float] = None) -> None:
+        """Wait for a slot, raising Overloaded if the request is shed."""
+        timeout = self.max_wait if timeout is None else min(timeout, self.max_wait)
+        queued = self._queued()
+        if self.active < self.concurrency and not queued:
+            self.active += 1
+            return
+
+        ahead = sum(1 for w in queued if -w[0] >= priority)
+        estimate = self.expected_wait(ahead)
+        if estimate > timeout:
+            raise Overloaded(self.name, f"expected wait {estimate:.1f}s exceeds deadline", estimate)
+        if len(queued) >= self.max_queue:
+            lowest = max(queued, default=None)
+            if lowest is None or -lowest[0] >= priority:
+                raise Overloaded(self.name, "queue full", estimate)
+            lowest[2].set_exception(
+                Overloaded(self.name, "displaced by higher priority", self.expected_wait(len(queued)))
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (-priority, next(self._sequence), future))
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except TimeoutError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                return  # Granted as the timeout fired
+            future.cancel()
+            raise Overloaded(self.name, f"waited {timeout:.1f}s", self.expected_wait(ahead)) from None
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release()  # Granted, but the caller went away
+            else:
+                future.cancel()
+            raise
+
+    def release(self, held: Optional[float] = None) -> None:
+        """Free a slot, handing it straight to the highest-priority waiter."""
+        if held is not None:
+            self.service_time = 0.8 * self.service_time + 0.2 * held
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = WRITE, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        await self.acquire(priority, timeout)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+
+class AdmissionController:
+    """Per-endpoint gates in front of a server-wide gate."""
+
+    def __init__(
+        self,
+        rules: Mapping[str, EndpointRule] = DEFAULT_RULES,
+        max_inflight: int = 32,
+        max_queue: int = 64,
+        max_wait: float = 10.0,
+    ):
+        self.rules = dict(rules)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.server = AdmissionGate("server", max_inflight, max_queue, max_wait)
+        self.gates: Dict[str, AdmissionGate] = {}
+
+    def rule_for(self, path: str) -> Tuple[str, EndpointRule] | None:
+        """Find the rule for a request path, or None if it isn't gated."""
+        rule = self.rules.get(path)
+        if rule is not None:
+            return path, rule
+        for prefix, rule in self.rules.items():
+            if prefix.endswith("/") and path.startswith(prefix):
+                return prefix, rule
+        return None
+
+    def _gate(self, key: str, rule: EndpointRule) -> AdmissionGate:
+        gate = self.gates.get(key)
+        if gate is None:
+            gate = self.gates[key] = AdmissionGate(key, rule.concurrency, self.max_queue, self.max_wait)
+        return gate
+
+    @asynccontextmanager
+    async def admit(self, path: str, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Hold an endpoint and a server slot for the duration of a request."""
+        found = self.rule_for(path)
+        if found is None:
+            yield
+            return
+        key, rule = found
+        name = key.strip("/").replace("/", ".")
+        start = time.monotonic()
+        try:
+            async with self._gate(key, rule).slot(rule.priority, timeout):
+                remaining = None if timeout is None else max(timeout - (time.monotonic() - start), 0.0)
+                async with self.server.slot(rule.priority, remaining):
+                    metrics.observe(f"admission.{name}.wait_ms", (time.monotonic() - start) * 1000)
+                    yield
+        except Overloaded:
+            metrics.increment(f"admission.{name}.shed")
+            raise
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an AdmissionController to HTTP requests.
+
+    Clients can send a `Request-Timeout` header (seconds) to be shed early
+    rather than queued past the point where they would give up.
+    """
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.controller.rule_for(scope["path"]) is None:
+            await self.app(scope, receive, send)
+            return
+
+        timeout = None
+        for key, value in scope.get("headers", ()):
+            if key == b"request-timeout":
+                try:
+                    timeout = float(value)
+                except ValueError:
+                    pass
+
+        admitted = False
+        try:
+            async with self.controller.admit(scope["path"], timeout):
+                admitted = True
+                await self.app(scope, receive, send)
+        except Overloaded as e:
+            if admitted:
+                raise
+            logger.warning(f"Shedding {scope['path']}: {e}")
+            await _reject(scope, receive, send, e)
+
+
+async def _reject(scope, receive, send, error: Overloaded) -> None:
+    from fastapi.responses import JSONResponse
+
+    response = JSONResponse(
+        {"success": False, "message": "Server is busy, retry later", "error": str(error)},
+        status_code=429,
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))},
+    )
+    await response(scope, receive, send)
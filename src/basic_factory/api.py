@@ -1,14 +1,41 @@
+"""FastAPI tool server exposing git and GitHub operations to Claude.
+
+Run with `uvicorn basic_factory.api:create_app --factory`. Importing this
+module has no side effects: logging is configured and the GitHub client and
+git wrapper are created in the app's lifespan, once per worker.
+"""
+import asyncio
+import functools
+import json
 import sys
+from contextlib import asynccontextmanager
+from dataclasses import asdict
 from datetime import datetime
-from typing import Dict, List, Optional, Union, Annotated
-from pydantic import BaseModel
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Literal, Optional, Sequence, Tuple, TypeVar, Union, Annotated
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from pathlib import Path
-from basic_factory.git import Git, GitConfig
-from github import Github
+from basic_factory.compact import compact_result, estimate_tokens
+from basic_factory.admission import DEFAULT_RULES, AdmissionController, AdmissionMiddleware, EndpointRule
+from basic_factory.git import Git, GitConfig, GitError, RepoStatus, WorktreePool
+from basic_factory.idempotency import IdempotencyConflict, IdempotencyKeys, IdempotencyStore, fingerprint
+from basic_factory.metrics import metrics
+from basic_factory.mirror import MirrorCache, MirrorConfig
+from basic_factory.objects import ObjectStore
+from basic_factory.offload import LoopLagMonitor, Offloader
+from basic_factory.resilience import dependency
+from basic_factory.search import SearchHit, SearchIndex
+from basic_factory.settings import Settings
+from basic_factory.validation import CHECKS, Validator
 import os
 
+from fastapi import APIRouter, FastAPI, Depends, Header, HTTPException, Request, Response
+from fastapi.routing import APIRoute
+from fastapi.responses import StreamingResponse
 from loguru import logger
 
+T = TypeVar("T")
+R = TypeVar("R", bound="GitResponse")
+
 # Request/Response Models
 class FileContent(BaseModel):
     path: str
@@ -23,6 +50,11 @@ class CommitFilesRequest(BaseModel):
     files: List[FileContent]
     commit_message: str
     push: bool = True  # Option to push after commit
+    # Run the server's fast checks alongside the commit; failures skip the push.
+    # Sent as "validate", which would shadow BaseModel.validate as a field name.
+    run_checks: bool = Field(False, alias="validate")
+
+    model_config = ConfigDict(populate_by_name=True)
 
 class PushBranchRequest(BaseModel):
     branch_name: str
@@ -33,23 +65,191 @@ class CreatePRRequest(BaseModel):
     branch_name: str
     base_branch: str = "main"
 
-class WorkflowStatusRequest(BaseModel):
+class CompactOptions(BaseModel):
+    compact: bool = False  # Summarize bulky output: diff stats, workflow summaries, commit subjects
+    max_tokens: Optional[int] = Field(default=None, gt=0)  # Shrink the result to fit; the server budget still applies
+
+class WorkflowStatusRequest(CompactOptions):
     pr_number: int
 
+class BatchItem(BaseModel):
+    branch_name: str
+    base_branch: str = "main"
+    files: List[FileContent]
+    commit_message: str
+    pr_title: Optional[str] = None  # Open a pull request when set
+    pr_description: str = ""
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    push: bool = True
+    concurrency: Optional[int] = None  # Defaults to, and is capped by, the server limit
+
+    @field_validator("items")
+    @classmethod
+    def _unique_branches(cls, items: List[BatchItem]) -> List[BatchItem]:
+        # Items run concurrently in separate worktrees; two on one branch would race
+        seen = set()
+        for item in items:
+            if item.branch_name in seen:
+                raise ValueError(f"Duplicate branch_name in batch: {item.branch_name}")
+            seen.add(item.branch_name)
+        return items
+
+class StatusRequest(CompactOptions):
+    untracked: Literal["no", "normal", "all"] = "no"  # "no" skips the untracked scan
+    pathspecs: List[str] = []
+    max_entries: Optional[int] = None
+
+class ReadFileRequest(CompactOptions):
+    path: str
+    ref: str = "HEAD"
+    start_line: int = 1
+    end_line: Optional[int] = None  # Inclusive; defaults to the end of the file
+
+class ListTreeRequest(CompactOptions):
+    path: str = ""
+    ref: str = "HEAD"
+    recursive: bool = False
+
+class LogRequest(CompactOptions):
+    ref: str = "HEAD"
+    path: Optional[str] = None
+    limit: int = 20
+
+class GrepRequest(CompactOptions):
+    pattern: str
+    ref: str = "HEAD"
+    path: str = ""
+    regex: bool = False
+    ignore_case: bool = False
+    max_results: int = 100
+
+class SearchRequest(CompactOptions):
+    query: str  # Whitespace-separated terms, matched case-insensitively
+    ref: str = "HEAD"
+    path: str = ""
+    limit: int = 10
+
+class BlameRequest(CompactOptions):
+    path: str
+    ref: str = "HEAD"
+    start_line: int = 1
+    end_line: Optional[int] = None
+
+class DiffRequest(CompactOptions):
+    base: str
+    head: str = "HEAD"
+    merge_base: bool = False  # Diff from the merge base, as a pull request would
+
 class GitResponse(BaseModel):
     success: bool
     message: str
     error: Optional[str] = None
     data: Optional[Dict] = None
+    tokens: Optional[int] = None  # Estimated size of this response in tokens
+    omitted: Optional[Dict[str, str]] = None  # Fields cut to fit the token budget
+
+class StatusResponse(GitResponse):
+    status: Optional[RepoStatus] = None
+
+def _write_if_changed(path: Path, content: str) -> bool:
+    """Write a file unless it already has this content; return whether it was written"""
+    data = content.encode()
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return True
+
+def _budgeted(method: Callable[[Any, Any], Awaitable[R]]) -> Callable[[Any, Any], Awaitable[R]]:
+    """Count a tool result's tokens, compacting it as the request and server budget ask"""
+    @functools.wraps(method)
+    async def wrapper(self: "GitTools", request):
+        return await self._fit(await method(self, request), request)
+    return wrapper
 
 # Tool Implementations
 class GitTools:
-    def __init__(self, repo_path: Union[str, Path] = "."):
+    def __init__(
+        self,
+        repo_path: Union[str, Path] = ".",
+        github_token: Optional[str] = None,
+        repo_name: Optional[str] = None,
+        batch_concurrency: int = 4,
+        offload: Optional[Offloader] = None,
+        github_api_url: Optional[str] = None,
+        idempotency_db: Optional[Union[str, Path]] = None,
+        max_response_tokens: Optional[int] = None,
+        validation_checks: Sequence[str] = tuple(CHECKS),
+        validation_workers: int = 2,
+    ):
+        # PyGithub is slow to import; only pay for it when tools are created
+        from github import Github
+
         self.repo_path = Path(repo_path)
         self.git = Git(GitConfig(self.repo_path))
-        self.github = Github(os.getenv("GITHUB_TOKEN"))
-        self.repo_name = os.getenv("GITHUB_REPO")  # e.g. "basicmachines-co/basic-factory"
-
+        token = github_token or os.getenv("GITHUB_TOKEN")
+        # Retries are handled by basic_factory.resilience, not PyGithub
+        github_options = {"base_url": github_api_url} if github_api_url else {}
+        self.github = Github(token, retry=None, **github_options)
+        self.repo_name = repo_name or os.getenv("GITHUB_REPO")  # e.g. "basicmachines-co/basic-factory"
+        self.batch_concurrency = batch_concurrency
+        self.worktrees = WorktreePool(self.git, size=batch_concurrency)
+        self.objects = ObjectStore(self.repo_path)
+        self.search_index = SearchIndex(self.objects)
+        self.offload = offload or Offloader()
+        if idempotency_db is None and (self.repo_path / ".git").is_dir():
+            idempotency_db = self.repo_path / ".git" / "basic-factory-idempotency.sqlite3"
+        self.idempotency = IdempotencyKeys(IdempotencyStore(idempotency_db))
+        self.max_response_tokens = max_response_tokens
+        self.validator = Validator(
+            self.git, [CHECKS[name] for name in validation_checks], workers=validation_workers
+        )
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "GitTools":
+        return cls(
+            settings.repo_path,
+            settings.github_token,
+            settings.github_repo,
+            batch_concurrency=settings.batch_concurrency,
+            offload=Offloader(
+                settings.cpu_workers, settings.io_workers, settings.offload_threshold
+            ),
+            github_api_url=settings.github_api_url,
+            idempotency_db=settings.idempotency_db,
+            max_response_tokens=settings.max_response_tokens,
+            validation_checks=settings.validation_checks,
+            validation_workers=settings.validation_workers,
+        )
+
+    async def _fit(self, response: R, request) -> R:
+        """Summarize and shrink a response as requested, and record its token count"""
+        budgets = [b for b in (getattr(request, "max_tokens", None), self.max_response_tokens) if b]
+        budget = min(budgets, default=None)
+        summarize = getattr(request, "compact", False)
+        body = response.model_dump_json()
+        if summarize or (budget is not None and estimate_tokens(body) > budget):
+            fields, omitted = await self.offload.cpu(
+                compact_result, response.model_dump(mode="json"), summarize, budget, size=len(body)
+            )
+            response = type(response).model_validate({**fields, "omitted": omitted or None})
+            body = response.model_dump_json()
+        response.tokens = estimate_tokens(body)
+        return response
+
+    async def _write_files(self, git: Git, files: List[FileContent]) -> None:
+        """Write files into a working tree and stage them"""
+        for file in files:
+            await self.offload.io(_write_if_changed, git.repo_path / file.path, file.content)
+            # Even if unchanged on disk: the file may be untracked or have unstaged edits
+            await git.add(file.path)
+
+    @_budgeted
     async def create_branch(self, request: CreateBranchRequest) -> GitResponse:
         """Create a new branch from base branch"""
         try:
@@ -70,35 +270,51 @@ class GitTools:
                 error=str(e)
             )
 
+    @_budgeted
     async def commit_files(self, request: CommitFilesRequest) -> GitResponse:
-        """Add and commit files to a branch, optionally pushing to remote"""
+        """Add and commit files to a branch, optionally validating and pushing"""
+        validation = None
         try:
             # Ensure we're on the right branch
             await self.git.checkout(request.branch_name)
 
+            if request.run_checks:
+                # Check the new contents in a separate worktree while the commit is made
+                base = await self.git.get_current_commit_sha()
+                files = {f.path: f.content for f in request.files}
+                validation = asyncio.create_task(self.validator.validate(base, files))
+
             # Write and add files
-            for file in request.files:
-                file_path = self.repo_path / file.path
-                file_path.parent.mkdir(parents=True, exist_ok=True)
-                file_path.write_text(file.content)
-                await self.git.add(file.path)
+            await self._write_files(self.git, request.files)
 
             # Commit changes
             await self.git.commit(request.commit_message)
             commit_sha = await self.git.get_current_commit_sha()
 
+            data = {"branch_name": request.branch_name, "commit_sha": commit_sha, "pushed": False}
+            if validation is not None:
+                report = await validation
+                data["validation"] = asdict(report)
+                if not report.passed:
+                    # Drop the commit, or the next push of this branch would publish it unchecked
+                    await self.git.reset(base)
+                    data["commit_discarded"] = True
+                    return GitResponse(
+                        success=False,
+                        message=f"Validation failed; commit discarded from {request.branch_name} and not pushed",
+                        error=report.summary(),
+                        data=data
+                    )
+
             # Push if requested
             if request.push:
                 await self.git.push(request.branch_name)
+                data["pushed"] = True
 
             return GitResponse(
                 success=True,
                 message=f"Committed files to branch: {request.branch_name}",
-                data={
-                    "branch_name": request.branch_name,
-                    "commit_sha": commit_sha,
-                    "pushed": request.push
-                }
+                data=data
             )
         except Exception as e:
             return GitResponse(
@@ -106,7 +322,11 @@ class GitTools:
                 message="Failed to commit files",
                 error=str(e)
             )
+        finally:
+            if validation is not None and not validation.done():
+                validation.cancel()
 
+    @_budgeted
     async def push_branch(self, request: PushBranchRequest) -> GitResponse:
         """Push a branch to the remote repository"""
         try:
@@ -123,15 +343,26 @@ class GitTools:
                 error=str(e)
             )
 
+    async def _github(self, fn: Callable[[], T], idempotent: bool = True) -> T:
+        """Run a blocking PyGithub call off the loop, with retries and circuit breaking.
+
+        Pass idempotent=False for writes such as creating a pull request:
+        they are not retried, so a slow attempt that succeeds is not repeated.
+        """
+        return await dependency("github").call(lambda: asyncio.to_thread(fn), idempotent=idempotent)
+
+    @_budgeted
     async def create_pull_request(self, request: CreatePRRequest) -> GitResponse:
         """Create a pull request on GitHub"""
         try:
-            repo = self.github.get_repo(self.repo_name)
-            pr = repo.create_pull(
-                title=request.title,
-                body=request.description,
-                head=request.branch_name,
-                base=request.base_branch
+            pr = await self._github(
+                lambda: self.github.get_repo(self.repo_name).create_pull(
+                    title=request.title,
+                    body=request.description,
+                    head=request.branch_name,
+                    base=request.base_branch
+                ),
+                idempotent=False
             )
 
             return GitResponse(
@@ -150,16 +381,186 @@ class GitTools:
                 error=str(e)
             )
 
+    @_budgeted
+    async def get_status(self, request: StatusRequest) -> StatusResponse:
+        """Get structured working tree status"""
+        try:
+            status = await self.git.repo_status(
+                untracked=request.untracked,
+                pathspecs=request.pathspecs,
+                max_entries=request.max_entries,
+            )
+            return StatusResponse(
+                success=True,
+                message=f"{len(status.entries)} changed paths on {status.branch or 'detached HEAD'}",
+                status=status
+            )
+        except Exception as e:
+            return StatusResponse(
+                success=False,
+                message="Failed to get status",
+                error=str(e)
+            )
+
+    @_budgeted
+    async def read_file(self, request: ReadFileRequest) -> GitResponse:
+        """Read a file, or a range of its lines, at a ref"""
+        try:
+            file = await self.offload.io(
+                self.objects.read_file, request.ref, request.path, request.start_line, request.end_line
+            )
+            return GitResponse(
+                success=True,
+                message=f"Read {request.path} lines {file.start_line}-{file.end_line} of {file.total_lines}",
+                data=asdict(file)
+            )
+        except Exception as e:
+            return GitResponse(
+                success=False,
+                message=f"Failed to read {request.path}",
+                error=str(e)
+            )
+
+    @_budgeted
+    async def list_tree(self, request: ListTreeRequest) -> GitResponse:
+        """List a directory at a ref"""
+        try:
+            entries = await self.offload.io(
+                self.objects.list_tree, request.ref, request.path, request.recursive
+            )
+            return GitResponse(
+                success=True,
+                message=f"Listed {len(entries)} entries under {request.path or '/'}",
+                data={"entries": [asdict(e) for e in entries]}
+            )
+        except Exception as e:
+            return GitResponse(
+                success=False,
+                message=f"Failed to list {request.path or '/'}",
+                error=str(e)
+            )
+
+    @_budgeted
+    async def get_log(self, request: LogRequest) -> GitResponse:
+        """List recent commits, optionally touching a path"""
+        try:
+            commits = await self.offload.io(
+                self.objects.log, request.ref, request.path, request.limit
+            )
+            return GitResponse(
+                success=True,
+                message=f"Retrieved {len(commits)} commits from {request.ref}",
+                data={"commits": [asdict(c) for c in commits]}
+            )
+        except Exception as e:
+            return GitResponse(
+                success=False,
+                message="Failed to get log",
+                error=str(e)
+            )
+
+    @_budgeted
+    async def grep(self, request: GrepRequest) -> GitResponse:
+        """Search file contents at a ref"""
+        try:
+            matches = await self.offload.io(
+                self.objects.grep,
+                request.ref,
+                request.pattern,
+                request.path,
+                request.regex,
+                request.ignore_case,
+                request.max_results,
+            )
+            return GitResponse(
+                success=True,
+                message=f"Found {len(matches)} matches for {request.pattern!r}",
+                data={"matches": [asdict(m) for m in matches]}
+            )
+        except Exception as e:
+            return GitResponse(
+                success=False,
+                message="Failed to search",
+                error=str(e)
+            )
+
+    @_budgeted
+    async def search(self, request: SearchRequest) -> GitResponse:
+        """Search code at a ref, updating the index for what changed since the last search"""
+        try:
+            def search_at_ref() -> Tuple[Optional[str], int, List[SearchHit]]:
+                # Concurrent searches at other refs share the index
+                with self.search_index.pinned(request.ref) as changed:
+                    hits = self.search_index.search(request.query, request.limit, request.path)
+                    return self.search_index.commit, changed, hits
+
+            commit, changed, hits = await self.offload.io(search_at_ref)
+            return GitResponse(
+                success=True,
+                message=f"Found {len(hits)} files matching {request.query!r}",
+                data={
+                    "commit": commit,
+                    "indexed_changes": changed,
+                    "hits": [asdict(h) for h in hits],
+                }
+            )
+        except Exception as e:
+            return GitResponse(
+                success=False,
+                message="Failed to search",
+                error=str(e)
+            )
+
+    @_budgeted
+    async def blame(self, request: BlameRequest) -> GitResponse:
+        """Attribute lines of a file to the commits that last changed them"""
+        try:
+            hunks = await self.offload.io(
+                self.objects.blame, request.ref, request.path, request.start_line, request.end_line
+            )
+            return GitResponse(
+                success=True,
+                message=f"Blamed {request.path} in {len(hunks)} hunks",
+                data={"hunks": [asdict(h) for h in hunks]}
+            )
+        except Exception as e:
+            return GitResponse(
+                success=False,
+                message=f"Failed to blame {request.path}",
+                error=str(e)
+            )
+
+    @_budgeted
+    async def get_diff(self, request: DiffRequest) -> GitResponse:
+        """Diff two refs; with compact, per-file stats instead of the full diff"""
+        try:
+            if request.merge_base:
+                diff = await self.git.merge_base_diff(request.base, request.head)
+            else:
+                diff = await self.git.diff(request.base, request.head)
+            return GitResponse(
+                success=True,
+                message=f"Diff of {request.base}..{request.head}",
+                data={"base": request.base, "head": request.head, "diff": diff}
+            )
+        except Exception as e:
+            return GitResponse(
+                success=False,
+                message=f"Failed to diff {request.base}..{request.head}",
+                error=str(e)
+            )
+
+    @_budgeted
     async def get_workflow_status(self, request: WorkflowStatusRequest) -> GitResponse:
         """Get status of GitHub Actions workflows for a PR"""
         try:
-            repo = self.github.get_repo(self.repo_name)
-            pr = repo.get_pull(request.pr_number)
+            def fetch_runs():
+                repo = self.github.get_repo(self.repo_name)
+                pr = repo.get_pull(request.pr_number)
+                # Get workflow runs for the PR's head commit
+                return list(repo.get_workflow_runs(head_sha=pr.head.sha))
 
-            # Get workflow runs for the PR's head commit
-            runs = list(repo.get_workflow_runs(
-                head_sha=pr.head.sha
-            ))
+            runs = await self._github(fetch_runs)
 
             status_info = [{
                 "id": run.id,
@@ -184,71 +585,355 @@ class GitTools:
                 error=str(e)
             )
 
+    async def run_batch(self, request: BatchRequest) -> AsyncIterator[GitResponse]:
+        """Commit, push and open PRs for many branches at once.
+
+        Items are committed concurrently in pooled worktrees, every committed
+        branch is pushed in a single `git push`, and PRs are opened
+        concurrently. A result is yielded for each item as soon as it
+        finishes or fails, tagged with the item's index.
+        """
+        concurrency = min(request.concurrency or self.batch_concurrency, self.batch_concurrency)
+        limit = asyncio.Semaphore(max(concurrency, 1))
+        items = request.items
+
+        def result(index: int, success: bool, message: str, error: Optional[str] = None, **data) -> GitResponse:
+            return GitResponse(
+                success=success,
+                message=message,
+                error=error,
+                data={"index": index, "branch_name": items[index].branch_name, **data},
+            )
+
+        # Bring every base branch up to date with one fetch
+        bases = sorted({item.base_branch for item in items})
+        try:
+            await self.git.fetch("origin", *bases)
+        except Exception as e:
+            logger.warning(f"Could not fetch base branches {bases}: {e}")
+
+        async def commit_item(index: int) -> Tuple[int, Optional[str], Optional[str]]:
+            item = items[index]
+            try:
+                async with limit, self.worktrees.acquire() as worktree:
+                    try:
+                        start = await worktree.rev_parse(f"origin/{item.base_branch}")
+                    except GitError:
+                        start = item.base_branch
+                    await worktree._run_command(["checkout", "-f", "-B", item.branch_name, start])
+                    await self._write_files(worktree, item.files)
+                    await worktree.commit(item.commit_message)
+                    return index, await worktree.get_current_commit_sha(), None
+            except Exception as e:
+                return index, None, str(e)
+
+        committed: Dict[int, str] = {}
+        for next_done in asyncio.as_completed([commit_item(i) for i in range(len(items))]):
+            index, sha, error = await next_done
+            if error is not None:
+                yield result(index, False, "Failed to commit files", error)
+            else:
+                committed[index] = sha
+
+        # Push all committed branches in one network session
+        pushed: Dict[int, bool] = {index: False for index in committed}
+        if request.push and committed:
+            try:
+                accepted = await self.git.push_branches(
+                    [items[index].branch_name for index in sorted(committed)]
+                )
+                pushed = {index: accepted[items[index].branch_name] for index in committed}
+            except Exception as e:
+                for index in sorted(committed):
+                    yield result(index, False, "Failed to push branch", str(e), commit_sha=committed.pop(index))
+            for index in [i for i in sorted(committed) if not pushed[i]]:
+                yield result(index, False, "Failed to push branch", "Rejected by remote", commit_sha=committed.pop(index))
+
+        async def finish_item(index: int) -> GitResponse:
+            item = items[index]
+            data = {"commit_sha": committed[index], "pushed": pushed[index]}
+            if not item.pr_title:
+                return result(index, True, f"Committed files to branch: {item.branch_name}", **data)
+            try:
+                async with limit:
+                    pr = await self._github(
+                        lambda: self.github.get_repo(self.repo_name).create_pull(
+                            title=item.pr_title,
+                            body=item.pr_description,
+                            head=item.branch_name,
+                            base=item.base_branch,
+                        ),
+                        idempotent=False,
+                    )
+            except Exception as e:
+                return result(index, False, "Failed to create pull request", str(e), **data)
+            return result(
+                index, True, f"Created pull request: {pr.title}",
+                pr_number=pr.number, pr_url=pr.html_url, **data,
+            )
+
+        for next_done in asyncio.as_completed([finish_item(i) for i in sorted(committed)]):
+            yield await next_done
+
 # FastAPI endpoints
-from fastapi import FastAPI, Depends
-
-
-# Configure loguru
-logger.remove()  # Remove default handler
-logger.add(
-    sys.stdout,
-    format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-    level="INFO"
-)
-logger.add(
-    "basic_factory.log",  # Log to file as well
-    rotation="500 MB",    # Rotate when file reaches 500MB
-    retention="10 days",  # Keep logs for 10 days
-    level="INFO"
-)
-
-# First, create a dependency function that creates our GitTools
-async def get_git_tools() -> GitTools:
+
+def configure_logging(settings: Settings) -> None:
+    """Configure loguru handlers for the server process"""
+    logger.remove()  # Remove default handler
+    logger.add(
+        sys.stdout,
+        format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
+        level=settings.log_level
+    )
+    if settings.log_file:
+        logger.add(
+            settings.log_file,    # Log to file as well
+            rotation="500 MB",    # Rotate when file reaches 500MB
+            retention="10 days",  # Keep logs for 10 days
+            level=settings.log_level
+        )
+
+# Dependency that provides the GitTools created for this app at startup
+async def get_git_tools(request: Request) -> GitTools:
     """Dependency that provides GitTools instance"""
-    return GitTools(".")  # We can make this path configurable later
+    return request.app.state.git_tools
 
 # Use this type alias for cleaner annotations
 GitToolsDep = Annotated[GitTools, Depends(get_git_tools)]
 
-app = FastAPI()
-git_tools = GitTools()
-
-@app.post("/tools/git/create-branch")
+class OffloadedJSONRequest(Request):
+    """Request that decodes large JSON bodies in the app's worker processes"""
+    async def json(self):
+        if not hasattr(self, "_json"):
+            body = await self.body()
+            git_tools = getattr(self.app.state, "git_tools", None)
+            if git_tools is not None:
+                self._json = await git_tools.offload.cpu(json.loads, body, size=len(body))
+            else:
+                self._json = json.loads(body)
+        return self._json
+
+class OffloadedJSONRoute(APIRoute):
+    """Route that keeps decoding big payloads, such as many files to commit, off the event loop"""
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request):
+            return await handler(OffloadedJSONRequest(request.scope, request.receive))
+        return route_handler
+
+router = APIRouter(route_class=OffloadedJSONRoute)
+
+# Retries that send the same key get the first response instead of a second run
+IdempotencyKey = Annotated[Optional[str], Header(alias="Idempotency-Key")]
+
+async def _idempotent(
+    git_tools: GitTools,
+    scope: str,
+    key: Optional[str],
+    request: BaseModel,
+    run: Callable[[], Awaitable[GitResponse]],
+) -> Union[GitResponse, Response]:
+    """Run a mutating tool call once per idempotency key"""
+    if key is None:
+        return await run()
+
+    async def execute() -> Tuple[str, bool]:
+        result = await run()
+        return result.model_dump_json(), result.success
+
+    try:
+        body, replayed = await git_tools.idempotency.run(
+            scope, key, fingerprint(request.model_dump_json()), execute
+        )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return Response(body, media_type="application/json", headers=headers)
+
+@router.post("/tools/git/create-branch")
 async def create_branch_endpoint(
     request: CreateBranchRequest,
-    git_tools: GitToolsDep
+    git_tools: GitToolsDep,
+    idempotency_key: IdempotencyKey = None
 ) -> GitResponse:
-    return await git_tools.create_branch(request)
+    return await _idempotent(
+        git_tools, "create-branch", idempotency_key, request, lambda: git_tools.create_branch(request)
+    )
 
-@app.post("/tools/git/commit-files")
+@router.post("/tools/git/commit-files")
 async def commit_files_endpoint(
     request: CommitFilesRequest,
-    git_tools: GitToolsDep
+    git_tools: GitToolsDep,
+    idempotency_key: IdempotencyKey = None
 ) -> GitResponse:
-    return await git_tools.commit_files(request)
+    return await _idempotent(
+        git_tools, "commit-files", idempotency_key, request, lambda: git_tools.commit_files(request)
+    )
 
-@app.post("/tools/git/push-branch")
+@router.post("/tools/git/push-branch")
 async def push_branch_endpoint(
     request: PushBranchRequest,
-    git_tools: GitToolsDep
+    git_tools: GitToolsDep,
+    idempotency_key: IdempotencyKey = None
 ) -> GitResponse:
-    return await git_tools.push_branch(request)
+    return await _idempotent(
+        git_tools, "push-branch", idempotency_key, request, lambda: git_tools.push_branch(request)
+    )
 
-@app.post("/tools/git/create-pr")
+@router.post("/tools/git/create-pr")
 async def create_pr_endpoint(
     request: CreatePRRequest,
-    git_tools: GitToolsDep
+    git_tools: GitToolsDep,
+    idempotency_key: IdempotencyKey = None
 ) -> GitResponse:
-    return await git_tools.create_pull_request(request)
+    return await _idempotent(
+        git_tools, "create-pr", idempotency_key, request, lambda: git_tools.create_pull_request(request)
+    )
 
-@app.post("/tools/git/workflow-status")
+@router.post("/tools/git/workflow-status")
 async def workflow_status_endpoint(
     request: WorkflowStatusRequest,
     git_tools: GitToolsDep
 ) -> GitResponse:
     return await git_tools.get_workflow_status(request)
 
-@app.get("/health")
+@router.post("/tools/git/status")
+async def status_endpoint(
+    request: StatusRequest,
+    git_tools: GitToolsDep
+) -> StatusResponse:
+    return await git_tools.get_status(request)
+
+@router.post("/tools/repo/read-file")
+async def read_file_endpoint(
+    request: ReadFileRequest,
+    git_tools: GitToolsDep
+) -> GitResponse:
+    return await git_tools.read_file(request)
+
+@router.post("/tools/repo/list-tree")
+async def list_tree_endpoint(
+    request: ListTreeRequest,
+    git_tools: GitToolsDep
+) -> GitResponse:
+    return await git_tools.list_tree(request)
+
+@router.post("/tools/repo/log")
+async def log_endpoint(
+    request: LogRequest,
+    git_tools: GitToolsDep
+) -> GitResponse:
+    return await git_tools.get_log(request)
+
+@router.post("/tools/repo/grep")
+async def grep_endpoint(
+    request: GrepRequest,
+    git_tools: GitToolsDep
+) -> GitResponse:
+    return await git_tools.grep(request)
+
+@router.post("/tools/repo/search")
+async def search_endpoint(
+    request: SearchRequest,
+    git_tools: GitToolsDep
+) -> GitResponse:
+    return await git_tools.search(request)
+
+@router.post("/tools/repo/blame")
+async def blame_endpoint(
+    request: BlameRequest,
+    git_tools: GitToolsDep
+) -> GitResponse:
+    return await git_tools.blame(request)
+
+@router.post("/tools/repo/diff")
+async def diff_endpoint(
+    request: DiffRequest,
+    git_tools: GitToolsDep
+) -> GitResponse:
+    return await git_tools.get_diff(request)
+
+@router.post("/tools/git/batch")
+async def batch_endpoint(
+    request: BatchRequest,
+    git_tools: GitToolsDep,
+    idempotency_key: IdempotencyKey = None
+) -> StreamingResponse:
+    """Run many branch/commit/PR specs, streaming one JSON result per line"""
+    async def results():
+        async for result in git_tools.run_batch(request):
+            yield result.model_dump_json() + "\n", result.success
+
+    if idempotency_key is None:
+        lines = (line async for line, _ in results())
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+
+    try:
+        lines, replayed = await git_tools.idempotency.stream(
+            "batch", idempotency_key, fingerprint(request.model_dump_json()), results
+        )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return StreamingResponse(lines, media_type="application/x-ndjson", headers=headers)
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    return metrics.snapshot()
+
+@router.get("/health")
 async def health_check():
     print("Health check received!")
-    return {"status": "ok", "timestamp": str(datetime.now()), "id": "unique_test_123"}
\ No newline at end of file
+    return {"status": "ok", "timestamp": str(datetime.now()), "id": "unique_test_123"}
+
+def create_admission_controller(settings: Settings) -> AdmissionController:
+    """Admission limits for the tool endpoints, with per-endpoint overrides from settings"""
+    rules = dict(DEFAULT_RULES)
+    for path, concurrency in settings.endpoint_limits.items():
+        priority = rules[path].priority if path in rules else 0
+        rules[path] = EndpointRule(concurrency, priority)
+    return AdmissionController(
+        rules,
+        max_inflight=settings.max_inflight,
+        max_queue=settings.max_queue,
+        max_wait=settings.queue_timeout,
+    )
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """Create the tool server app.
+
+    Settings are read from the environment once, here, unless given.
+    Logging and GitTools are set up in the lifespan so each worker process
+    creates its own resources when it starts serving.
+    """
+    settings = settings or Settings.from_env()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        configure_logging(settings)
+        # Borrow objects from the shared mirror instead of cloning over the network
+        app.state.mirrors = MirrorCache(MirrorConfig(settings.mirror_dir))
+        if settings.repo_url and not (settings.repo_path / ".git").exists():
+            await app.state.mirrors.provision(settings.repo_url, settings.repo_path)
+        app.state.git_tools = GitTools.from_settings(settings)
+        lag_monitor = LoopLagMonitor()
+        lag_monitor.start()
+        logger.info(f"Tool server ready for repo: {settings.repo_path}")
+        try:
+            yield
+        finally:
+            await lag_monitor.stop()
+            app.state.git_tools.offload.shutdown()
+            app.state.git_tools.idempotency.store.close()
+            await app.state.mirrors.close()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings
+    app.state.admission = create_admission_controller(settings)
+    app.add_middleware(AdmissionMiddleware, controller=app.state.admission)
+    app.include_router(router)
+    return app
+
+
+app = create_app()
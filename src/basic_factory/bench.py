@@ -0,0 +1,382 @@
+"""Load-test harness for the tool server.
+
+`run_benchmark` starts the real server (`uvicorn basic_factory.api:create_app
+--factory`) in a subprocess against a scratch repository whose origin is a
+local bare repo, with GitHub replaced by a small fake HTTP server. Workers
+drive a weighted mix of operations for a fixed duration. The report has
+throughput, per-operation p50/p99 latency and the server's RSS, and can be
+saved as a baseline and compared against later runs.
+"""
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import IO, Callable, Dict, List, Optional
+
+import httpx
+
+# Operation name -> relative weight in the mix
+DEFAULT_MIX = {"commit": 2, "pr": 1, "status": 4, "read": 3}
+
+FAKE_REPO = "bench/repo"
+
+
+@dataclass
+class BenchConfig:
+    """What to run and for how long."""
+    duration: float = 10.0  # Seconds of measured load
+    concurrency: int = 8  # Concurrent client workers
+    mix: Dict[str, int] = field(default_factory=lambda: dict(DEFAULT_MIX))
+    files_per_commit: int = 5
+    file_size: int = 2048  # Bytes per committed file
+    seed: int = 0
+    server_env: Dict[str, str] = field(default_factory=dict)  # e.g. BASIC_FACTORY_CPU_WORKERS
+
+
+@dataclass
+class OpStats:
+    """Latency summary for one operation type."""
+    count: int
+    errors: int
+    p50_ms: float
+    p99_ms: float
+    max_ms: float
+
+
+@dataclass
+class BenchReport:
+    """Results of a benchmark run."""
+    duration: float
+    concurrency: int
+    total_ops: int
+    throughput: float  # Operations per second
+    ops: Dict[str, OpStats]
+    rss_mb: Optional[float] = None  # Server resident memory at the end
+    peak_rss_mb: Optional[float] = None
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), indent=2, sort_keys=True)
+
+    @classmethod
+    def from_json(cls, text: str) -> "BenchReport":
+        data = json.loads(text)
+        data["ops"] = {name: OpStats(**stats) for name, stats in data["ops"].items()}
+        return cls(**data)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _rss_mb(pid: int) -> tuple[Optional[float], Optional[float]]:
+    """Current and peak RSS of a process from /proc (Linux only)."""
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+    except OSError:
+        return None, None
+    values = {}
+    for line in status.splitlines():
+        key, _, value = line.partition(":")
+        if key in ("VmRSS", "VmHWM"):
+            values[key] = int(value.split()[0]) / 1024
+    return values.get("VmRSS"), values.get("VmHWM")
+
+
+def _git(cwd: Path, *args: str) -> None:
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def _make_repo(root: Path) -> Path:
+    """Create a repository with one pushed commit and a bare origin."""
+    remote, repo = root / "remote.git", root / "repo"
+    subprocess.run(["git", "init", "-q", "--bare", "-b", "main", str(remote)], check=True)
+    subprocess.run(["git", "init", "-q", "-b", "main", str(repo)], check=True)
+    _git(repo, "config", "user.name", "Bench")
+    _git(repo, "config", "user.email", "bench@example.com")
+    for n in range(20):
+        path = repo / "src" / f"module_{n}.py"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("".join(f"def function_{n}_{i}():\n    return {i}\n\n" for i in range(50)))
+    _git(repo, "add", ".")
+    _git(repo, "commit", "-q", "-m", "Initial commit")
+    _git(repo, "remote", "add", "origin", str(remote))
+    _git(repo, "push", "-q", "-u", "origin", "main")
+    return repo
+
+
+def fake_github_app():
+    """Minimal GitHub REST API covering what the tool server calls."""
+    from fastapi import FastAPI, Request
+
+    app = FastAPI()
+    numbers = itertools.count(1)
+
+    def repo_json(request: Request, owner: str, name: str) -> dict:
+        url = str(request.base_url).rstrip("/")
+        return {
+            "id": 1,
+            "name": name,
+            "full_name": f"{owner}/{name}",
+            "url": f"{url}/repos/{owner}/{name}",
+            "html_url": f"https://github.com/{owner}/{name}",
+        }
+
+    @app.get("/repos/{owner}/{name}")
+    async def get_repo(owner: str, name: str, request: Request):
+        return repo_json(request, owner, name)
+
+    @app.post("/repos/{owner}/{name}/pulls", status_code=201)
+    async def create_pull(owner: str, name: str, request: Request):
+        body = await request.json()
+        number = next(numbers)
+        url = str(request.base_url).rstrip("/")
+        return {
+            "id": number,
+            "number": number,
+            "title": body.get("title"),
+            "body": body.get("body"),
+            "state": "open",
+            "url": f"{url}/repos/{owner}/{name}/pulls/{number}",
+            "html_url": f"https://github.com/{owner}/{name}/pull/{number}",
+            "head": {"ref": body.get("head"), "sha": "0" * 40},
+            "base": {"ref": body.get("base"), "sha": "0" * 40},
+        }
+
+    return app
+
+
+class _ThreadedServer:
+    """Run an ASGI app with uvicorn on a background thread."""
+
+    def __init__(self, app, port: int):
+        import uvicorn
+
+        config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.url = f"http://127.0.0.1:{port}"
+
+    def __enter__(self) -> "_ThreadedServer":
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            # uvicorn exits the thread if it can't bind, e.g. when the port was taken
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                self.server.should_exit = True
+                raise RuntimeError(f"Server on {self.url} did not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+def _start_server(
+    repo: Path, github_url: str, port: int, extra_env: Dict[str, str], log: IO[bytes]
+) -> subprocess.Popen:
+    """Start the tool server; its stderr goes to `log`, a file, so a full pipe can't block it."""
+    env = {
+        **os.environ,
+        "BASIC_FACTORY_REPO_PATH": str(repo),
+        "BASIC_FACTORY_LOG_LEVEL": "WARNING",
+        "BASIC_FACTORY_LOG_FILE": "",
+        "GITHUB_TOKEN": "bench-token",
+        "GITHUB_REPO": FAKE_REPO,
+        "GITHUB_API_URL": github_url,
+        **extra_env,
+    }
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "basic_factory.api:create_app", "--factory",
+            "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+        ],
+        cwd=repo,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=log,
+    )
+
+
+def _tail(path: Path, max_bytes: int = 4096) -> str:
+    with open(path, "rb") as f:
+        f.seek(max(path.stat().st_size - max_bytes, 0))
+        return f.read().decode(errors="replace")
+
+
+async def _wait_healthy(
+    client: httpx.AsyncClient, server: subprocess.Popen, log: Path, timeout: float = 30
+) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited: {_tail(log)}")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server did not become healthy: {_tail(log)}")
+
+
+def _operations(config: BenchConfig) -> Dict[str, Callable[[httpx.AsyncClient, int], object]]:
+    """Request coroutines per operation; each takes a client and a unique sequence number."""
+    content = "x" * (config.file_size - 1) + "\n"
+
+    def files(n: int) -> list:
+        return [
+            {"path": f"bench/{n}/file_{i}.txt", "content": f"{n}-{i}\n{content}"}
+            for i in range(config.files_per_commit)
+        ]
+
+    async def batch(client: httpx.AsyncClient, n: int, pr: bool) -> None:
+        item = {"branch_name": f"bench/{n}", "files": files(n), "commit_message": f"Bench commit {n}"}
+        if pr:
+            item["pr_title"] = f"Bench PR {n}"
+        response = await client.post("/tools/git/batch", json={"items": [item]})
+        response.raise_for_status()
+        for line in response.text.splitlines():
+            if not json.loads(line)["success"]:
+                raise RuntimeError(json.loads(line)["error"])
+
+    async def post(client: httpx.AsyncClient, path: str, body: dict) -> None:
+        response = await client.post(path, json=body)
+        response.raise_for_status()
+        if not response.json()["success"]:
+            raise RuntimeError(response.json()["error"])
+
+    return {
+        "commit": lambda client, n: batch(client, n, pr=False),
+        "pr": lambda client, n: batch(client, n, pr=True),
+        "status": lambda client, n: post(client, "/tools/git/status", {}),
+        "read": lambda client, n: post(
+            client, "/tools/repo/read-file",
+            {"path": f"src/module_{n % 20}.py", "start_line": 1, "end_line": 40},
+        ),
+    }
+
+
+async def _drive(client: httpx.AsyncClient, config: BenchConfig) -> tuple[Dict[str, List[float]], Dict[str, int], float]:
+    operations = _operations(config)
+    unknown = set(config.mix) - set(operations)
+    if unknown:
+        raise ValueError(f"Unknown operations in mix: {sorted(unknown)}")
+    names = [name for name, weight in config.mix.items() if weight > 0]
+    weights = [config.mix[name] for name in names]
+    rng = random.Random(config.seed)
+    sequence = itertools.count()
+    latencies: Dict[str, List[float]] = {name: [] for name in names}
+    errors: Dict[str, int] = {name: 0 for name in names}
+
+    start = time.perf_counter()
+    deadline = start + config.duration
+
+    async def worker() -> None:
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            began = time.perf_counter()
+            try:
+                await operations[name](client, next(sequence))
+                latencies[name].append((time.perf_counter() - began) * 1000)
+            except Exception:
+                errors[name] += 1
+
+    await asyncio.gather(*(worker() for _ in range(config.concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def run_benchmark(config: BenchConfig) -> BenchReport:
+    """Run the server under load and report throughput, latency and memory."""
+    with tempfile.TemporaryDirectory(prefix="basic-factory-bench-") as tmp:
+        repo = _make_repo(Path(tmp))
+        with _ThreadedServer(fake_github_app(), _free_port()) as github:
+            port = _free_port()
+            log_path = Path(tmp) / "server.log"
+            with open(log_path, "wb") as log:
+                server = _start_server(repo, github.url, port, config.server_env, log)
+                try:
+                    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120) as client:
+                        await _wait_healthy(client, server, log_path)
+                        latencies, errors, elapsed = await _drive(client, config)
+                    rss, peak = _rss_mb(server.pid)
+                finally:
+                    server.terminate()
+                    try:
+                        server.wait(timeout=10)
+                    except subprocess.TimeoutExpired:
+                        server.kill()
+
+    total = sum(len(values) for values in latencies.values())
+    return BenchReport(
+        duration=round(elapsed, 3),
+        concurrency=config.concurrency,
+        total_ops=total,
+        throughput=round(total / elapsed, 2) if elapsed else 0.0,
+        ops={
+            name: OpStats(
+                count=len(values),
+                errors=errors[name],
+                p50_ms=round(_percentile(values, 50), 2),
+                p99_ms=round(_percentile(values, 99), 2),
+                max_ms=round(max(values, default=0.0), 2),
+            )
+            for name, values in latencies.items()
+        },
+        rss_mb=round(rss, 1) if rss is not None else None,
+        peak_rss_mb=round(peak, 1) if peak is not None else None,
+    )
+
+
+def compare(current: BenchReport, baseline: BenchReport, tolerance: float = 0.2) -> List[str]:
+    """List regressions beyond `tolerance` (0.2 = 20%) relative to a baseline."""
+    regressions = []
+    if baseline.throughput and current.throughput < baseline.throughput * (1 - tolerance):
+        regressions.append(f"throughput {current.throughput} ops/s < baseline {baseline.throughput}")
+    for name, stats in current.ops.items():
+        base = baseline.ops.get(name)
+        if base is None:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            value, reference = getattr(stats, metric), getattr(base, metric)
+            if reference and value > reference * (1 + tolerance):
+                regressions.append(f"{name} {metric} {value} > baseline {reference}")
+        if stats.errors > base.errors:
+            regressions.append(f"{name} errors {stats.errors} > baseline {base.errors}")
+    if baseline.peak_rss_mb and current.peak_rss_mb and current.peak_rss_mb > baseline.peak_rss_mb * (1 + tolerance):
+        regressions.append(f"peak RSS {current.peak_rss_mb}MB > baseline {baseline.peak_rss_mb}MB")
+    return regressions
+
+
+def format_report(report: BenchReport) -> str:
+    """Render a report as a small text table."""
+    lines = [
+        f"{report.total_ops} ops in {report.duration:.1f}s with {report.concurrency} workers: "
+        f"{report.throughput:.1f} ops/s",
+        f"server RSS {report.rss_mb} MB (peak {report.peak_rss_mb} MB)",
+        f"{'op':<8}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}",
+    ]
+    for name, stats in sorted(report.ops.items()):
+        lines.append(
+            f"{name:<8}{stats.count:>8}{stats.errors:>8}"
+            f"{stats.p50_ms:>10.1f}{stats.p99_ms:>10.1f}{stats.max_ms:>10.1f}"
+        )
+    return "\n".join(lines)
@@ -1,8 +1,23 @@
 """Claude integration for code review and generation."""
 import os
-from typing import List
+from typing import Awaitable, Callable, List, Sequence
 import anthropic
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from loguru import logger
+
+from basic_factory.context import ContextSection, ReviewContext
+from basic_factory.diff import new_line_ranges
+from basic_factory.resilience import dependency
+from basic_factory.review import (
+    REVIEW_TOOL,
+    REVIEW_TOOL_NAME,
+    ReviewComment,
+    ReviewStreamParser,
+    is_anchored,
+    parse_comment,
+)
+
+DEFAULT_MODEL = "claude-3-5-sonnet-20241022"
 
 
 @dataclass
@@ -11,71 +26,177 @@ class CodeReview:
     summary: str
     suggestions: List[str]
     approval: bool
+    comments: List[ReviewComment] = field(default_factory=list)
+
+
+@dataclass
+class CacheStats:
+    """Running prompt cache usage across reviews."""
+    requests: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+    uncached_tokens: int = 0
+
+    def record(self, usage) -> None:
+        """Record the usage block of a Messages API response."""
+        self.requests += 1
+        self.cache_read_tokens += getattr(usage, "cache_read_input_tokens", 0) or 0
+        self.cache_write_tokens += getattr(usage, "cache_creation_input_tokens", 0) or 0
+        self.uncached_tokens += getattr(usage, "input_tokens", 0) or 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of input tokens served from the prompt cache."""
+        total = self.cache_read_tokens + self.cache_write_tokens + self.uncached_tokens
+        return self.cache_read_tokens / total if total else 0.0
 
 
 class Claude:
     """Interface to Claude for code review and generation."""
 
-    def __init__(self, api_key: str | None = None):
+    def __init__(
+        self,
+        api_key: str | None = None,
+        context: ReviewContext | None = None,
+        model: str = DEFAULT_MODEL,
+    ):
         """Initialize Claude client.
 
         Args:
             api_key: Anthropic API key. If not provided, will look for ANTHROPIC_API_KEY env var.
+            context: Repository context sent, cached, ahead of every review
+            model: Model used for reviews
         """
-        self.client = anthropic.Anthropic(
-            api_key=api_key or os.environ["ANTHROPIC_API_KEY"]
+        # Retries and backoff come from the "anthropic" resilience policy
+        self.client = anthropic.AsyncAnthropic(
+            api_key=api_key or os.environ["ANTHROPIC_API_KEY"],
+            max_retries=0,
         )
-
-    async def review_changes(self, diff: str, description: str | None = None) -> CodeReview:
+        self.context = context or ReviewContext()
+        self.model = model
+        self.cache_stats = CacheStats()
+
+    async def review_changes(
+        self,
+        diff: str,
+        description: str | None = None,
+        on_comment: Callable[[ReviewComment], Awaitable[None]] | None = None,
+        related: Sequence[ContextSection] = (),
+    ) -> CodeReview:
         """Review code changes and provide feedback.
 
+        The repository context goes into the cached system prompt; only the
+        diff and description change from one review to the next. The review is
+        requested as `submit_review` tool input and parsed while it streams.
+
         Args:
             diff: Git diff of the changes
             description: Optional PR description or commit message
+            on_comment: Called with each inline comment as soon as it has
+                streamed in and been validated against the diff
+            related: Snippets of related code found for this diff. They go in
+                the user message so the cached system prompt is unchanged.
 
         Returns:
-            CodeReview containing analysis and suggestions
+            CodeReview containing analysis, suggestions and inline comments
         """
         # Construct prompt for code review
-        prompt = f"""You are performing a code review. Please analyze the following code changes:
+        prompt = f"""Please analyze the following code changes:
 
 {diff}
 
 """
         if description:
             prompt += f"\nContext from the author:\n{description}\n"
-
-        prompt += """
-Please provide:
-1. A brief summary of the changes
-2. Any suggestions for improvements
-3. Whether you would approve these changes (true/false)
-
-Keep the review constructive and focused on meaningful improvements."""
-
-        # Get Claude's response
-        message = await self.client.messages.create(
-            model="claude-3-sonnet-20240229",
-            max_tokens=1024,
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
+        if related:
+            snippets = "\n\n".join(section.render() for section in related)
+            prompt += f"\nExisting code related to these changes:\n{snippets}\n"
+
+        ranges = new_line_ranges(diff)
+        emitted = False
+
+        async def attempt():
+            nonlocal emitted
+            parser = ReviewStreamParser(ranges)
+            # Stream Claude's response, emitting comments as they complete
+            async with self.client.messages.stream(
+                model=self.model,
+                max_tokens=4096,
+                system=self.context.system_blocks(),
+                tools=[REVIEW_TOOL],
+                tool_choice={"type": "tool", "name": REVIEW_TOOL_NAME},
+                messages=[
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ]
+            ) as stream:
+                async for event in stream:
+                    if event.type == "input_json":
+                        for comment in parser.feed(event.partial_json):
+                            if on_comment:
+                                emitted = True
+                                await on_comment(comment)
+                return await stream.get_final_message(), parser
+
+        # A retry after comments were emitted would post them twice
+        message, parser = await dependency("anthropic").call(attempt, can_retry=lambda: not emitted)
+
+        self._log_cache_usage(message.usage)
+        return await self._build_review(message, parser, on_comment)
+
+    async def _build_review(
+        self,
+        message,
+        parser: ReviewStreamParser,
+        on_comment: Callable[[ReviewComment], Awaitable[None]] | None,
+    ) -> CodeReview:
+        """Build the CodeReview from the final tool input.
+
+        The final input is authoritative; any comment the streaming parser
+        missed is validated and emitted here so callers see each one once.
+        """
+        data = next(
+            (
+                block.input for block in message.content
+                if block.type == "tool_use" and block.name == REVIEW_TOOL_NAME
+            ),
+            None,
         )
-
-        # Parse response into structured review
-        # TODO: Improve response parsing to better handle Claude's output format
-        response = message.content[0].text
-
-        # Basic parsing - we can make this more sophisticated
-        summary = "To be implemented"
-        suggestions = ["To be implemented"]
-        approval = True
+        if not isinstance(data, dict):
+            raise ValueError("Claude did not return a structured review")
+
+        seen = {(c.path, c.line, c.body) for c in parser.comments + parser.rejected}
+        for raw in data.get("comments") or []:
+            comment = parse_comment(raw, parser.ranges)
+            if comment is None or (comment.path, comment.line, comment.body) in seen:
+                continue
+            if parser.ranges is None or is_anchored(comment, parser.ranges):
+                parser.comments.append(comment)
+                if on_comment:
+                    await on_comment(comment)
+            else:
+                parser.rejected.append(comment)
+
+        suggestions = [s for s in data.get("suggestions") or [] if isinstance(s, str)]
+        # Keep feedback the model anchored outside the diff as plain suggestions
+        suggestions += [f"{c.path}:{c.line}: {c.body}" for c in parser.rejected]
 
         return CodeReview(
-            summary=summary,
+            summary=str(data.get("summary") or ""),
             suggestions=suggestions,
-            approval=approval
-        )
\ No newline at end of file
+            approval=data.get("approval") is True,
+            comments=list(parser.comments),
+        )
+
+    def _log_cache_usage(self, usage) -> None:
+        """Record and log prompt cache usage for a response."""
+        self.cache_stats.record(usage)
+        logger.info(
+            f"Review prompt cache: read={getattr(usage, 'cache_read_input_tokens', 0)} "
+            f"written={getattr(usage, 'cache_creation_input_tokens', 0)} "
+            f"uncached={getattr(usage, 'input_tokens', 0)} "
+            f"context={self.context.digest} "
+            f"hit_rate={self.cache_stats.hit_rate:.1%} over {self.cache_stats.requests} reviews"
+        )
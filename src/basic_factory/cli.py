@@ -1,9 +1,12 @@
-"""Command line interface for basic-factory."""
+"""Command line interface for basic-factory.
+
+Only typer is imported at module level. Commands import what they need
+(PyGithub, loguru via basic_factory.git, ...) when they run, so cheap
+commands like `version` start fast.
+"""
 from pathlib import Path
 from typing import Optional
 import typer
-from basic_factory.git import Git, GitConfig
-from basic_factory.github import GitHubOps, GitHubConfig
 
 app = typer.Typer(
     name="basic-factory",
@@ -42,6 +45,9 @@ def hello_world(
         ),
 ):
     """Create hello world example with PR."""
+    from basic_factory.git import Git, GitConfig
+    from basic_factory.github import GitHubOps, GitHubConfig
+
     # Set up git operations
     git_config = GitConfig(
         repo_path=repo_path,
@@ -85,6 +91,76 @@ def hello_world(
         raise typer.Exit(1)
 
 
+@app.command()
+def bench(
+        duration: float = typer.Option(10.0, help="Seconds of measured load"),
+        concurrency: int = typer.Option(8, help="Concurrent client workers"),
+        mix: str = typer.Option(
+            "commit=2,pr=1,status=4,read=3",
+            help="Operation weights, e.g. commit=2,status=4"
+        ),
+        save: Optional[Path] = typer.Option(None, help="Write the report to this JSON file"),
+        baseline: Optional[Path] = typer.Option(
+            None, exists=True, dir_okay=False, help="Compare against a saved report"
+        ),
+        tolerance: float = typer.Option(0.2, help="Allowed regression vs the baseline (0.2 = 20%)"),
+):
+    """Load-test the tool server against local remotes and a fake GitHub."""
+    import asyncio
+    from basic_factory.bench import BenchConfig, BenchReport, compare, format_report, run_benchmark
+
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = int(weight or 1)
+
+    report = asyncio.run(run_benchmark(BenchConfig(duration=duration, concurrency=concurrency, mix=weights)))
+    typer.echo(format_report(report))
+
+    if save:
+        save.write_text(report.to_json())
+        typer.echo(f"Saved report to {save}")
+
+    if baseline:
+        regressions = compare(report, BenchReport.from_json(baseline.read_text()), tolerance)
+        if regressions:
+            typer.echo("Regressions against baseline:")
+            for regression in regressions:
+                typer.echo(f"  {regression}")
+            raise typer.Exit(1)
+        typer.echo("No regressions against baseline")
+
+
+@app.command()
+def provision(
+        url: str = typer.Argument(..., help="Remote repository URL"),
+        dest: Path = typer.Argument(..., help="Path for the new working copy"),
+        branch: Optional[str] = typer.Option(None, help="Branch to check out"),
+        mirror_dir: Path = typer.Option(
+            Path.home() / ".cache" / "basic-factory" / "mirrors",
+            envvar="BASIC_FACTORY_MIRROR_DIR",
+            help="Shared mirror cache directory"
+        ),
+        refresh_interval: float = typer.Option(60.0, help="Seconds before the mirror is refetched"),
+):
+    """Create a working copy that borrows objects from a shared mirror."""
+    import asyncio
+    from basic_factory.mirror import MirrorCache, MirrorConfig
+
+    async def run():
+        cache = MirrorCache(MirrorConfig(mirror_dir, refresh_interval=refresh_interval))
+        try:
+            await cache.provision(url, dest, branch)
+        finally:
+            await cache.close()
+
+    if dest.exists():
+        typer.echo(f"{dest} already exists")
+        raise typer.Exit(1)
+    asyncio.run(run())
+    typer.echo(f"Provisioned {dest} from {url}")
+
+
 @app.command()
 def version():
     """Show version information."""
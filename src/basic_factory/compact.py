@@ -0,0 +1,204 @@
+"""Compact tool results for agents working within a token budget.
+
+Tool results are fed back into the agent's context on every turn, so their
+size is paid for again and again. This module estimates the token cost of a
+result and shrinks it. Diffs become per-file stats and workflow run lists
+become a summary. Long text keeps its head and tail, and long lists are cut,
+largest first, until the result fits the budget. Every cut is reported so
+the agent knows to ask for a narrower range if it needs the rest.
+"""
+import json
+import math
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from basic_factory.diff import parse_diff
+
+# Conservative for code and JSON; overestimating keeps results under budget
+CHARS_PER_TOKEN = 3.5
+
+# Smallest share of a field kept when shrinking it
+MIN_TEXT_TOKENS = 32
+MIN_LIST_ITEMS = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of some text, without calling a tokenizer."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def count_tokens(value: Any) -> int:
+    """Approximate token count of a value serialized as JSON."""
+    return estimate_tokens(value if isinstance(value, str) else json.dumps(value, default=str, ensure_ascii=False))
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """Keep the head and tail of `text` within `max_tokens`, marking what was cut.
+
+    Cuts fall on line boundaries when the text has lines; the head gets two
+    thirds of the budget because that is where errors and headers usually are.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    budget = int(max_tokens * CHARS_PER_TOKEN) - 40  # Room for the marker
+    if budget <= 0:
+        return f"[... {len(text)} characters omitted ...]"
+    lines = text.splitlines(keepends=True)
+    if len(lines) < 3:
+        head, tail = text[:budget * 2 // 3], text[len(text) - budget // 3:]
+        return f"{head}\n[... {len(text) - len(head) - len(tail)} characters omitted ...]\n{tail}"
+
+    start, used = 0, 0
+    while start < len(lines) and used + len(lines[start]) <= budget * 2 // 3:
+        used += len(lines[start])
+        start += 1
+    end = len(lines)
+    while end > start and used + len(lines[end - 1]) <= budget:
+        used += len(lines[end - 1])
+        end -= 1
+    return "".join(lines[:start]) + f"[... {end - start} lines omitted ...]\n" + "".join(lines[end:])
+
+
+def diff_stats(diff: str) -> List[Dict[str, Any]]:
+    """Per-file summary of a unified diff, in place of its full text."""
+    stats = []
+    for f in parse_diff(diff).files.values():
+        stat = {"path": f.path, "status": f.status, "additions": f.additions, "deletions": f.deletions}
+        if f.old_path and f.old_path != f.path:
+            stat["old_path"] = f.old_path
+        if f.is_binary:
+            stat["binary"] = True
+        stats.append(stat)
+    return stats
+
+
+def summarize_workflow_runs(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Counts by outcome, plus the runs that need attention."""
+    outcomes = Counter(run.get("conclusion") or run.get("status") or "unknown" for run in runs)
+    return {
+        "total": len(runs),
+        "outcomes": dict(outcomes),
+        "failed": [
+            {"name": run.get("name"), "url": run.get("url")}
+            for run in runs if run.get("conclusion") in ("failure", "timed_out", "cancelled", "action_required")
+        ],
+        "pending": [run.get("name") for run in runs if run.get("status") not in (None, "completed")],
+    }
+
+
+def summarize(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace bulky fields in tool result data with compact equivalents."""
+    data = dict(data)
+    if isinstance(data.get("diff"), str):
+        data["files"] = diff_stats(data.pop("diff"))
+    if isinstance(data.get("workflow_runs"), list):
+        data["workflow_summary"] = summarize_workflow_runs(data.pop("workflow_runs"))
+    if isinstance(data.get("commits"), list):
+        # Subjects are enough to follow history; bodies can be read per commit
+        data["commits"] = [
+            {k: v for k, v in commit.items() if k != "body"} if isinstance(commit, dict) else commit
+            for commit in data["commits"]
+        ]
+    return data
+
+
+FieldPath = Tuple[Any, ...]  # Keys and list indexes leading to a field
+
+
+def _largest(value: Any, path: FieldPath = ()) -> Optional[Tuple[int, FieldPath, Any]]:
+    """(tokens, path, value) of the biggest string or list that can still shrink."""
+    best = None
+    if isinstance(value, str):
+        if estimate_tokens(value) > MIN_TEXT_TOKENS:
+            best = (count_tokens([value]), path, value)  # Escaped, as it will be sent
+        return best
+    if isinstance(value, list):
+        if len(value) > MIN_LIST_ITEMS:
+            best = (count_tokens(value), path, value)
+        children = enumerate(value)
+    elif isinstance(value, dict):
+        children = value.items()
+    else:
+        return None
+    for key, item in children:
+        found = _largest(item, (*path, key))
+        if found and (best is None or found[0] > best[0]):
+            best = found
+    return best
+
+
+def _replace(value: Any, path: FieldPath, new: Any) -> Any:
+    """Copy of `value` with the field at `path` replaced."""
+    if not path:
+        return new
+    copy = list(value) if isinstance(value, list) else dict(value)
+    copy[path[0]] = _replace(copy[path[0]], path[1:], new)
+    return copy
+
+
+def _path_name(path: FieldPath) -> str:
+    return "".join(f"[{key}]" if isinstance(key, int) else f".{key}" for key in path).lstrip(".")
+
+
+def fit_to_budget(data: Any, max_tokens: int, max_steps: int = 64) -> Tuple[Any, Dict[str, str]]:
+    """Shrink the largest fields of `data` until it fits in `max_tokens`.
+
+    Returns the shrunk data and what was cut, by field path, e.g.
+    {"content": "truncated from 4000 lines", "matches": "kept 10 of 250 items"}.
+    Gives up once nothing is left to shrink, so the result may still be
+    over budget if its structure alone is too big.
+    """
+    omitted: Dict[str, str] = {}
+    originals: Dict[str, int] = {}
+    for _ in range(max_steps):
+        total = count_tokens(data)
+        if total <= max_tokens:
+            break
+        found = _largest(data)
+        if found is None:
+            break
+        tokens, path, value = found
+        # Cut the whole overage from the largest field, down to a minimum
+        target = max(tokens - (total - max_tokens), MIN_TEXT_TOKENS)
+        name = _path_name(path)
+        if isinstance(value, str):
+            lines = originals.setdefault(name, len(value.splitlines()))
+            # Escaping makes text cost more in JSON than on its own
+            new = truncate_text(value, target * estimate_tokens(value) // tokens)
+            omitted[name] = f"truncated from {lines} lines"
+        else:
+            items = originals.setdefault(name, len(value))
+            keep = max(MIN_LIST_ITEMS, min(len(value) - 1, len(value) * target // tokens))
+            new = value[:keep]
+            omitted[name] = f"kept {keep} of {items} items"
+        data = _replace(data, path, new)
+    return data, omitted
+
+
+ERROR_TOKENS = 256  # Git errors echo the whole command line and stderr
+
+
+def compact_result(
+    result: Dict[str, Any], summarize_data: bool, max_tokens: Optional[int]
+) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Compact a serialized tool response; returns it with what was cut.
+
+    Args:
+        result: Response fields, as plain JSON types
+        summarize_data: Replace bulky data with summaries and shorten errors
+        max_tokens: Budget for the whole response; None for no limit
+    """
+    result = dict(result)
+    if summarize_data:
+        if isinstance(result.get("data"), dict):
+            result["data"] = summarize(result["data"])
+        if isinstance(result.get("error"), str):
+            result["error"] = truncate_text(result["error"], ERROR_TOKENS)
+    if max_tokens is None:
+        return result, {}
+    fitted, omitted = fit_to_budget(result, max_tokens)
+    if omitted:
+        # Leave room for the report of what was cut and the token count
+        overhead = count_tokens({"omitted": omitted, "tokens": max_tokens})
+        fitted, omitted = fit_to_budget(result, max_tokens - overhead)
+    return fitted, omitted
@@ -0,0 +1,144 @@
+"""Stable repository context for Claude reviews.
+
+The context is sent as the system prompt ahead of every review and marked for
+Anthropic prompt caching. Caching only pays off when the prefix is identical
+byte-for-byte between calls, so everything here is rendered deterministically:
+fixed section order, normalized line endings and no timestamps.
+"""
+import hashlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Sequence
+
+# Notes files that describe how the project wants to be worked on
+DEFAULT_NOTES_FILES = ("CLAUDE.md", "CONTRIBUTING.md", "README.md")
+
+# Files that describe tooling and style conventions
+DEFAULT_CONVENTION_FILES = ("pyproject.toml", ".editorconfig")
+
+# Upper bound for a single file so one huge document can't crowd out the rest
+MAX_FILE_CHARS = 20_000
+
+REVIEW_INSTRUCTIONS = """You are performing a code review for this repository.
+Use the repository context above to judge whether changes follow the project's
+conventions and fit its existing architecture.
+
+Submit every review with the submit_review tool, providing:
+1. Inline comments anchored to changed lines in the new version of each file
+2. A brief summary of the changes
+3. Any general suggestions for improvements
+4. Whether you would approve these changes (true/false)
+
+Keep the review constructive and focused on meaningful improvements."""
+
+
+@dataclass(frozen=True)
+class ContextSection:
+    """One tagged block of repository context."""
+    tag: str
+    content: str
+    path: str | None = None
+
+    def render(self) -> str:
+        attrs = f' path="{self.path}"' if self.path else ""
+        return f"<{self.tag}{attrs}>\n{self.content}\n</{self.tag}>"
+
+
+@dataclass(frozen=True)
+class ReviewContext:
+    """Repository context rendered into a cacheable system prompt."""
+    sections: Sequence[ContextSection] = field(default_factory=tuple)
+    instructions: str = REVIEW_INSTRUCTIONS
+
+    def render(self) -> str:
+        """Render the context as a single stable string."""
+        parts = [section.render() for section in self.sections]
+        parts.append(self.instructions)
+        return "\n\n".join(parts)
+
+    @property
+    def digest(self) -> str:
+        """Short hash of the rendered prefix, useful for spotting cache busts."""
+        return hashlib.sha256(self.render().encode()).hexdigest()[:12]
+
+    def system_blocks(self) -> List[dict]:
+        """System prompt blocks with the cache breakpoint on the last block."""
+        return [
+            {
+                "type": "text",
+                "text": self.render(),
+                "cache_control": {"type": "ephemeral"},
+            }
+        ]
+
+
+def _normalize(text: str) -> str:
+    """Normalize text so the same content always renders to the same bytes."""
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    text = "\n".join(line.rstrip() for line in lines).strip("\n")
+    if len(text) > MAX_FILE_CHARS:
+        text = text[:MAX_FILE_CHARS] + "\n... [truncated]"
+    return text
+
+
+def _read(path: Path) -> str | None:
+    try:
+        return _normalize(path.read_text(encoding="utf-8", errors="replace"))
+    except (FileNotFoundError, IsADirectoryError):
+        return None
+
+
+def _module_map(repo_path: Path, source_dirs: Sequence[str]) -> str:
+    """List python modules under the source dirs in a stable order."""
+    paths = []
+    for source_dir in source_dirs:
+        root = repo_path / source_dir
+        if root.is_dir():
+            paths.extend(
+                p.relative_to(repo_path).as_posix() for p in root.rglob("*.py")
+            )
+    return "\n".join(sorted(set(paths)))
+
+
+def build_review_context(
+    repo_path: str | Path,
+    notes_files: Sequence[str] = DEFAULT_NOTES_FILES,
+    convention_files: Sequence[str] = DEFAULT_CONVENTION_FILES,
+    key_modules: Sequence[str] = (),
+    source_dirs: Sequence[str] = ("src",),
+) -> ReviewContext:
+    """Assemble stable repository context for code reviews.
+
+    Args:
+        repo_path: Root of the repository
+        notes_files: CLAUDE.md-style notes to include, in priority order
+        convention_files: Tooling/config files that define project conventions
+        key_modules: Source files to include in full, relative to repo_path
+        source_dirs: Directories to list in the module map
+
+    Returns:
+        ReviewContext that renders identically as long as the files don't change
+    """
+    repo_path = Path(repo_path)
+    sections = []
+
+    for name in notes_files:
+        content = _read(repo_path / name)
+        if content:
+            sections.append(ContextSection("notes", content, name))
+
+    for name in convention_files:
+        content = _read(repo_path / name)
+        if content:
+            sections.append(ContextSection("conventions", content, name))
+
+    module_map = _module_map(repo_path, source_dirs)
+    if module_map:
+        sections.append(ContextSection("module_map", module_map))
+
+    for name in key_modules:
+        content = _read(repo_path / name)
+        if content:
+            sections.append(ContextSection("module", content, name))
+
+    return ReviewContext(sections=tuple(sections))
@@ -0,0 +1,241 @@
+"""Unified diff parsing helpers.
+
+`parse_diff` turns a git-style unified diff into per-file hunks plus an index
+from (path, new line number) to the line's GitHub review comment position, so
+review findings can be anchored with a dictionary lookup.
+
+GitHub counts positions per file: the line below the file's first "@@" header
+is position 1 and the count keeps running through later hunk headers until the
+next file starts.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+@dataclass
+class Hunk:
+    """A single hunk of a file diff."""
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    header: str
+    # Diff position of the header line; 0 for the first hunk of a file
+    position: int
+
+    @property
+    def new_end(self) -> int:
+        """Last new-side line covered by the hunk (inclusive)."""
+        return self.new_start + self.new_count - 1
+
+
+@dataclass
+class FileDiff:
+    """Changes to one file."""
+    path: str
+    old_path: str | None = None
+    status: str = "modified"  # added, deleted, modified, renamed or copied
+    is_binary: bool = False
+    similarity: int | None = None
+    hunks: List[Hunk] = field(default_factory=list)
+    additions: int = 0
+    deletions: int = 0
+
+
+@dataclass(frozen=True)
+class DiffPosition:
+    """Where a new-side line sits in the diff."""
+    path: str
+    line: int
+    position: int
+    hunk: Hunk
+    added: bool
+
+
+@dataclass
+class Diff:
+    """Parsed diff with a (path, new line) -> position index."""
+    files: Dict[str, FileDiff] = field(default_factory=dict)
+    index: Dict[Tuple[str, int], DiffPosition] = field(default_factory=dict)
+
+    def position(self, path: str, line: int) -> DiffPosition | None:
+        """Look up the diff position of a new-side line, if it is in the diff."""
+        return self.index.get((path, line))
+
+    def new_line_ranges(self) -> Dict[str, List[Tuple[int, int]]]:
+        """New-side line ranges covered by each file's hunks."""
+        return {
+            path: [(h.new_start, h.new_end) for h in f.hunks if h.new_count]
+            for path, f in self.files.items()
+            if f.status != "deleted"
+        }
+
+
+def _unquote(path: str) -> str:
+    if len(path) >= 2 and path[0] == path[-1] == '"':
+        path = path[1:-1].encode("latin-1", "backslashreplace").decode("unicode_escape")
+        path = path.encode("latin-1").decode("utf-8", "replace")
+    return path
+
+
+def _strip_prefix(path: str) -> str:
+    path = _unquote(path.split("\t")[0])
+    if path[:2] in ("a/", "b/"):
+        return path[2:]
+    return path
+
+
+def _git_header_paths(rest: str) -> Tuple[str, str]:
+    """Split the "a/x b/y" part of a `diff --git` line into old and new paths."""
+    if rest.startswith('"') or rest.endswith('"'):
+        parts = re.findall(r'"(?:[^"\\]|\\.)*"|\S+', rest)
+        if len(parts) == 2:
+            return _strip_prefix(parts[0]), _strip_prefix(parts[1])
+    # Unquoted paths may contain spaces; an unrenamed file splits evenly
+    half = (len(rest) - 1) // 2
+    if rest[half:half + 3] == " b/" and rest[2:half] == rest[half + 3:]:
+        return rest[2:half], rest[half + 3:]
+    old, _, new = rest.partition(" b/")
+    return _strip_prefix(old), new
+
+
+def _diff_lines(text: str) -> List[str]:
+    """Lines of a diff, split on "\n" only.
+
+    str.splitlines also breaks on form feeds and Unicode line separators,
+    which git treats as ordinary characters; splitting on them would shift
+    every position after such a line.
+    """
+    lines = text.split("\n")
+    if lines and lines[-1] == "":
+        lines.pop()
+    return [line[:-1] if line.endswith("\r") else line for line in lines]
+
+
+def parse_diff(text: str) -> Diff:
+    """Parse a unified diff in a single pass over its lines."""
+    diff = Diff()
+    index = diff.index
+    current: FileDiff | None = None
+    old_left = new_left = 0
+    position = 0
+    new_line = 0
+    hunk: Hunk | None = None
+
+    def start_file(path: str, old_path: str | None) -> FileDiff:
+        nonlocal position, hunk
+        position = 0
+        hunk = None
+        file_diff = FileDiff(path=path, old_path=old_path)
+        diff.files[path] = file_diff
+        return file_diff
+
+    for line in _diff_lines(text):
+        # Inside a hunk body every line belongs to the hunk until the counts run out
+        if old_left > 0 or new_left > 0:
+            position += 1
+            tag = line[:1]
+            if tag == "+":
+                index[(current.path, new_line)] = DiffPosition(
+                    current.path, new_line, position, hunk, True
+                )
+                current.additions += 1
+                new_line += 1
+                new_left -= 1
+            elif tag == "-":
+                current.deletions += 1
+                old_left -= 1
+            elif tag == "\\":
+                pass  # "\ No newline at end of file"
+            else:
+                index[(current.path, new_line)] = DiffPosition(
+                    current.path, new_line, position, hunk, False
+                )
+                new_line += 1
+                new_left -= 1
+                old_left -= 1
+            continue
+
+        if line.startswith("@@"):
+            match = HUNK_HEADER.match(line)
+            if not match or current is None:
+                continue
+            if current.hunks:
+                position += 1
+            old_count = int(match.group(2)) if match.group(2) is not None else 1
+            new_count = int(match.group(4)) if match.group(4) is not None else 1
+            hunk = Hunk(
+                old_start=int(match.group(1)),
+                old_count=old_count,
+                new_start=int(match.group(3)),
+                new_count=new_count,
+                header=line,
+                position=position,
+            )
+            current.hunks.append(hunk)
+            old_left, new_left = old_count, new_count
+            new_line = hunk.new_start
+        elif line.startswith("\\"):
+            position += 1  # trailing "\ No newline" after the counts ran out
+        elif line.startswith("diff --git "):
+            old_path, new_path = _git_header_paths(line[len("diff --git "):])
+            current = start_file(new_path, old_path if old_path != new_path else None)
+        elif current is None or line.startswith("--- ") and current.hunks:
+            # Plain unified diff without `diff --git` headers
+            if line.startswith("--- "):
+                old = line[4:].split("\t")[0]
+                current = start_file(_strip_prefix(old), None)
+                if old == "/dev/null":
+                    current.status = "added"
+        elif line.startswith("--- "):
+            old = line[4:].split("\t")[0]
+            if old == "/dev/null":
+                current.status = "added"
+        elif line.startswith("+++ "):
+            new = line[4:].split("\t")[0]
+            if new == "/dev/null":
+                current.status = "deleted"
+            else:
+                path = _strip_prefix(new)
+                if path != current.path:
+                    # Only plain diffs get here: their file was keyed by the old path
+                    diff.files.pop(current.path, None)
+                    if current.status != "added":
+                        current.old_path = current.path
+                    current.path = path
+                    diff.files[path] = current
+        elif line.startswith("new file mode"):
+            current.status = "added"
+        elif line.startswith("deleted file mode"):
+            current.status = "deleted"
+        elif line.startswith("rename from "):
+            current.old_path = _unquote(line[len("rename from "):])
+            current.status = "renamed"
+        elif line.startswith("rename to "):
+            path = _unquote(line[len("rename to "):])
+            if path != current.path:
+                diff.files.pop(current.path, None)
+                current.path = path
+                diff.files[path] = current
+        elif line.startswith("copy from "):
+            current.old_path = _unquote(line[len("copy from "):])
+            current.status = "copied"
+        elif line.startswith(("similarity index ", "dissimilarity index ")):
+            current.similarity = int(line.rsplit(" ", 1)[1].rstrip("%"))
+        elif line.startswith(("Binary files ", "GIT binary patch")):
+            current.is_binary = True
+
+    return diff
+
+
+def new_line_ranges(diff: str) -> Dict[str, List[Tuple[int, int]]]:
+    """Map each file in a diff to the new-side line ranges covered by its hunks.
+
+    Ranges are inclusive (start, end) line numbers in the new version of the
+    file. Deleted files and pure-deletion hunks cover no new lines.
+    """
+    return parse_diff(diff).new_line_ranges()
+
@@ -1,26 +1,112 @@
+import codecs
+import os
 import subprocess
-from dataclasses import dataclass
+import tempfile
+from dataclasses import dataclass, field, replace
 from pathlib import Path
 import asyncio
-from typing import Optional, List, Union
+import re
+from collections import deque
+from contextlib import aclosing, asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, List, Tuple, Union
 from loguru import logger
 
+from basic_factory.cache import LRUCache
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+FULL_SHA = re.compile(r"^[0-9a-f]{40}([0-9a-f]{24})?$")
+
 @dataclass
 class GitConfig:
     repo_path: Path
     git_path: str = "git"
+    diff_cache_size: int = 32  # Number of (base, head) diffs kept in memory
+    # Seconds an SSH master connection stays open for reuse; None disables it
+    ssh_control_persist: Optional[int] = 600
+    # Extra time to wait for more push requests before pushing; the current
+    # event loop turn is always collected
+    push_coalesce_window: float = 0.0
+    # Seconds before network operations (push, pull, fetch) are killed
+    network_timeout: Optional[float] = 300.0
+    # Largest diff kept in the diff cache; bigger diffs are streamed uncached
+    diff_cache_max_bytes: int = 16 * 1024 * 1024
+    # Let status reuse cached untracked-file scans between calls
+    untracked_cache: bool = True
+    # Ask the builtin fsmonitor daemon for changed paths (needs platform support)
+    fsmonitor: bool = False
 
 class GitError(Exception):
     """Custom exception for git command failures"""
-    def __init__(self, message: str, cmd: List[str], stderr: str):
+    def __init__(self, message: str, cmd: List[str], stderr: str, stdout: str = ""):
         self.cmd = cmd
         self.stderr = stderr
+        self.stdout = stdout
         super().__init__(f"{message}\nCommand: {' '.join(cmd)}\nError: {stderr}")
 
+@dataclass(slots=True)
+class StatusEntry:
+    """One path reported by `git status --porcelain=v2`"""
+    path: str
+    kind: str  # changed, renamed, copied, unmerged, untracked or ignored
+    index: str = "."  # Staged status code, "." when unchanged
+    worktree: str = "."  # Unstaged status code, "." when unchanged
+    orig_path: Optional[str] = None  # Source path of a rename or copy
+    score: Optional[int] = None  # Rename/copy similarity percentage
+
+@dataclass
+class RepoStatus:
+    """Structured repository status"""
+    branch: Optional[str] = None  # None when HEAD is detached
+    oid: Optional[str] = None  # None before the first commit
+    upstream: Optional[str] = None
+    ahead: int = 0
+    behind: int = 0
+    entries: List[StatusEntry] = field(default_factory=list)
+    truncated: bool = False  # Stopped early at max_entries
+
+    @property
+    def clean(self) -> bool:
+        return not self.truncated and all(e.kind == "ignored" for e in self.entries)
+
+class GitTimeoutError(GitError):
+    """Git command killed after exceeding its timeout"""
+
+async def _kill(process: asyncio.subprocess.Process) -> None:
+    """Kill a child process if it is still running and reap it"""
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+def _parse_branch_header(status: RepoStatus, record: str) -> None:
+    """Apply a "# branch.*" header line from porcelain v2 output"""
+    _, key, value = record.split(" ", 2)
+    if key == "branch.oid":
+        status.oid = None if value == "(initial)" else value
+    elif key == "branch.head":
+        status.branch = None if value == "(detached)" else value
+    elif key == "branch.upstream":
+        status.upstream = value
+    elif key == "branch.ab":
+        ahead, behind = value.split()
+        status.ahead, status.behind = int(ahead), -int(behind)
+
 class Git:
     def __init__(self, config: GitConfig):
         self.config = config
         self.repo_path = config.repo_path
+        self._diff_cache: LRUCache[Tuple[str, str, bool], List[str]] = LRUCache(
+            config.diff_cache_size
+        )
+        self._merge_base_cache: LRUCache[Tuple[str, str], str] = LRUCache(256)
+        self._pending_pushes: Dict[str, Dict[str, asyncio.Future]] = {}
+        self._pushed: Dict[Tuple[str, str], str] = {}  # (remote, branch) -> commit this instance pushed
+        self._push_tasks: Dict[str, asyncio.Task] = {}
+        self._network_env: Optional[Dict[str, str]] = None
+        self._network_env_ready = False
         logger.info(f"Initialized Git wrapper for repo: {self.repo_path}")
 
     def _ensure_git_config(self):
@@ -54,13 +140,56 @@ class Git:
 
 
 
-    async def _run_command(self, args: List[str], check: bool = True) -> str:
+    async def _command_env(self) -> Optional[Dict[str, str]]:
+        """Environment for git processes that talk to a remote.
+
+        SSH remotes get a persistent ControlMaster connection so pushes and
+        fetches reuse one authenticated session instead of paying for a new
+        handshake every time. An SSH command configured through GIT_SSH_COMMAND,
+        GIT_SSH or core.sshCommand is left alone. Resolved on the first
+        network command, so local-only instances never look up the config.
+        """
+        if self._network_env_ready:
+            return self._network_env
+        self._network_env = await self._ssh_env()
+        self._network_env_ready = True
+        return self._network_env
+
+    async def _ssh_env(self) -> Optional[Dict[str, str]]:
+        if self.config.ssh_control_persist is None:
+            return None
+        if "GIT_SSH_COMMAND" in os.environ or "GIT_SSH" in os.environ:
+            return None
+        if await self._run_command(["config", "core.sshCommand"], check=False):
+            return None
+        control_dir = Path(tempfile.gettempdir()) / f"basic-factory-ssh-{os.getuid()}"
+        control_dir.mkdir(mode=0o700, exist_ok=True)
+        return {
+            **os.environ,
+            "GIT_SSH_COMMAND": (
+                "ssh -o ControlMaster=auto "
+                f"-o ControlPath={control_dir}/%C "
+                f"-o ControlPersist={self.config.ssh_control_persist}s"
+            ),
+        }
+
+    async def _run_command(
+        self,
+        args: List[str],
+        check: bool = True,
+        strip: bool = True,
+        timeout: Optional[float] = None,
+        network: bool = False,
+    ) -> str:
         """
         Run git command asynchronously using asyncio.create_subprocess_exec
         
         Args:
             args: List of command arguments
             check: Whether to raise exception on non-zero exit code
+            strip: Whether to strip surrounding whitespace from the output
+            timeout: Seconds before the process is killed and GitTimeoutError raised
+            network: Whether the command talks to a remote; see _command_env
             
         Returns:
             Command output as string
@@ -76,14 +205,22 @@ class Git:
             process = await asyncio.create_subprocess_exec(
                 *cmd,
                 cwd=str(self.repo_path),
+                env=await self._command_env() if network else None,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE
             )
             
             # Wait for completion and get output
-            stdout, stderr = await process.communicate()
-            stdout_str = stdout.decode().strip()
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+            except asyncio.TimeoutError:
+                raise GitTimeoutError(f"Git command timed out after {timeout}s", cmd, "")
+            finally:
+                await _kill(process)
+            stdout_str = stdout.decode()
             stderr_str = stderr.decode().strip()
+            if strip:
+                stdout_str = stdout_str.strip()
             
             if stdout_str:
                 logger.info(f"Command output:\n{stdout_str}")
@@ -97,7 +234,8 @@ class Git:
                 raise GitError(
                     "Git command failed",
                     cmd,
-                    stderr_str
+                    stderr_str,
+                    stdout_str
                 )
             
             logger.info(f"Git command completed successfully")
@@ -107,13 +245,104 @@ class Git:
             logger.exception(f"Error executing git command: {cmd_str}")
             raise
 
+    async def _stream_command(
+        self,
+        args: List[str],
+        separator: str = "\n",
+        check: bool = True,
+        timeout: Optional[float] = None,
+        max_record_chars: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Run git command and yield its output one record at a time
+
+        Output is read in fixed-size chunks and decoded incrementally, so at
+        most one chunk plus one partial record is held in memory regardless of
+        how much the command prints, unless a single record is huge. Callers
+        that can handle partial records can bound that with max_record_chars.
+        Only the tail of stderr is kept, for error messages.
+
+        The child is killed if the timeout expires, if the consumer stops
+        iterating early, or if the surrounding task is cancelled.
+
+        Args:
+            args: List of command arguments
+            separator: Record separator, e.g. "\0" for -z output
+            check: Whether to raise exception on non-zero exit code
+            timeout: Seconds for the whole command before GitTimeoutError
+            max_record_chars: Longest partial record buffered before yielding it
+                in pieces, with no separator between them; None keeps records whole
+
+        Yields:
+            Records without their separator
+        """
+        cmd = [self.config.git_path, *args]
+        logger.info(f"Streaming git command: {' '.join(cmd)}")
+
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=str(self.repo_path),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stderr_tail: deque = deque(maxlen=16)
+
+        async def drain_stderr():
+            while chunk := await process.stderr.read(STREAM_CHUNK_SIZE):
+                stderr_tail.append(chunk)
+
+        stderr_task = asyncio.create_task(drain_stderr())
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        pending = ""
+        try:
+            while True:
+                remaining = None if deadline is None else max(deadline - loop.time(), 0)
+                try:
+                    chunk = await asyncio.wait_for(
+                        process.stdout.read(STREAM_CHUNK_SIZE), remaining
+                    )
+                except asyncio.TimeoutError:
+                    raise GitTimeoutError(f"Git command timed out after {timeout}s", cmd, "")
+                text = pending + decoder.decode(chunk, final=not chunk)
+                records = text.split(separator)
+                pending = records.pop()
+                for record in records:
+                    yield record
+                while max_record_chars is not None and len(pending) > max_record_chars:
+                    yield pending[:max_record_chars]
+                    pending = pending[max_record_chars:]
+                if not chunk:
+                    break
+            if pending:
+                yield pending
+
+            await process.wait()
+            await stderr_task
+            if check and process.returncode != 0:
+                stderr_str = b"".join(stderr_tail).decode(errors="replace").strip()
+                logger.error(f"Git command failed with exit code {process.returncode}: {stderr_str}")
+                raise GitError("Git command failed", cmd, stderr_str)
+        finally:
+            await _kill(process)
+            stderr_task.cancel()
+
+    def _remote(self, remote: str):
+        """Retry policy and circuit breaker shared by all commands talking to a remote"""
+        from basic_factory.resilience import dependency  # resilience imports this module
+
+        return dependency(f"git:{remote}", "git")
+
     async def pull(self, remote: str = "origin", branch: Optional[str] = None) -> str:
         """Pull changes from remote repository"""
         logger.info(f"Pulling from {remote}" + (f" branch {branch}" if branch else ""))
         args = ["pull", remote]
         if branch:
             args.append(branch)
-        return await self._run_command(args)
+        return await self._remote(remote).call(
+            lambda: self._run_command(args, timeout=self.config.network_timeout, network=True)
+        )
 
     async def checkout(self, branch: str) -> str:
         """Checkout a branch"""
@@ -135,10 +364,121 @@ class Git:
         logger.info(f"Creating commit with message: '{message}'")
         return await self._run_command(["commit", "-m", message])
 
+    async def reset(self, ref: str) -> str:
+        """Move the current branch to ref, keeping unrelated local changes (git reset --keep)"""
+        logger.info(f"Resetting current branch to {ref}")
+        return await self._run_command(["reset", "--keep", ref])
+
     async def push(self, branch: str, remote: str = "origin") -> str:
-        """Push branch to remote"""
+        """Push branch to remote
+
+        Concurrent and back-to-back pushes to the same remote are coalesced
+        into one multi-ref `git push`; see push_branches.
+        """
         logger.info(f"Pushing branch {branch} to remote {remote}")
-        return await self._run_command(["push", "-u", remote, branch])
+        (accepted, summary), = await self._request_push([branch], remote)
+        if not accepted:
+            raise GitError("Push rejected", ["git", "push", "-u", remote, branch], summary)
+        return summary
+
+    async def push_branches(self, branches: List[str], remote: str = "origin") -> Dict[str, bool]:
+        """Push several branches to remote
+
+        Returns whether each branch was accepted by the remote.
+        """
+        logger.info(f"Pushing branches {', '.join(branches)} to remote {remote}")
+        results = await self._request_push(branches, remote)
+        return {branch: accepted for branch, (accepted, _) in zip(branches, results)}
+
+    async def _request_push(self, branches: List[str], remote: str) -> List[Tuple[bool, str]]:
+        """Queue branches for the next push to remote and wait for the outcome
+
+        Requests that arrive while a push is being prepared or is in flight are
+        merged into the following push, and a branch already queued shares the
+        queued request instead of being pushed twice.
+        """
+        pending = self._pending_pushes.setdefault(remote, {})
+        loop = asyncio.get_running_loop()
+        futures = []
+        for branch in branches:
+            if branch not in pending:
+                pending[branch] = loop.create_future()
+            futures.append(pending[branch])
+
+        task = self._push_tasks.get(remote)
+        if task is None or task.done():
+            self._push_tasks[remote] = asyncio.create_task(self._drain_pushes(remote))
+        # The futures are shared with other callers: one caller being cancelled
+        # must not cancel them for the rest
+        return list(await asyncio.gather(*(asyncio.shield(f) for f in futures)))
+
+    async def _drain_pushes(self, remote: str) -> None:
+        """Push queued branches for a remote until nothing is left"""
+        await asyncio.sleep(self.config.push_coalesce_window)
+        while self._pending_pushes.get(remote):
+            batch = self._pending_pushes.pop(remote)
+            try:
+                results = await self._push_now(list(batch), remote)
+            except Exception as e:
+                for future in batch.values():
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for branch, future in batch.items():
+                    if not future.done():
+                        future.set_result(results[branch])
+
+    async def _push_now(self, branches: List[str], remote: str) -> Dict[str, Tuple[bool, str]]:
+        """Push branches in one `git push`, skipping ones already pushed
+
+        A branch is skipped only when this instance itself pushed its current
+        commit. Remote-tracking refs are not trusted for this: they are only as
+        fresh as the last fetch, and miss force-pushes and deletions by others.
+        """
+        refs = await self._run_command([
+            "for-each-ref", "--format=%(refname) %(objectname)",
+            *(f"refs/heads/{b}" for b in branches),
+        ])
+        shas = dict(line.split(" ", 1) for line in refs.splitlines() if line)
+
+        results: Dict[str, Tuple[bool, str]] = {}
+        to_push = []
+        for branch in branches:
+            local = shas.get(f"refs/heads/{branch}")
+            if local is not None and local == self._pushed.get((remote, branch)):
+                results[branch] = (True, "Already up to date")
+            else:
+                to_push.append(branch)
+        if len(to_push) < len(branches):
+            logger.info(f"Skipping push of up-to-date branches: {', '.join(sorted(set(branches) - set(to_push)))}")
+        if not to_push:
+            return results
+
+        cmd = ["push", "--porcelain", "-u", remote, *to_push]
+        try:
+            output = await self._remote(remote).call(
+                lambda: self._run_command(cmd, timeout=self.config.network_timeout, network=True)
+            )
+        except GitError as e:
+            # Rejected refs still get porcelain lines; anything else is a real failure
+            if not e.stdout:
+                raise
+            output = e.stdout
+        for line in output.splitlines():
+            # Porcelain ref lines look like "<flag>\t<src>:<dst>\t<summary>"
+            parts = line.split("\t")
+            if len(parts) < 2 or ":" not in parts[1]:
+                continue
+            src = parts[1].split(":", 1)[0].removeprefix("refs/heads/")
+            if src in to_push:
+                summary = parts[2] if len(parts) > 2 else ""
+                results[src] = (parts[0].strip() != "!", summary)
+                if results[src][0] and f"refs/heads/{src}" in shas:
+                    self._pushed[(remote, src)] = shas[f"refs/heads/{src}"]
+        missing = [branch for branch in to_push if branch not in results]
+        if missing:
+            raise GitError("Push failed", [self.config.git_path, *cmd], output)
+        return results
 
     async def get_current_branch(self) -> str:
         """Get name of current branch"""
@@ -153,4 +493,206 @@ class Git:
     async def status(self) -> str:
         """Get git status output"""
         logger.info("Getting git status")
-        return await self._run_command(["status"])
\ No newline at end of file
+        return await self._run_command(["status"])
+
+    async def repo_status(
+        self,
+        untracked: str = "normal",
+        pathspecs: Optional[List[str]] = None,
+        ignored: bool = False,
+        max_entries: Optional[int] = None,
+    ) -> RepoStatus:
+        """Get machine-readable status from `git status --porcelain=v2 -z`
+
+        Args:
+            untracked: "no" skips the untracked scan entirely, "normal" lists
+                untracked directories, "all" lists every untracked file
+            pathspecs: Only report paths matching these pathspecs
+            ignored: Also report ignored files
+            max_entries: Stop reading after this many entries
+        """
+        logger.info(f"Getting repository status (untracked={untracked}, pathspecs={pathspecs})")
+        args = []
+        if self.config.untracked_cache:
+            args += ["-c", "core.untrackedCache=true"]
+        if self.config.fsmonitor:
+            args += ["-c", "core.fsmonitor=true"]
+        args += [
+            "status", "--porcelain=v2", "-z", "--branch",
+            f"--untracked-files={untracked}",
+            f"--ignored={'traditional' if ignored else 'no'}",
+        ]
+        if pathspecs:
+            args += ["--", *pathspecs]
+
+        status = RepoStatus()
+        entries = status.entries
+        expect_orig_path = False
+        records = self._stream_command(args, separator="\0")
+        async with aclosing(records):
+            async for record in records:
+                if expect_orig_path:
+                    # Renames and copies are followed by their source path
+                    entries[-1].orig_path = record
+                    expect_orig_path = False
+                    continue
+                if not record:
+                    continue
+                kind = record[0]
+                if kind == "#":
+                    _parse_branch_header(status, record)
+                    continue
+                if max_entries is not None and len(entries) >= max_entries:
+                    status.truncated = True
+                    break
+                if kind == "1":
+                    # 1 XY sub mH mI mW hH hI path
+                    fields = record.split(" ", 8)
+                    entries.append(StatusEntry(fields[8], "changed", fields[1][0], fields[1][1]))
+                elif kind == "2":
+                    # 2 XY sub mH mI mW hH hI Xscore path, then origPath
+                    fields = record.split(" ", 9)
+                    score = fields[8]
+                    entries.append(StatusEntry(
+                        fields[9],
+                        "renamed" if score[0] == "R" else "copied",
+                        fields[1][0],
+                        fields[1][1],
+                        score=int(score[1:]),
+                    ))
+                    expect_orig_path = True
+                elif kind == "u":
+                    # u XY sub m1 m2 m3 mW h1 h2 h3 path
+                    fields = record.split(" ", 10)
+                    entries.append(StatusEntry(fields[10], "unmerged", fields[1][0], fields[1][1]))
+                elif kind == "?":
+                    entries.append(StatusEntry(record[2:], "untracked", "?", "?"))
+                elif kind == "!":
+                    entries.append(StatusEntry(record[2:], "ignored", "!", "!"))
+        return status
+
+    async def fetch(self, remote: str = "origin", *refspecs: str) -> str:
+        """Fetch refs from remote repository"""
+        logger.info(f"Fetching from {remote}: {' '.join(refspecs) or 'default refspecs'}")
+        return await self._remote(remote).call(
+            lambda: self._run_command(
+                ["fetch", remote, *refspecs], timeout=self.config.network_timeout, network=True
+            )
+        )
+
+    async def has_commit(self, sha: str) -> bool:
+        """Check whether a commit exists in the local object database"""
+        try:
+            await self._run_command(["cat-file", "-e", f"{sha}^{{commit}}"])
+        except GitError:
+            return False
+        return True
+
+    async def rev_parse(self, rev: str) -> str:
+        """Resolve a revision to a full commit SHA"""
+        if FULL_SHA.match(rev):
+            return rev
+        return await self._run_command(["rev-parse", "--verify", f"{rev}^{{commit}}"])
+
+    async def merge_base(self, base: str, head: str) -> str:
+        """Get the best common ancestor of two commits"""
+        key = (await self.rev_parse(base), await self.rev_parse(head))
+        cached = self._merge_base_cache.get(key)
+        if cached is not None:
+            return cached
+        logger.info(f"Computing merge base of {key[0]} and {key[1]}")
+        sha = await self._run_command(["merge-base", *key])
+        self._merge_base_cache.put(key, sha)
+        return sha
+
+    async def diff_files(
+        self, base: str, head: str, find_renames: bool = True
+    ) -> AsyncIterator[str]:
+        """Yield the diff between two commits one file at a time.
+
+        Diffs between two commits never change, so results are cached by
+        the resolved (base, head) SHA pair and repeat calls don't run git.
+        """
+        key = (await self.rev_parse(base), await self.rev_parse(head), find_renames)
+        cached = self._diff_cache.get(key)
+        if cached is not None:
+            logger.info(f"Using cached diff {key[0][:12]}..{key[1][:12]}")
+            for section in cached:
+                yield section
+            return
+
+        args = ["diff", "--no-color", "--no-ext-diff"]
+        args.append("--find-renames" if find_renames else "--no-renames")
+
+        sections: Optional[List[str]] = []
+        cached_chars = 0
+        current: List[str] = []
+        async for line in self._stream_command([*args, key[0], key[1]]):
+            if line.startswith("diff --git ") and current:
+                section = "".join(current)
+                current = []
+                if sections is not None:
+                    sections.append(section)
+                    cached_chars += len(section)
+                    if cached_chars > self.config.diff_cache_max_bytes:
+                        sections = None  # Too big to cache, keep streaming
+                yield section
+            current.append(line + "\n")
+        if current:
+            section = "".join(current)
+            if sections is not None:
+                sections.append(section)
+            yield section
+        if sections is not None:
+            self._diff_cache.put(key, sections)
+
+    async def diff(self, base: str, head: str, find_renames: bool = True) -> str:
+        """Get the full diff between two commits"""
+        return "".join([s async for s in self.diff_files(base, head, find_renames)])
+
+    async def merge_base_diff(self, base: str, head: str) -> str:
+        """Get the diff a pull request introduces: merge base of base and head to head"""
+        return await self.diff(await self.merge_base(base, head), head)
+
+
+class WorktreePool:
+    """Fixed set of linked worktrees for working on several branches at once.
+
+    Every worktree shares the main repository's objects and refs, so branches
+    committed in a worktree can be pushed from any of them. Worktrees are
+    created on first use and reused afterwards.
+    """
+
+    def __init__(self, git: Git, size: int = 4, root: Optional[Path] = None):
+        self.git = git
+        self.size = size
+        self.root = root or git.repo_path / ".git" / "basic-factory-worktrees"
+        self._idle: asyncio.Queue[Git] = asyncio.Queue()
+        self._created = 0
+        self._lock = asyncio.Lock()
+
+    async def _create(self) -> Git:
+        path = self.root / f"wt-{self._created}"
+        self._created += 1
+        if not (path / ".git").exists():
+            self.root.mkdir(parents=True, exist_ok=True)
+            await self.git._run_command(["worktree", "prune"])
+            await self.git._run_command(["worktree", "add", "--detach", str(path)])
+        return Git(replace(self.git.config, repo_path=path))
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[Git]:
+        """Borrow a worktree, creating one if the pool isn't full yet"""
+        async with self._lock:
+            if self._idle.empty() and self._created < self.size:
+                worktree = await self._create()
+            else:
+                worktree = None
+        if worktree is None:
+            worktree = await self._idle.get()
+        try:
+            yield worktree
+        finally:
+            # Detach so the branch can be checked out elsewhere
+            await worktree._run_command(["checkout", "--detach", "-f"], check=False)
+            self._idle.put_nowait(worktree)
@@ -1,7 +1,24 @@
 """GitHub API operations for basic-factory."""
-from dataclasses import dataclass
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Set, Tuple, TypeVar
+
+import httpx
 from github import Github
+from github.PullRequest import PullRequest
 from github.Repository import Repository
+from loguru import logger
+
+from basic_factory.metrics import metrics
+from basic_factory.review import ReviewComment
+
+if TYPE_CHECKING:
+    from basic_factory.handlers import Review
+
+GITHUB_API_URL = "https://api.github.com"
+
+T = TypeVar("T")
 
 
 @dataclass
@@ -37,6 +54,266 @@ class GitHubOps:
         return pr.html_url
 
 
+class GitHub:
+    """Async GitHub access for webhook handlers.
+
+    PyGithub is synchronous, so its calls run in a worker thread to keep the
+    event loop free. Content-creating writes are spaced at least
+    `min_write_interval` seconds apart, as GitHub asks, to stay clear of
+    secondary rate limits.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        base_url: str = GITHUB_API_URL,
+        min_write_interval: float = 1.0,
+    ):
+        self.token = token
+        self.base_url = base_url
+        self.github = Github(token, base_url=base_url)
+        self.min_write_interval = min_write_interval
+        self._write_lock = asyncio.Lock()
+        self._last_write = 0.0
+
+    def _client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"Authorization": f"Bearer {self.token}"},
+        )
+
+    async def _write(self, func: Callable[[], T]) -> T:
+        """Run a write call, pacing it after the previous write."""
+        async with self._write_lock:
+            wait = self._last_write + self.min_write_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                return await asyncio.to_thread(func)
+            finally:
+                self._last_write = time.monotonic()
+                metrics.increment("github.writes")
+
+    async def get_pr(self, repo: str, pr_number: int) -> PullRequest:
+        """Get a pull request."""
+        metrics.increment("github.reads")
+        return await asyncio.to_thread(
+            lambda: self.github.get_repo(repo).get_pull(pr_number)
+        )
+
+    async def get_pr_diff(self, repo: str, pr_number: int) -> str:
+        """Get the unified diff of a pull request."""
+        metrics.increment("github.reads")
+        async with self._client() as client:
+            response = await client.get(
+                f"/repos/{repo}/pulls/{pr_number}",
+                headers={"Accept": "application/vnd.github.diff"},
+            )
+            response.raise_for_status()
+            return response.text
+
+    async def graphql(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """Run a GraphQL query and return its data."""
+        metrics.increment("github.reads")
+        # GitHub Enterprise serves REST under /api/v3 and GraphQL at /api/graphql
+        url = self.base_url.removesuffix("/").removesuffix("/v3") + "/graphql"
+        async with self._client() as client:
+            response = await client.post(url, json={"query": query, "variables": variables})
+            response.raise_for_status()
+            payload = response.json()
+        if payload.get("errors"):
+            raise RuntimeError(f"GraphQL query failed: {payload['errors']}")
+        return payload["data"]
+
+    async def get_pr_state(self, repo: str, pr_number: int) -> "PullRequestState":
+        """Get a PR's existing review comments, labels and statuses in one query."""
+        owner, name = repo.split("/", 1)
+        data = await self.graphql(
+            PR_STATE_QUERY, {"owner": owner, "name": name, "number": pr_number}
+        )
+        pr = data["repository"]["pullRequest"]
+        comments = {
+            (thread["path"], thread["line"], comment["body"].strip())
+            for thread in pr["reviewThreads"]["nodes"]
+            for comment in thread["comments"]["nodes"]
+        }
+        labels = {label["name"] for label in pr["labels"]["nodes"]}
+        statuses = {}
+        for commit in pr["commits"]["nodes"]:
+            status = commit["commit"]["status"] or {"contexts": []}
+            for context in status["contexts"]:
+                statuses[context["context"]] = (
+                    context["state"].lower(), context["description"] or ""
+                )
+        return PullRequestState(
+            head_sha=pr["headRefOid"], comments=comments, labels=labels, statuses=statuses
+        )
+
+    async def create_review(
+        self,
+        repo: str,
+        pr_number: int,
+        body: str,
+        approve: bool,
+        comments: List[ReviewComment],
+    ) -> None:
+        """Submit a review with all its inline comments in a single API call."""
+        payload = [
+            {"path": c.path, "position": c.position, "body": c.body}
+            for c in comments
+            if c.position is not None
+        ]
+        event = "APPROVE" if approve else "COMMENT"
+
+        def submit():
+            pr = self.github.get_repo(repo).get_pull(pr_number)
+            pr.create_review(body=body, event=event, comments=payload)
+
+        await self._write(submit)
+
+    async def submit_review(self, repo: str, pr_number: int, review: "Review") -> None:
+        """Submit a handlers.Review."""
+        await self.create_review(
+            repo, pr_number, review.body, review.approve, review.comments
+        )
+
+    async def add_labels(self, repo: str, pr_number: int, labels: List[str]) -> None:
+        """Add several labels to a PR in one call."""
+        await self._write(
+            lambda: self.github.get_repo(repo).get_issue(pr_number).add_to_labels(*labels)
+        )
+
+    async def create_status(
+        self, repo: str, sha: str, context: str, state: str, description: str,
+        target_url: str | None = None,
+    ) -> None:
+        """Set a commit status."""
+        kwargs = {"state": state, "description": description, "context": context}
+        if target_url:
+            kwargs["target_url"] = target_url
+        await self._write(
+            lambda: self.github.get_repo(repo).get_commit(sha).create_status(**kwargs)
+        )
+
+
+PR_STATE_QUERY = """
+query($owner: String!, $name: String!, $number: Int!) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      headRefOid
+      labels(first: 100) { nodes { name } }
+      reviewThreads(first: 100) {
+        nodes {
+          path
+          line
+          comments(first: 100) { nodes { body } }
+        }
+      }
+      commits(last: 1) {
+        nodes { commit { status { contexts { context state description } } } }
+      }
+    }
+  }
+}
+"""
+
+
+@dataclass
+class PullRequestState:
+    """What is already on a PR, used to skip redundant writes."""
+    head_sha: str
+    comments: Set[Tuple[str, int | None, str]] = field(default_factory=set)
+    labels: Set[str] = field(default_factory=set)
+    statuses: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+
+
+@dataclass
+class StatusUpdate:
+    """Pending commit status."""
+    state: str
+    description: str
+    target_url: str | None = None
+
+
+class GitHubWriteBuffer:
+    """Collect the writes of one review run and flush them together.
+
+    Inline comments become a single review submission, labels a single call,
+    and statuses one call per context with only the last state kept. Anything
+    already on the PR, fetched with one GraphQL query, is skipped. Savings are
+    recorded in the metrics registry.
+    """
+
+    def __init__(self, gh: GitHub, repo: str, pr_number: int):
+        self.gh = gh
+        self.repo = repo
+        self.pr_number = pr_number
+        self.comments: List[ReviewComment] = []
+        self.labels: List[str] = []
+        self.statuses: Dict[str, StatusUpdate] = {}
+        self._requested_writes = 0
+
+    def add_comment(self, comment: ReviewComment) -> None:
+        self._requested_writes += 1
+        self.comments.append(comment)
+
+    def add_label(self, label: str) -> None:
+        self._requested_writes += 1
+        if label not in self.labels:
+            self.labels.append(label)
+
+    def set_status(
+        self, context: str, state: str, description: str, target_url: str | None = None
+    ) -> None:
+        self._requested_writes += 1
+        self.statuses[context] = StatusUpdate(state, description, target_url)
+
+    async def flush(self, body: str, approve: bool = False) -> int:
+        """Write everything buffered plus the review body; return the API calls made."""
+        state = await self.gh.get_pr_state(self.repo, self.pr_number)
+
+        seen = set(state.comments)
+        comments = []
+        for comment in self.comments:
+            key = (comment.path, comment.line, comment.body.strip())
+            if key in seen:
+                metrics.increment("github.comments_deduplicated")
+                continue
+            seen.add(key)
+            comments.append(comment)
+
+        labels = [label for label in self.labels if label not in state.labels]
+        statuses = {
+            context: update for context, update in self.statuses.items()
+            if state.statuses.get(context) != (update.state, update.description)
+        }
+
+        calls = 0
+        await self.gh.create_review(self.repo, self.pr_number, body, approve, comments)
+        calls += 1
+        if labels:
+            await self.gh.add_labels(self.repo, self.pr_number, labels)
+            calls += 1
+        for context, update in statuses.items():
+            await self.gh.create_status(
+                self.repo, state.head_sha, context,
+                update.state, update.description, update.target_url,
+            )
+            calls += 1
+
+        # One review call would have been made regardless of buffering
+        saved = self._requested_writes + 1 - calls
+        metrics.increment("github.write_calls", calls)
+        metrics.increment("github.write_calls_saved", saved)
+        logger.info(
+            f"Flushed review for {self.repo}#{self.pr_number}: {calls} write calls, "
+            f"{saved} saved, {len(self.comments) - len(comments)} duplicate comments skipped"
+        )
+        self.comments, self.labels, self.statuses = [], [], {}
+        self._requested_writes = 0
+        return calls
+
+
 def create_hello_world_pr(github: GitHubOps) -> str:
     """Create pull request for hello world example."""
     title = "Add hello world function"
@@ -1,15 +1,17 @@
 """Handlers for GitHub webhook events."""
+import asyncio
 from typing import List
 from dataclasses import dataclass
-from basic_factory.claude import Claude
-from basic_factory.github import GitHub
+from loguru import logger
 
-@dataclass
-class ReviewComment:
-    """Code review comment with location info."""
-    path: str
-    line: int
-    body: str
+from basic_factory.claude import Claude
+from basic_factory.context import ContextSection
+from basic_factory.diff import Diff, parse_diff
+from basic_factory.git import Git
+from basic_factory.github import GitHub, GitHubWriteBuffer
+from basic_factory.offload import Offloader
+from basic_factory.review import ReviewComment
+from basic_factory.search import SearchIndex, related_snippets
 
 @dataclass
 class Review:
@@ -18,42 +20,86 @@ class Review:
     comments: List[ReviewComment]
     approve: bool
 
-async def handle_pr_opened(gh: GitHub, claude: Claude, repo: str, pr_number: int) -> None:
-    """Handle PR opened event by triggering Claude review."""
+def anchor_comments(diff: Diff, comments: List[ReviewComment]) -> List[ReviewComment]:
+    """Fill in GitHub diff positions, dropping comments on lines outside the diff."""
+    anchored = []
+    for comment in comments:
+        found = diff.position(comment.path, comment.line)
+        if found is None:
+            logger.warning(f"No diff position for {comment.path}:{comment.line}, skipping")
+            continue
+        comment.position = found.position
+        anchored.append(comment)
+    return anchored
+
+async def get_local_pr_diff(git: Git, pr, remote: str = "origin") -> str:
+    """Compute a PR's diff from the local clone, fetching its commits if missing."""
+    base_sha, head_sha = pr.base.sha, pr.head.sha
+    missing = [sha for sha in (base_sha, head_sha) if not await git.has_commit(sha)]
+    if missing:
+        await git.fetch(remote, pr.base.ref, f"+refs/pull/{pr.number}/head")
+    return await git.merge_base_diff(base_sha, head_sha)
+
+async def handle_pr_opened(
+    gh: GitHub,
+    claude: Claude,
+    repo: str,
+    pr_number: int,
+    git: Git | None = None,
+    index: SearchIndex | None = None,
+    offload: Offloader | None = None,
+) -> None:
+    """Handle PR opened event by triggering Claude review.
+
+    When a local clone is given the diff is computed from it instead of being
+    downloaded from GitHub, which truncates and rate-limits large diffs. With
+    a search index over that clone, code related to the diff is added to the
+    review prompt. An offloader moves parsing of large diffs to a worker
+    process.
+    """
     # Get PR details
     pr = await gh.get_pr(repo, pr_number)
-    diff = await gh.get_pr_diff(repo, pr_number)
+    if git is not None:
+        diff = await get_local_pr_diff(git, pr)
+    else:
+        diff = await gh.get_pr_diff(repo, pr_number)
+
+    related = []
+    if index is not None and git is not None:
+        def find_related() -> List[ContextSection]:
+            # The index is shared; keep it at the head commit while searching
+            with index.pinned(pr.head.sha):
+                return related_snippets(index, diff)
+
+        related = await asyncio.to_thread(find_related)
+
+    # Anchor comments as they stream in and buffer them for a single submission
+    if offload is not None:
+        parsed = await offload.cpu(parse_diff, diff, size=len(diff))
+    else:
+        parsed = parse_diff(diff)
+    buffer = GitHubWriteBuffer(gh, repo, pr_number)
+
+    async def on_comment(comment: ReviewComment) -> None:
+        for anchored in anchor_comments(parsed, [comment]):
+            buffer.add_comment(anchored)
 
     # Get Claude's review
     review = await claude.review_changes(
         diff=diff,
-        description=pr.title + "\n\n" + (pr.body or "")
+        description=pr.title + "\n\n" + (pr.body or ""),
+        on_comment=on_comment,
+        related=related,
     )
 
-    # Format review for GitHub
-    comments = []
-    if "hello.py" in diff:
-        # Example: Add specific comments for hello world
-        comments.append(
-            ReviewComment(
-                path="src/basic_factory/hello.py",
-                line=1,
-                body="Consider adding more details to the module docstring about usage."
-            )
-        )
-
-    formatted_review = Review(
-        body=f"""### Code Review Summary
+    body = f"""### Code Review Summary
 {review.summary}
 
 ### Suggestions
 {"".join(f"- {s}\n" for s in review.suggestions)}
 
 ---
-_This review was generated by Claude via basic-factory_""",
-        comments=comments,
-        approve=review.approval
-    )
+_This review was generated by Claude via basic-factory_"""
 
-    # Submit review to GitHub
-    await gh.submit_review(repo, pr_number, formatted_review)
\ No newline at end of file
+    # Submit the review and all its comments to GitHub
+    await buffer.flush(body, approve=review.approval)
@@ -0,0 +1,228 @@
+"""Idempotency keys for mutating tool calls.
+
+A client that retries a call with the same `Idempotency-Key` header gets the
+original response back instead of running the operation again. Concurrent
+duplicates wait for the first execution and share its result. Successful
+responses are kept in a local sqlite database, so replays survive restarts;
+failures are not stored, so a retry after an error runs again.
+"""
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, Union
+
+from loguru import logger
+
+from basic_factory.metrics import metrics
+
+
+class IdempotencyConflict(Exception):
+    """A key was reused for a different request."""
+
+
+def fingerprint(body: Union[str, bytes]) -> str:
+    """Hash of a canonical request body, to detect keys reused for other requests."""
+    if isinstance(body, str):
+        body = body.encode()
+    return hashlib.sha256(body).hexdigest()
+
+
+class IdempotencyStore:
+    """Stored responses keyed by (scope, key), in sqlite."""
+
+    def __init__(self, path: Union[str, Path, None] = None, ttl: float = 24 * 3600):
+        """
+        Args:
+            path: Database file; None keeps responses in memory only
+            ttl: Seconds a response is kept for replay
+        """
+        self.ttl = ttl
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path or ":memory:"), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    scope TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (scope, key)
+                )"""
+            )
+
+    def get(self, scope: str, key: str) -> Optional[Tuple[str, str]]:
+        """Return (fingerprint, body) of a stored, unexpired response."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT fingerprint, body FROM responses WHERE scope = ? AND key = ? AND created >= ?",
+                (scope, key, time.time() - self.ttl),
+            ).fetchone()
+        return row
+
+    def put(self, scope: str, key: str, request_fingerprint: str, body: str) -> None:
+        """Store a response and drop expired ones."""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (scope, key, request_fingerprint, body, now),
+            )
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def _fail(future: asyncio.Future, error: BaseException) -> None:
+    """Pass a failed execution on to any duplicates waiting for it."""
+    if future.done():
+        return
+    if not isinstance(error, Exception):
+        # Cancellation of the first caller must not cancel the waiters
+        error = RuntimeError("The original request was interrupted")
+    future.set_exception(error)
+    future.exception()  # Mark as retrieved in case nobody is waiting
+
+
+class IdempotencyKeys:
+    """Replay stored responses and coalesce concurrent duplicates.
+
+    Responses are handled as text (serialized JSON or NDJSON) so any
+    endpoint's output can be stored and replayed byte for byte.
+    """
+
+    def __init__(self, store: IdempotencyStore):
+        self.store = store
+        self._inflight: Dict[Tuple[str, str], Tuple[str, asyncio.Future]] = {}
+
+    def _coalesce(self, scope: str, key: str, request_fingerprint: str) -> Optional[asyncio.Future]:
+        inflight = self._inflight.get((scope, key))
+        if inflight is None:
+            return None
+        if inflight[0] != request_fingerprint:
+            raise IdempotencyConflict(f"Idempotency-Key {key} is in use for a different request")
+        metrics.increment("idempotency.coalesced")
+        return inflight[1]
+
+    async def _lookup(
+        self, scope: str, key: str, request_fingerprint: str
+    ) -> Tuple[Optional[str], Optional[asyncio.Future]]:
+        """Return a stored body, or an in-flight execution to wait for.
+
+        When both are None the caller owns the key and must register itself
+        in `_inflight` before awaiting anything.
+        """
+        pending = self._coalesce(scope, key, request_fingerprint)
+        if pending is not None:
+            return None, pending
+
+        stored = await asyncio.to_thread(self.store.get, scope, key)
+        if stored is not None:
+            if stored[0] != request_fingerprint:
+                raise IdempotencyConflict(f"Idempotency-Key {key} was used for a different request")
+            metrics.increment("idempotency.replayed")
+            return stored[1], None
+
+        # A duplicate may have started while the store was being read
+        return None, self._coalesce(scope, key, request_fingerprint)
+
+    async def run(
+        self,
+        scope: str,
+        key: str,
+        request_fingerprint: str,
+        execute: Callable[[], Awaitable[Tuple[str, bool]]],
+    ) -> Tuple[str, bool]:
+        """Run `execute` once per key and return (body, replayed).
+
+        `execute` returns the response body and whether it succeeded; only
+        successful responses are stored.
+        """
+        body, pending = await self._lookup(scope, key, request_fingerprint)
+        if body is not None:
+            return body, True
+        if pending is not None:
+            return await asyncio.shield(pending), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[(scope, key)] = (request_fingerprint, future)
+        try:
+            body, success = await execute()
+            if success:
+                await asyncio.to_thread(self.store.put, scope, key, request_fingerprint, body)
+            future.set_result(body)
+            return body, False
+        except BaseException as e:
+            _fail(future, e)
+            raise
+        finally:
+            del self._inflight[(scope, key)]
+
+    async def stream(
+        self,
+        scope: str,
+        key: str,
+        request_fingerprint: str,
+        execute: Callable[[], AsyncIterator[Tuple[str, bool]]],
+    ) -> Tuple[AsyncIterator[str], bool]:
+        """Like `run` for streamed responses made of (chunk, success) pairs.
+
+        Conflicts are raised here, before anything is streamed. The first
+        caller receives chunks as they are produced; replays and concurrent
+        duplicates receive the complete body at once. The response is stored
+        only if every chunk succeeded.
+        """
+        body, pending = await self._lookup(scope, key, request_fingerprint)
+        if body is not None:
+            return _chunks(body), True
+        if pending is not None:
+            return _chunks(pending), True
+        return self._stream_once(scope, key, request_fingerprint, execute), False
+
+    async def _stream_once(
+        self,
+        scope: str,
+        key: str,
+        request_fingerprint: str,
+        execute: Callable[[], AsyncIterator[Tuple[str, bool]]],
+    ) -> AsyncIterator[str]:
+        # Registered on first iteration so an unstarted stream can't leave a stale entry
+        pending = self._coalesce(scope, key, request_fingerprint)
+        if pending is not None:
+            yield await asyncio.shield(pending)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[(scope, key)] = (request_fingerprint, future)
+        chunks = []
+        success = True
+        try:
+            async for chunk, ok in execute():
+                chunks.append(chunk)
+                success = success and ok
+                yield chunk
+            body = "".join(chunks)
+            if success:
+                await asyncio.to_thread(self.store.put, scope, key, request_fingerprint, body)
+            future.set_result(body)
+        except BaseException as e:
+            _fail(future, e)
+            logger.warning(f"Idempotent stream {scope}/{key} did not complete: {e!r}")
+            raise
+        finally:
+            self._inflight.pop((scope, key), None)
+
+
+async def _chunks(body: Union[str, asyncio.Future]) -> AsyncIterator[str]:
+    """Yield a stored body, or the body of an in-flight execution once it finishes."""
+    if isinstance(body, asyncio.Future):
+        body = await asyncio.shield(body)
+    yield body
@@ -0,0 +1,69 @@
+"""In-process metrics registry.
+
+Counters and histograms are kept in memory and exposed as a JSON snapshot by
+the API's /metrics endpoint.
+"""
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict
+
+# Recent observations kept per histogram for percentile estimates
+HISTOGRAM_WINDOW = 2048
+
+
+@dataclass
+class Histogram:
+    """Running count/sum/max plus a window of recent values for percentiles."""
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    recent: Deque[float] = field(default_factory=lambda: deque(maxlen=HISTOGRAM_WINDOW))
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.recent.append(value)
+
+    def percentile(self, pct: float) -> float:
+        """Percentile over the recent window (0 when empty)."""
+        if not self.recent:
+            return 0.0
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """Named counters and histograms."""
+
+    def __init__(self):
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.histograms: Dict[str, Histogram] = defaultdict(Histogram)
+
+    def increment(self, name: str, value: float = 1) -> None:
+        self.counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        self.histograms[name].observe(value)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {
+            "counters": dict(self.counters),
+            "histograms": {name: h.snapshot() for name, h in self.histograms.items()},
+        }
+
+    def reset(self) -> None:
+        self.counters.clear()
+        self.histograms.clear()
+
+
+metrics = Metrics()
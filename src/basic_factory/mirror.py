@@ -0,0 +1,207 @@
+"""Shared bare-mirror cache for provisioning working copies.
+
+Each remote URL gets one `git clone --mirror` under the cache root. Working
+copies are cloned from the mirror with `--shared`, so they borrow its objects
+through `objects/info/alternates`. Provisioning needs no network access and
+copies no objects: it costs a checkout. Mirrors are refreshed
+incrementally with `git remote update --prune` when they are older than the
+refresh interval. They are repacked in the background once loose objects or
+packs pile up.
+
+Borrowers depend on every object they were cloned with, so mirrors never
+prune. `gc.auto` is off and repacks keep unreachable objects, which makes
+force-pushes upstream safe for existing working copies.
+"""
+import asyncio
+import hashlib
+import re
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from loguru import logger
+
+from basic_factory.git import Git, GitConfig, GitError
+from basic_factory.metrics import metrics
+from basic_factory.resilience import dependency
+
+FETCH_STAMP = "basic-factory-fetched"  # Touched after each successful refresh
+
+
+@dataclass
+class MirrorConfig:
+    root: Path  # Directory holding one bare mirror per remote URL
+    git_path: str = "git"
+    # Seconds a mirror is considered fresh; provisioning within it skips the fetch
+    refresh_interval: float = 60.0
+    network_timeout: Optional[float] = 300.0
+    # Repack once a mirror has more packs or loose objects than this
+    max_packs: int = 16
+    max_loose_objects: int = 2048
+
+
+@dataclass
+class MirrorStats:
+    """Object counts from `git count-objects -v`"""
+    loose_objects: int
+    packs: int
+    size_kib: int  # Loose plus packed size on disk
+
+
+def mirror_name(url: str) -> str:
+    """Directory name for a remote URL: readable, and unique per URL."""
+    readable = re.sub(r"[^A-Za-z0-9._-]+", "-", url.rstrip("/").removesuffix(".git"))[-48:].strip("-.")
+    return f"{readable}-{hashlib.sha1(url.encode()).hexdigest()[:10]}.git"
+
+
+class MirrorCache:
+    """Bare mirrors of remote repositories that working copies borrow from."""
+
+    def __init__(self, config: MirrorConfig):
+        self.config = config
+        self.root = Path(config.root)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._maintenance: Dict[Path, asyncio.Task] = {}
+
+    def path(self, url: str) -> Path:
+        return self.root / mirror_name(url)
+
+    def _git(self, path: Path) -> Git:
+        return Git(GitConfig(path, git_path=self.config.git_path, network_timeout=self.config.network_timeout))
+
+    async def update(self, url: str, force: bool = False) -> Path:
+        """Create or refresh the mirror of `url` and return its path.
+
+        Concurrent callers for the same URL share one fetch. If the remote is
+        unreachable but a mirror exists, the stale mirror is returned.
+        """
+        path = self.path(url)
+        lock = self._locks.setdefault(url, asyncio.Lock())
+        async with lock:
+            if not (path / "HEAD").exists():
+                await self._clone(url, path)
+            elif force or self._age(path) >= self.config.refresh_interval:
+                await self._refresh(url, path)
+            else:
+                metrics.increment("mirror.fresh")
+        await self._schedule_maintenance(path)
+        return path
+
+    def _age(self, path: Path) -> float:
+        stamp = path / FETCH_STAMP
+        return time.time() - stamp.stat().st_mtime if stamp.exists() else float("inf")
+
+    async def _clone(self, url: str, path: Path) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Clone beside the final path and rename, so other processes never see a partial mirror
+        partial = path.with_name(f"{path.name}.partial-{time.time_ns()}")
+        start = time.monotonic()
+        logger.info(f"Creating mirror of {url} in {path}")
+        try:
+            await dependency(f"git:{url}", "git").call(
+                lambda: self._git(self.root)._run_command(
+                    ["clone", "--mirror", url, str(partial)],
+                    timeout=self.config.network_timeout,
+                    network=True,
+                )
+            )
+            mirror = self._git(partial)
+            for key, value in (("gc.auto", "0"), ("gc.pruneExpire", "never"), ("repack.writeBitmaps", "true")):
+                await mirror._run_command(["config", key, value])
+            (partial / FETCH_STAMP).touch()
+            try:
+                partial.rename(path)
+            except OSError:
+                logger.info(f"Mirror of {url} was created concurrently; using it")
+        finally:
+            shutil.rmtree(partial, ignore_errors=True)
+        metrics.observe("mirror.clone_ms", (time.monotonic() - start) * 1000)
+
+    async def _refresh(self, url: str, path: Path) -> None:
+        start = time.monotonic()
+        try:
+            await dependency(f"git:{url}", "git").call(
+                lambda: self._git(path)._run_command(
+                    ["remote", "update", "--prune"], timeout=self.config.network_timeout, network=True
+                )
+            )
+        except Exception as e:
+            metrics.increment("mirror.stale")
+            logger.warning(f"Could not refresh mirror of {url}, using it as is: {e}")
+            return
+        (path / FETCH_STAMP).touch()
+        metrics.observe("mirror.refresh_ms", (time.monotonic() - start) * 1000)
+
+    async def stats(self, path: Path) -> MirrorStats:
+        output = await self._git(path)._run_command(["count-objects", "-v"])
+        counts = dict(line.split(": ", 1) for line in output.splitlines() if ": " in line)
+        return MirrorStats(
+            loose_objects=int(counts.get("count", 0)),
+            packs=int(counts.get("packs", 0)),
+            size_kib=int(counts.get("size", 0)) + int(counts.get("size-pack", 0)),
+        )
+
+    async def _schedule_maintenance(self, path: Path) -> None:
+        """Start a background repack if the mirror needs one and none is running"""
+        running = self._maintenance.get(path)
+        if running is not None and not running.done():
+            return
+        stats = await self.stats(path)
+        if stats.packs > self.config.max_packs or stats.loose_objects > self.config.max_loose_objects:
+            self._maintenance[path] = asyncio.create_task(self.repack(path))
+
+    async def repack(self, path: Path) -> None:
+        """Repack a mirror into one pack, keeping unreachable objects for borrowers."""
+        start = time.monotonic()
+        git = self._git(path)
+        try:
+            await git._run_command(["repack", "-a", "-d", "--keep-unreachable", "-q"])
+            await git._run_command(["prune-packed"])
+            await git._run_command(["pack-refs", "--all"])
+            await git._run_command(["commit-graph", "write", "--reachable"])
+        except GitError as e:
+            logger.warning(f"Repacking {path} failed: {e}")
+            return
+        metrics.increment("mirror.repacks")
+        metrics.observe("mirror.repack_ms", (time.monotonic() - start) * 1000)
+
+    async def provision(
+        self,
+        url: str,
+        dest: Union[str, Path],
+        branch: Optional[str] = None,
+        refresh: bool = True,
+    ) -> Git:
+        """Create a working copy of `url` at `dest` that borrows the mirror's objects.
+
+        Args:
+            url: Remote URL; the working copy's origin points at it
+            dest: Path for the new working copy; must not exist
+            branch: Branch to check out; defaults to the remote's HEAD
+            refresh: Refresh the mirror first if it is stale
+        """
+        dest = Path(dest)
+        start = time.monotonic()
+        path = self.path(url)
+        if refresh or not (path / "HEAD").exists():
+            await self.update(url)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        git = self._git(dest.parent)
+        args = ["clone", "--shared", "--quiet"]
+        if branch:
+            args += ["--branch", branch]
+        await git._run_command([*args, str(path), str(dest)])
+        working = self._git(dest)
+        await working._run_command(["remote", "set-url", "origin", url])
+        metrics.observe("mirror.provision_ms", (time.monotonic() - start) * 1000)
+        logger.info(f"Provisioned {dest} from mirror of {url}")
+        return working
+
+    async def close(self) -> None:
+        """Wait for background repacks to finish."""
+        running = [task for task in self._maintenance.values() if not task.done()]
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+        self._maintenance.clear()
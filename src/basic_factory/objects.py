@@ -0,0 +1,332 @@
+"""In-process, read-only access to repository objects.
+
+Files, trees, history and blame are read through pygit2 instead of spawning
+git. Trees and blobs are immutable, so their decoded contents are cached by
+object ID and never invalidated; only resolving a ref goes back to the
+repository each time.
+"""
+import re
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Union
+
+import pygit2
+
+from basic_factory.cache import LRUCache
+
+class ObjectNotFoundError(LookupError):
+    """A ref or path does not exist in the repository"""
+
+
+# (name, oid, kind, filemode) for each entry of a tree
+_TreeItems = Tuple[Tuple[str, str, str, int], ...]
+
+
+@dataclass
+class TreeEntry:
+    """An entry of a tree listing."""
+    path: str
+    kind: str  # "blob", "tree" or "commit" (a submodule)
+    oid: str
+    mode: int
+
+
+@dataclass
+class FileSlice:
+    """Lines of a file at a commit."""
+    path: str
+    commit: str
+    oid: str
+    start_line: int
+    end_line: int
+    total_lines: int
+    content: str
+    is_binary: bool = False
+
+
+@dataclass
+class CommitInfo:
+    """Summary of a commit for log listings."""
+    sha: str
+    author: str
+    email: str
+    date: str  # ISO 8601
+    subject: str
+    body: str = ""
+
+
+@dataclass
+class GrepMatch:
+    """A line matching a grep pattern."""
+    path: str
+    line: int
+    text: str
+
+
+@dataclass
+class BlameHunk:
+    """A run of lines last changed by the same commit."""
+    start_line: int
+    end_line: int
+    commit: str
+    author: str
+    orig_path: Optional[str] = None
+
+
+LINE = re.compile(r"[^\n]*\n|[^\n]+")  # A line with its newline, or an unterminated last line
+
+
+class _Blob:
+    """Blob contents, with lines split on first use."""
+    __slots__ = ("data", "is_binary", "_lines")
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.is_binary = b"\0" in data[:8000]
+        self._lines: Optional[List[str]] = None
+
+    @property
+    def lines(self) -> List[str]:
+        if self._lines is None:
+            # Split on "\n" only, as git does; str.splitlines also breaks on
+            # form feeds and Unicode separators and would skew line numbers
+            self._lines = LINE.findall(self.data.decode("utf-8", "replace"))
+        return self._lines
+
+
+class ObjectStore:
+    """Read files, trees, log and blame from a repository with an object cache.
+
+    Each thread opens its own pygit2 Repository, so methods can be called
+    from `asyncio.to_thread`. The caches hold plain Python values and are
+    shared between threads.
+    """
+
+    def __init__(
+        self,
+        repo_path: Union[str, Path],
+        cache_size: int = 4096,
+        max_cached_blob_bytes: int = 1024 * 1024,
+    ):
+        """
+        Args:
+            repo_path: Repository (or worktree) to read from
+            cache_size: Number of trees and blobs kept in memory
+            max_cached_blob_bytes: Larger blobs are read but not cached
+        """
+        self.repo_path = Path(repo_path)
+        self.max_cached_blob_bytes = max_cached_blob_bytes
+        self._trees: LRUCache[str, _TreeItems] = LRUCache(cache_size)
+        self._blobs: LRUCache[str, _Blob] = LRUCache(cache_size)
+        self._blame: LRUCache[Tuple[str, str, int, int], List[BlameHunk]] = LRUCache(256)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def repo(self) -> pygit2.Repository:
+        """The calling thread's repository handle."""
+        repo = getattr(self._local, "repo", None)
+        if repo is None:
+            repo = self._local.repo = pygit2.Repository(str(self.repo_path))
+        return repo
+
+    def _cached(self, cache: LRUCache, key):
+        with self._lock:
+            return cache.get(key)
+
+    def _store(self, cache: LRUCache, key, value) -> None:
+        with self._lock:
+            cache.put(key, value)
+
+    def resolve(self, ref: str) -> pygit2.Commit:
+        """Resolve a branch, tag or revision expression to a commit."""
+        try:
+            return self.repo.revparse_single(ref).peel(pygit2.Commit)
+        except (KeyError, ValueError, pygit2.GitError) as e:
+            raise ObjectNotFoundError(f"Unknown revision: {ref}") from e
+
+    def _tree(self, oid: str) -> _TreeItems:
+        items = self._cached(self._trees, oid)
+        if items is None:
+            tree = self.repo[oid]
+            items = tuple((e.name, str(e.id), e.type_str, int(e.filemode)) for e in tree)
+            self._store(self._trees, oid, items)
+        return items
+
+    def _blob(self, oid: str) -> _Blob:
+        blob = self._cached(self._blobs, oid)
+        if blob is None:
+            blob = _Blob(self.repo[oid].data)
+            if len(blob.data) <= self.max_cached_blob_bytes:
+                self._store(self._blobs, oid, blob)
+        return blob
+
+    def _lookup(self, tree_oid: str, path: str) -> Optional[Tuple[str, str, int]]:
+        """Find (kind, oid, mode) of a path below a tree, or None if absent."""
+        kind, oid, mode = "tree", tree_oid, int(pygit2.GIT_FILEMODE_TREE)
+        for part in [p for p in path.strip("/").split("/") if p]:
+            if kind != "tree":
+                return None
+            entry = next((e for e in self._tree(oid) if e[0] == part), None)
+            if entry is None:
+                return None
+            _, oid, kind, mode = entry
+        return kind, oid, mode
+
+    def _walk(self, tree_oid: str, prefix: str) -> Iterator[Tuple[str, str, str, int]]:
+        """Yield (path, oid, kind, mode) for every entry below a tree."""
+        for name, oid, kind, mode in self._tree(tree_oid):
+            path = f"{prefix}{name}"
+            yield path, oid, kind, mode
+            if kind == "tree":
+                yield from self._walk(oid, f"{path}/")
+
+    def read_file(
+        self,
+        ref: str,
+        path: str,
+        start_line: int = 1,
+        end_line: Optional[int] = None,
+    ) -> FileSlice:
+        """Read a file, or an inclusive 1-based line range of it, at a ref."""
+        commit = self.resolve(ref)
+        found = self._lookup(str(commit.tree_id), path)
+        if found is None or found[0] != "blob":
+            raise ObjectNotFoundError(f"No file {path} at {ref}")
+        oid = found[1]
+        blob = self._blob(oid)
+        sha = str(commit.id)
+        if blob.is_binary:
+            return FileSlice(path, sha, oid, 0, 0, 0, "", is_binary=True)
+
+        lines = blob.lines
+        start = max(start_line, 1)
+        end = min(end_line or len(lines), len(lines))
+        return FileSlice(
+            path=path,
+            commit=sha,
+            oid=oid,
+            start_line=start,
+            end_line=max(end, start - 1),
+            total_lines=len(lines),
+            content="".join(lines[start - 1:end]),
+        )
+
+    def list_tree(self, ref: str, path: str = "", recursive: bool = False) -> List[TreeEntry]:
+        """List the entries of a directory at a ref."""
+        commit = self.resolve(ref)
+        found = self._lookup(str(commit.tree_id), path)
+        if found is None or found[0] != "tree":
+            raise ObjectNotFoundError(f"No directory {path or '/'} at {ref}")
+        prefix = f"{path.strip('/')}/" if path.strip("/") else ""
+        if recursive:
+            items = self._walk(found[1], prefix)
+        else:
+            items = ((f"{prefix}{name}", oid, kind, mode) for name, oid, kind, mode in self._tree(found[1]))
+        return [TreeEntry(path=p, kind=kind, oid=oid, mode=mode) for p, oid, kind, mode in items]
+
+    def log(self, ref: str = "HEAD", path: Optional[str] = None, limit: int = 20) -> List[CommitInfo]:
+        """List commits reachable from a ref, newest first.
+
+        With a path, only commits that changed it relative to their first
+        parent are listed.
+        """
+        commits = []
+        for commit in self.repo.walk(self.resolve(ref).id, pygit2.enums.SortMode.TIME):
+            if len(commits) >= limit:
+                break
+            if path:
+                current = self._lookup(str(commit.tree_id), path)
+                parent = (
+                    self._lookup(str(commit.parents[0].tree_id), path)
+                    if commit.parents else None
+                )
+                if current == parent:
+                    continue
+            subject, _, body = commit.message.partition("\n")
+            commits.append(CommitInfo(
+                sha=str(commit.id),
+                author=commit.author.name,
+                email=commit.author.email,
+                date=datetime.fromtimestamp(commit.commit_time, timezone.utc).isoformat(),
+                subject=subject.strip(),
+                body=body.strip(),
+            ))
+        return commits
+
+    def grep(
+        self,
+        ref: str,
+        pattern: str,
+        path: str = "",
+        regex: bool = False,
+        ignore_case: bool = False,
+        max_results: int = 100,
+    ) -> List[GrepMatch]:
+        """Find lines matching a pattern in text files at a ref."""
+        commit = self.resolve(ref)
+        found = self._lookup(str(commit.tree_id), path)
+        if found is None:
+            raise ObjectNotFoundError(f"No path {path} at {ref}")
+        flags = re.IGNORECASE if ignore_case else 0
+        matcher = re.compile(pattern if regex else re.escape(pattern), flags)
+
+        prefix = path.strip("/")
+        if found[0] == "tree":
+            files = (
+                (p, oid) for p, oid, kind, _ in self._walk(found[1], f"{prefix}/" if prefix else "")
+                if kind == "blob"
+            )
+        elif found[0] == "blob":
+            files = iter([(prefix, found[1])])
+        else:
+            files = iter(())
+
+        matches = []
+        for file_path, oid in files:
+            blob = self._blob(oid)
+            if blob.is_binary or not matcher.search(blob.data.decode("utf-8", "replace")):
+                continue
+            for number, line in enumerate(blob.lines, 1):
+                if matcher.search(line):
+                    matches.append(GrepMatch(file_path, number, line.rstrip("\r\n")))
+                    if len(matches) >= max_results:
+                        return matches
+        return matches
+
+    def blame(
+        self,
+        ref: str,
+        path: str,
+        start_line: int = 1,
+        end_line: Optional[int] = None,
+    ) -> List[BlameHunk]:
+        """Attribute each line of a file (or a line range) to the commit that last changed it."""
+        text = self.read_file(ref, path)
+        if text.is_binary or text.total_lines == 0:
+            return []
+        start = max(start_line, 1)
+        end = min(end_line or text.total_lines, text.total_lines)
+        if start > end:
+            return []
+
+        key = (text.commit, path, start, end)
+        hunks = self._cached(self._blame, key)
+        if hunks is None:
+            blame = self.repo.blame(
+                path, newest_commit=text.commit, min_line=start, max_line=end
+            )
+            hunks = [
+                BlameHunk(
+                    start_line=h.final_start_line_number,
+                    end_line=h.final_start_line_number + h.lines_in_hunk - 1,
+                    commit=str(h.final_commit_id),
+                    author=h.final_committer.name if h.final_committer else "",
+                    orig_path=h.orig_path if h.orig_path != path else None,
+                )
+                for h in blame
+            ]
+            self._store(self._blame, key, hunks)
+        return hunks
@@ -0,0 +1,129 @@
+"""Keep blocking work off the event loop.
+
+CPU-bound functions (diff parsing, validating large request bodies) run in a
+process pool so they neither block the loop nor compete with it for the GIL.
+Blocking I/O such as file writes runs in a thread pool. `LoopLagMonitor`
+measures how late the loop wakes up, which is what a slow request does to
+everyone else's latency.
+"""
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Optional, TypeVar
+
+from loguru import logger
+
+from basic_factory.metrics import metrics
+
+T = TypeVar("T")
+
+
+class Offloader:
+    """Process pool for CPU-bound work and thread pool for blocking I/O.
+
+    Pools are created on first use. Work on inputs smaller than
+    `process_threshold` bytes runs inline, where pickling it to another
+    process would cost more than doing it.
+    """
+
+    def __init__(
+        self,
+        cpu_workers: int = 2,
+        io_workers: int = 8,
+        process_threshold: int = 256 * 1024,
+    ):
+        """
+        Args:
+            cpu_workers: Worker processes; 0 runs CPU work in the I/O threads
+            io_workers: Threads for blocking I/O
+            process_threshold: Input size in bytes from which CPU work is offloaded
+        """
+        self.cpu_workers = cpu_workers
+        self.io_workers = io_workers
+        self.process_threshold = process_threshold
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._threads: Optional[ThreadPoolExecutor] = None
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        if self._processes is None:
+            # Forking a process that runs an event loop and threads is unsafe
+            self._processes = ProcessPoolExecutor(
+                self.cpu_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._processes
+
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(self.io_workers, thread_name_prefix="offload-io")
+        return self._threads
+
+    async def cpu(self, fn: Callable[..., T], *args, size: int = 0) -> T:
+        """Run a picklable CPU-bound function, in a worker process if the input is large."""
+        if size < self.process_threshold:
+            return fn(*args)
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        if self.cpu_workers > 0:
+            result = await loop.run_in_executor(self._process_pool(), partial(fn, *args))
+        else:
+            result = await loop.run_in_executor(self._thread_pool(), partial(fn, *args))
+        metrics.observe("offload.cpu_seconds", time.perf_counter() - start)
+        return result
+
+    async def io(self, fn: Callable[..., T], *args) -> T:
+        """Run a blocking I/O function in the thread pool."""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        result = await loop.run_in_executor(self._thread_pool(), partial(fn, *args))
+        metrics.observe("offload.io_seconds", time.perf_counter() - start)
+        return result
+
+    def shutdown(self) -> None:
+        """Stop the pools, cancelling work that hasn't started."""
+        for pool in (self._processes, self._threads):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._processes = self._threads = None
+
+
+class LoopLagMonitor:
+    """Record how late the event loop runs a timer, in milliseconds.
+
+    Lag is observed into the `event_loop.lag_ms` histogram; a lag spike means
+    something ran on the loop for that long without yielding.
+    """
+
+    def __init__(self, interval: float = 0.1, warn_after: float = 0.25):
+        """
+        Args:
+            interval: Seconds between probes
+            warn_after: Lag in seconds from which each probe is logged
+        """
+        self.interval = interval
+        self.warn_after = warn_after
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            metrics.observe("event_loop.lag_ms", lag * 1000)
+            if lag >= self.warn_after:
+                logger.warning(f"Event loop lagged {lag * 1000:.0f}ms")
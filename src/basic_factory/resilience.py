@@ -0,0 +1,269 @@
+"""Timeouts, retries and circuit breaking for remote dependencies.
+
+Each remote dependency (a git remote, the GitHub API, the Anthropic API) is
+called through a `Dependency`, which applies a per-attempt timeout, retries
+transient failures with exponential backoff and full jitter, and trips a
+circuit breaker after repeated failures. While the circuit is open, calls
+fail immediately with `CircuitOpenError` instead of tying up workers on a
+service that is down; after a cool-down one probe call is let through.
+
+Errors are classified by duck typing so PyGithub, httpx and anthropic
+exceptions are recognised without importing those packages here.
+"""
+import asyncio
+import random
+import time
+from dataclasses import dataclass, replace
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from loguru import logger
+
+from basic_factory.git import GitError, GitTimeoutError
+from basic_factory.metrics import metrics
+
+T = TypeVar("T")
+
+# git stderr fragments that indicate a network problem rather than a real error
+TRANSIENT_GIT_ERRORS = (
+    "could not resolve host",
+    "connection timed out",
+    "connection reset",
+    "connection refused",
+    "failed to connect",
+    "couldn't connect to server",
+    "operation timed out",
+    "early eof",
+    "rpc failed",
+    "the remote end hung up unexpectedly",
+    "unexpected disconnect",
+    "internal server error",
+    "bad gateway",
+    "service unavailable",
+    "the requested url returned error: 5",
+    "ssh: connect to host",
+)
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504, 529}  # 529: Anthropic overloaded
+
+
+class CircuitOpenError(Exception):
+    """A dependency's circuit is open; the call was not attempted."""
+
+    def __init__(self, dependency: str, retry_after: float):
+        self.dependency = dependency
+        self.retry_after = retry_after
+        super().__init__(f"{dependency} is unavailable; retry in {retry_after:.0f}s")
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How long to wait for a call and how to retry it."""
+    attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 30.0  # Longest backoff, including server-requested waits
+    timeout: Optional[float] = None  # Per attempt; None leaves it to the callee
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter delay before retry number `attempt` (0-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Open after consecutive failures; allow a single probe after a cool-down."""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go ahead."""
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return
+        remaining = max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+        metrics.increment(f"resilience.{self.name}.rejected")
+        raise CircuitOpenError(self.name, remaining or 1.0)
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info(f"Circuit for {self.name} closed")
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_no_result(self) -> None:
+        """A call ended without an outcome (it was cancelled); free the probe slot."""
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._probing:
+                logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                metrics.increment(f"resilience.{self.name}.opened")
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+
+def _status(error: BaseException) -> Optional[int]:
+    """HTTP status of a PyGithub, httpx or anthropic error, if it has one."""
+    for value in (
+        getattr(error, "status_code", None),  # anthropic
+        getattr(error, "status", None),  # PyGithub
+        getattr(getattr(error, "response", None), "status_code", None),  # httpx
+    ):
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is not None:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    reset = headers.get("x-ratelimit-reset") or headers.get("X-RateLimit-Reset")
+    remaining = headers.get("x-ratelimit-remaining") or headers.get("X-RateLimit-Remaining")
+    if reset is not None and remaining == "0":
+        try:
+            return max(float(reset) - time.time(), 0.0)
+        except ValueError:
+            return None
+    return None
+
+
+def classify(error: BaseException) -> Tuple[bool, Optional[float]]:
+    """Return (retryable, seconds the server asked us to wait) for an error."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, GitTimeoutError, ConnectionError)):
+        return True, None
+    if isinstance(error, GitError):
+        stderr = error.stderr.lower()
+        return any(fragment in stderr for fragment in TRANSIENT_GIT_ERRORS), None
+
+    name = type(error).__name__
+    if name in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout",
+                "ConnectTimeout", "RemoteProtocolError", "ReadError", "WriteError", "PoolTimeout"):
+        return True, None
+
+    status = _status(error)
+    if status is None:
+        return False, None
+    retry_after = _retry_after(error)
+    if status in RETRYABLE_STATUS:
+        return True, retry_after
+    if status == 403:
+        # GitHub reports primary and secondary rate limits as 403
+        text = f"{getattr(error, 'data', '')} {error}".lower()
+        if "rate limit" in text or retry_after is not None:
+            return True, retry_after
+    return False, None
+
+
+class Dependency:
+    """A remote service called with a timeout, retries and a circuit breaker."""
+
+    def __init__(self, name: str, policy: RetryPolicy = RetryPolicy(), breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.policy = policy
+        self.breaker = breaker or CircuitBreaker(name)
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        can_retry: Optional[Callable[[], bool]] = None,
+        idempotent: bool = True,
+    ) -> T:
+        """Call `fn`, retrying transient failures.
+
+        Args:
+            fn: Makes one attempt; called again for each retry
+            can_retry: Checked before retrying, for calls that have side
+                effects partway through (such as streamed output)
+            idempotent: False for calls that must not be repeated, such as
+                creating a pull request. They get one attempt and no timeout,
+                since an attempt running in a thread can't be stopped and may
+                still succeed; the circuit breaker still applies.
+        """
+        policy = self.policy if idempotent else replace(self.policy, attempts=1, timeout=None)
+        for attempt in range(policy.attempts):
+            self.breaker.before_call()
+            try:
+                if policy.timeout is not None:
+                    result = await asyncio.wait_for(fn(), policy.timeout)
+                else:
+                    result = await fn()
+            except Exception as e:
+                retryable, retry_after = classify(e)
+                if not retryable:
+                    # The service answered; the request itself was bad
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                delay = max(retry_after or 0.0, policy.backoff(attempt))
+                last = attempt == policy.attempts - 1
+                if last or delay > policy.max_delay or (can_retry and not can_retry()):
+                    metrics.increment(f"resilience.{self.name}.failures")
+                    raise
+                metrics.increment(f"resilience.{self.name}.retries")
+                logger.warning(
+                    f"{self.name} call failed ({type(e).__name__}: {str(e)[:200]}), "
+                    f"retrying in {delay:.1f}s ({attempt + 1}/{policy.attempts - 1})"
+                )
+                await asyncio.sleep(delay)
+            except BaseException:
+                # Cancelled: neither success nor failure, but a probe must not stay claimed
+                self.breaker.record_no_result()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+        raise AssertionError("unreachable")
+
+
+# Per-dependency defaults. Git commands already carry GitConfig.network_timeout.
+DEFAULT_POLICIES: Dict[str, RetryPolicy] = {
+    "git": RetryPolicy(attempts=3, base_delay=1.0),
+    "github": RetryPolicy(attempts=4, base_delay=1.0, max_delay=60.0, timeout=60.0),
+    "anthropic": RetryPolicy(attempts=3, base_delay=2.0, max_delay=60.0, timeout=600.0),
+}
+
+_dependencies: Dict[str, Dependency] = {}
+
+
+def dependency(name: str, kind: Optional[str] = None) -> Dependency:
+    """Shared Dependency for a name such as "git:origin" or "github".
+
+    Calls to the same dependency share one circuit breaker, whichever
+    object makes them. `kind` selects the default policy and defaults to the
+    part of the name before ":".
+    """
+    found = _dependencies.get(name)
+    if found is None:
+        policy = DEFAULT_POLICIES.get(kind or name.split(":", 1)[0], RetryPolicy())
+        found = _dependencies[name] = Dependency(name, policy)
+    return found
+
+
+def reset() -> None:
+    """Forget all dependencies and their circuit state."""
+    _dependencies.clear()
@@ -0,0 +1,164 @@
+"""Structured review output: tool schema and streaming parser."""
+import json
+from dataclasses import dataclass
+from typing import Collection, Dict, List, Tuple
+
+from loguru import logger
+
+REVIEW_TOOL_NAME = "submit_review"
+
+# Comments come first in the schema so they stream out early and can be
+# posted while the summary is still being generated.
+REVIEW_TOOL = {
+    "name": REVIEW_TOOL_NAME,
+    "description": "Submit the code review for the changes.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "comments": {
+                "type": "array",
+                "description": "Inline comments anchored to changed lines",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "path": {
+                            "type": "string",
+                            "description": "File path as shown in the diff, without a/ or b/ prefix",
+                        },
+                        "line": {
+                            "type": "integer",
+                            "description": "Line number in the new version of the file, inside a diff hunk",
+                        },
+                        "body": {"type": "string", "description": "Comment text"},
+                    },
+                    "required": ["path", "line", "body"],
+                },
+            },
+            "summary": {"type": "string", "description": "Brief summary of the changes"},
+            "suggestions": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "General suggestions for improvement",
+            },
+            "approval": {"type": "boolean", "description": "Whether you approve the changes"},
+        },
+        "required": ["comments", "summary", "suggestions", "approval"],
+    },
+}
+
+
+@dataclass
+class ReviewComment:
+    """Code review comment with location info."""
+    path: str
+    line: int
+    body: str
+    # GitHub review comment position, filled in once mapped onto the diff
+    position: int | None = None
+
+
+def parse_comment(data: object, paths: Collection[str] | None = None) -> ReviewComment | None:
+    """Build a ReviewComment from decoded tool input, or None if malformed.
+
+    A stray "b/" diff prefix is dropped from the path, unless `paths`, the
+    files in the diff, show that "b/" is a real top-level directory.
+    """
+    if not isinstance(data, dict):
+        return None
+    path, line, body = data.get("path"), data.get("line"), data.get("body")
+    if not isinstance(path, str) or not isinstance(body, str):
+        return None
+    if isinstance(line, str) and line.isdigit():
+        line = int(line)
+    if not isinstance(line, int) or isinstance(line, bool):
+        return None
+    if path.startswith("b/") and (paths is None or path not in paths):
+        path = path[2:]
+    return ReviewComment(path=path, line=line, body=body)
+
+
+def is_anchored(comment: ReviewComment, ranges: Dict[str, List[Tuple[int, int]]]) -> bool:
+    """Check that a comment points at a line covered by one of the diff's hunks."""
+    return any(start <= comment.line <= end for start, end in ranges.get(comment.path, ()))
+
+
+class ReviewStreamParser:
+    """Incrementally extract comments from streamed `submit_review` input JSON.
+
+    Chunks of partial JSON are fed as they arrive. Each element of the
+    top-level "comments" array is decoded as soon as its closing brace is seen,
+    so every character is scanned once and only the comment currently being
+    streamed is buffered.
+    """
+
+    def __init__(self, ranges: Dict[str, List[Tuple[int, int]]] | None = None):
+        """
+        Args:
+            ranges: New-side hunk line ranges per path. When given, comments
+                outside them are rejected instead of emitted.
+        """
+        self.ranges = ranges
+        self.comments: List[ReviewComment] = []
+        self.rejected: List[ReviewComment] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key: List[str] = []
+        self._last_key = ""
+        self._in_comments = False
+        self._current: List[str] | None = None
+
+    def feed(self, chunk: str) -> List[ReviewComment]:
+        """Consume a chunk and return the comments completed by it."""
+        completed = []
+        for char in chunk:
+            if self._current is not None:
+                self._current.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = "".join(self._key)
+                elif self._depth == 1 and len(self._key) < 64:
+                    self._key.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._key = []
+            elif char in "{[":
+                if char == "[" and self._depth == 1 and self._last_key == "comments":
+                    self._in_comments = True
+                elif char == "{" and self._depth == 2 and self._in_comments:
+                    self._current = ["{"]
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 2 and self._current is not None:
+                    comment = self._finish("".join(self._current))
+                    self._current = None
+                    if comment is not None:
+                        completed.append(comment)
+                elif self._depth == 1:
+                    self._in_comments = False
+        return completed
+
+    def _finish(self, text: str) -> ReviewComment | None:
+        try:
+            comment = parse_comment(json.loads(text), self.ranges)
+        except json.JSONDecodeError:
+            comment = None
+        if comment is None:
+            logger.warning(f"Skipping malformed review comment: {text[:200]}")
+            return None
+        if self.ranges is not None and not is_anchored(comment, self.ranges):
+            logger.info(f"Comment on {comment.path}:{comment.line} is outside the diff")
+            self.rejected.append(comment)
+            return None
+        self.comments.append(comment)
+        return comment
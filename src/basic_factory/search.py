@@ -0,0 +1,256 @@
+"""Incremental trigram search over repository contents.
+
+The index maps every three-character sequence to the blobs containing it.
+A query only scans the lines of blobs that contain all of a term's trigrams,
+so lookups stay fast on large repositories. Blobs are indexed by object ID:
+moving to a new commit walks only the subtrees whose IDs changed and indexes
+only blobs that haven't been seen, so updates cost as much as the change set.
+"""
+import math
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterator, List, Optional, Set, Tuple
+
+from basic_factory.context import ContextSection
+from basic_factory.diff import parse_diff
+from basic_factory.objects import ObjectStore
+
+# Identifiers in added lines are used as queries for related code
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]{3,}")
+
+# Too common to say anything about which code is related
+STOPWORDS = frozenset({
+    "self", "None", "True", "False", "return", "import", "from", "async", "await",
+    "class", "def", "else", "elif", "while", "with", "pass", "raise", "yield",
+    "lambda", "print", "assert", "this", "that", "const", "function", "none",
+    "true", "false", "null", "static", "public", "private", "void", "string",
+})
+
+
+def trigrams(text: str) -> Set[str]:
+    """Lowercased trigrams of a piece of text."""
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+@dataclass
+class SearchHit:
+    """A file matching a query, with its matching lines."""
+    path: str
+    score: float
+    lines: List[Tuple[int, str]] = field(default_factory=list)
+
+
+class SearchIndex:
+    """Trigram index over the text files of one commit.
+
+    Call `update` with a ref to move the index to that commit; `search`
+    answers queries against the last indexed commit. Both are blocking and
+    safe to call from worker threads. Callers sharing an index should
+    search inside `pinned`, so another caller can't move it in between.
+    """
+
+    def __init__(self, store: ObjectStore, max_file_bytes: int = 512 * 1024):
+        """
+        Args:
+            store: Object store for the repository to index
+            max_file_bytes: Larger blobs (usually generated or vendored) are skipped
+        """
+        self.store = store
+        self.max_file_bytes = max_file_bytes
+        self.commit: Optional[str] = None
+        self._tree: Optional[str] = None
+        self._paths: Dict[str, str] = {}  # path -> blob oid
+        self._blob_paths: Dict[str, Set[str]] = {}  # blob oid -> its paths
+        self._grams: Dict[str, FrozenSet[str]] = {}  # blob oid -> its trigrams
+        self._postings: Dict[str, Set[str]] = {}  # trigram -> blob oids
+        self._lock = threading.Lock()
+        self._pin = threading.RLock()  # Held from an update until the searches at its commit are done
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def update(self, ref: str = "HEAD") -> int:
+        """Move the index to a commit and return the number of paths changed."""
+        commit = self.store.resolve(ref)
+        tree = str(commit.tree_id)
+        with self._pin, self._lock:
+            changes = list(self._changed(self._tree, tree, ""))
+            for path, old, new in changes:
+                if old is not None:
+                    self._remove(path, old)
+                if new is not None:
+                    self._add(path, new)
+            self.commit, self._tree = str(commit.id), tree
+        return len(changes)
+
+    @contextmanager
+    def pinned(self, ref: str = "HEAD") -> Iterator[int]:
+        """Move the index to `ref` and keep it there until the block exits.
+
+        Yields the number of paths changed. `commit` and searches inside the
+        block are for `ref`; updates from other threads wait for the block.
+        """
+        with self._pin:
+            yield self.update(ref)
+
+    def _changed(
+        self, old_tree: Optional[str], new_tree: Optional[str], prefix: str
+    ) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+        """Yield (path, old blob, new blob) for blobs that differ between two trees.
+
+        Subtrees with the same ID are identical and skipped without reading.
+        """
+        if old_tree == new_tree:
+            return
+        old = {e[0]: e for e in self.store._tree(old_tree)} if old_tree else {}
+        new = {e[0]: e for e in self.store._tree(new_tree)} if new_tree else {}
+        for name in old.keys() | new.keys():
+            before, after = old.get(name), new.get(name)
+            if before is not None and after is not None and before[1] == after[1]:
+                continue
+            path = f"{prefix}{name}"
+            old_blob = before[1] if before and before[2] == "blob" else None
+            new_blob = after[1] if after and after[2] == "blob" else None
+            if old_blob != new_blob:
+                yield path, old_blob, new_blob
+            yield from self._changed(
+                before[1] if before and before[2] == "tree" else None,
+                after[1] if after and after[2] == "tree" else None,
+                f"{path}/",
+            )
+
+    def _add(self, path: str, oid: str) -> None:
+        if oid not in self._grams:
+            blob = self.store._blob(oid)
+            if blob.is_binary or len(blob.data) > self.max_file_bytes:
+                return
+            grams = frozenset(trigrams(blob.data.decode("utf-8", "replace")))
+            self._grams[oid] = grams
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(oid)
+        self._paths[path] = oid
+        self._blob_paths.setdefault(oid, set()).add(path)
+
+    def _remove(self, path: str, oid: str) -> None:
+        if self._paths.pop(path, None) is None:
+            return
+        paths = self._blob_paths[oid]
+        paths.discard(path)
+        if paths:
+            return
+        del self._blob_paths[oid]
+        for gram in self._grams.pop(oid, ()):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(oid)
+                if not posting:
+                    del self._postings[gram]
+
+    def _candidates(self, term: str) -> Set[str]:
+        """Blobs containing every trigram of a term."""
+        postings = sorted(
+            (self._postings.get(gram, set()) for gram in trigrams(term)), key=len
+        )
+        if not postings:
+            return set()
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        path: str = "",
+        max_lines: int = 5,
+        exclude: FrozenSet[str] = frozenset(),
+    ) -> List[SearchHit]:
+        """Find files containing the query's terms, best matches first.
+
+        Terms are whitespace-separated and matched case-insensitively as
+        substrings; terms shorter than three characters are ignored. Files
+        score higher for matching more, and rarer, terms.
+        """
+        terms = list(dict.fromkeys(t.lower() for t in query.split() if len(t) >= 3))
+        prefix = path.strip("/")
+        with self._lock:
+            if not terms or not self._paths:
+                return []
+            total = len(self._grams)
+            oid_scores: Counter[str] = Counter()
+            oid_terms: Dict[str, List[str]] = {}
+            for term in terms:
+                candidates = self._candidates(term)
+                if not candidates:
+                    continue
+                idf = math.log(1 + total / len(candidates))
+                for oid in candidates:
+                    oid_scores[oid] += idf
+                    oid_terms.setdefault(oid, []).append(term)
+            matches = [
+                (p, oid) for oid in oid_scores for p in self._blob_paths[oid]
+                if p not in exclude
+                and (not prefix or p == prefix or p.startswith(f"{prefix}/"))
+            ]
+
+        hits = []
+        for file_path, oid in sorted(matches, key=lambda m: (-oid_scores[m[1]], m[0])):
+            # Trigrams can match without the whole term; confirm on the lines
+            lines = []
+            for number, line in enumerate(self.store._blob(oid).lines, 1):
+                lowered = line.lower()
+                if any(term in lowered for term in oid_terms[oid]):
+                    lines.append((number, line.rstrip("\r\n")))
+                    if len(lines) >= max_lines:
+                        break
+            if lines:
+                hits.append(SearchHit(file_path, round(oid_scores[oid], 3), lines))
+                if len(hits) >= limit:
+                    break
+        return hits
+
+
+def related_snippets(
+    index: SearchIndex,
+    diff: str,
+    max_terms: int = 8,
+    max_files: int = 5,
+    context_lines: int = 3,
+) -> List[ContextSection]:
+    """Find code related to a diff for a review prompt.
+
+    The most frequent identifiers on added lines are searched for outside the
+    changed files; each hit becomes a snippet of the surrounding lines.
+    """
+    changed = frozenset(parse_diff(diff).files)
+    counts = Counter(
+        word
+        for line in diff.splitlines()
+        if line.startswith("+") and not line.startswith("+++")
+        for word in IDENTIFIER.findall(line)
+        if word not in STOPWORDS
+    )
+    terms = [word for word, _ in counts.most_common(max_terms)]
+    if not terms:
+        return []
+
+    sections = []
+    for hit in index.search(" ".join(terms), limit=max_files, exclude=changed):
+        first = hit.lines[0][0]
+        last = min(hit.lines[-1][0], first + 40)
+        snippet = index.store.read_file(
+            index.commit, hit.path, max(first - context_lines, 1), last + context_lines
+        )
+        sections.append(ContextSection(
+            "related",
+            snippet.content.rstrip("\n"),
+            f"{hit.path}:{snippet.start_line}-{snippet.end_line}",
+        ))
+    return sections
@@ -0,0 +1,69 @@
+"""Server settings."""
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Mapping, Optional, Tuple
+
+
+@dataclass
+class Settings:
+    """Settings for the tool server, read once at startup."""
+    repo_path: Path = Path(".")
+    github_token: Optional[str] = None
+    github_repo: Optional[str] = None  # e.g. "basicmachines-co/basic-factory"
+    github_api_url: Optional[str] = None  # GitHub Enterprise or test server; None for github.com
+    log_level: str = "INFO"
+    log_file: Optional[str] = "basic_factory.log"  # None disables file logging
+    batch_concurrency: int = 4  # Worktrees and parallel GitHub calls for batches
+    cpu_workers: int = 2  # Processes for CPU-heavy work; 0 uses threads instead
+    io_workers: int = 8  # Threads for blocking file I/O
+    offload_threshold: int = 256 * 1024  # Smaller inputs are processed inline
+    max_inflight: int = 32  # Tool requests served at once across all endpoints
+    max_queue: int = 64  # Requests allowed to wait per gate before shedding
+    queue_timeout: float = 10.0  # Longest a request waits for admission
+    endpoint_limits: Dict[str, int] = field(default_factory=dict)  # Path -> concurrency overrides
+    idempotency_db: Optional[str] = None  # None stores it under the repo's .git directory
+    max_response_tokens: Optional[int] = None  # Tool results are shrunk to fit; None for no limit
+    validation_checks: Tuple[str, ...] = ("ruff", "pytest")  # Run for commits that ask to be validated
+    validation_workers: int = 2  # Worktrees for validations running at once
+    repo_url: Optional[str] = None  # Provision repo_path from this remote if it isn't a repo yet
+    mirror_dir: Path = Path.home() / ".cache" / "basic-factory" / "mirrors"  # Shared by all workers
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> "Settings":
+        """Build settings from environment variables."""
+        return cls(
+            repo_path=Path(environ.get("BASIC_FACTORY_REPO_PATH", ".")),
+            github_token=environ.get("GITHUB_TOKEN"),
+            github_repo=environ.get("GITHUB_REPO"),
+            github_api_url=environ.get("GITHUB_API_URL") or None,
+            log_level=environ.get("BASIC_FACTORY_LOG_LEVEL", "INFO"),
+            log_file=environ.get("BASIC_FACTORY_LOG_FILE", "basic_factory.log") or None,
+            batch_concurrency=int(environ.get("BASIC_FACTORY_BATCH_CONCURRENCY", "4")),
+            cpu_workers=int(environ.get("BASIC_FACTORY_CPU_WORKERS", "2")),
+            io_workers=int(environ.get("BASIC_FACTORY_IO_WORKERS", "8")),
+            offload_threshold=int(environ.get("BASIC_FACTORY_OFFLOAD_THRESHOLD", str(256 * 1024))),
+            max_inflight=int(environ.get("BASIC_FACTORY_MAX_INFLIGHT", "32")),
+            max_queue=int(environ.get("BASIC_FACTORY_MAX_QUEUE", "64")),
+            queue_timeout=float(environ.get("BASIC_FACTORY_QUEUE_TIMEOUT", "10")),
+            endpoint_limits=_parse_limits(environ.get("BASIC_FACTORY_ENDPOINT_LIMITS", "")),
+            idempotency_db=environ.get("BASIC_FACTORY_IDEMPOTENCY_DB") or None,
+            max_response_tokens=int(environ.get("BASIC_FACTORY_MAX_RESPONSE_TOKENS") or 0) or None,
+            validation_checks=tuple(
+                name.strip() for name in environ.get("BASIC_FACTORY_VALIDATION_CHECKS", "ruff,pytest").split(",")
+                if name.strip()
+            ),
+            validation_workers=int(environ.get("BASIC_FACTORY_VALIDATION_WORKERS", "2")),
+            repo_url=environ.get("BASIC_FACTORY_REPO_URL") or None,
+            mirror_dir=Path(environ.get("BASIC_FACTORY_MIRROR_DIR") or cls.mirror_dir),
+        )
+
+
+def _parse_limits(value: str) -> Dict[str, int]:
+    """Parse "/tools/git/commit-files=2,/tools/repo/=32" into a dict."""
+    limits = {}
+    for part in value.split(","):
+        path, _, limit = part.strip().partition("=")
+        if path and limit:
+            limits[path] = int(limit)
+    return limits
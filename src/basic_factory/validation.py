@@ -0,0 +1,245 @@
+"""Fast pre-push checks on committed files.
+
+A `Validator` runs configured checks (ruff, the tests that cover the changed
+files) against a branch with new file contents applied. It works in its own
+pool of linked worktrees, so the main working tree is not touched and the
+checks can run while the commit is being created. Checks run concurrently,
+and a check with a batch size is split into several processes over its
+targets.
+"""
+import asyncio
+import fnmatch
+import importlib.util
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from basic_factory.compact import truncate_text
+from basic_factory.git import Git, WorktreePool
+from basic_factory.metrics import metrics
+
+OUTPUT_TOKENS = 600  # Output kept per failed check: enough for the first errors
+
+# Environment passed to checks. They run code from the commit being checked,
+# so tokens and the server's own settings are left out.
+ENV_ALLOWLIST = (
+    "PATH", "HOME", "PYTHONPATH", "VIRTUAL_ENV", "TMPDIR", "TEMP", "TMP",
+    "LANG", "LC_ALL", "LC_CTYPE", "TZ", "SYSTEMROOT",
+)
+
+
+def changed_files(patterns: Sequence[str]) -> Callable[[List[str], Path], List[str]]:
+    """Target selector: the changed files matching any of `patterns`."""
+    def select(changed: List[str], root: Path) -> List[str]:
+        return [
+            path for path in changed
+            if any(fnmatch.fnmatch(path, p) for p in patterns) and (root / path).exists()
+        ]
+    return select
+
+
+def covering_tests(changed: List[str], root: Path) -> List[str]:
+    """Test files for the changed paths: changed tests, and tests named after changed modules."""
+    tests = set()
+    for path in changed:
+        name = Path(path).name
+        if not name.endswith(".py"):
+            continue
+        if name.startswith("test_"):
+            if (root / path).exists():
+                tests.add(path)
+            continue
+        for test in root.glob(f"tests/**/test_{Path(path).stem}.py"):
+            tests.add(test.relative_to(root).as_posix())
+    return sorted(tests)
+
+
+def check_env(environ: Mapping[str, str]) -> Dict[str, str]:
+    """The allowlisted variables of `environ`."""
+    return {name: environ[name] for name in ENV_ALLOWLIST if name in environ}
+
+
+@dataclass(frozen=True)
+class Check:
+    name: str
+    command: Sequence[str]  # Targets are appended
+    targets: Callable[[List[str], Path], List[str]]  # (changed paths, worktree) -> targets
+    batch_size: Optional[int] = None  # Targets per process; None runs all in one
+    timeout: float = 60.0
+    ok_codes: Tuple[int, ...] = (0,)
+    # Module the command runs; the check is skipped if it isn't installed
+    module: Optional[str] = None
+
+
+CHECKS: Dict[str, Check] = {
+    "ruff": Check(
+        "ruff",
+        (sys.executable, "-m", "ruff", "check", "--no-cache", "--output-format", "concise"),
+        changed_files(("*.py",)),
+        module="ruff",
+    ),
+    "pytest": Check(
+        "pytest",
+        (sys.executable, "-m", "pytest", "-q", "-x", "-p", "no:cacheprovider", "-m", "not integration"),
+        covering_tests,
+        batch_size=1,  # One process per test file, run side by side
+        timeout=120.0,
+        ok_codes=(0, 5),  # 5: every test in the file was deselected
+        module="pytest",
+    ),
+}
+
+
+@dataclass
+class CheckResult:
+    name: str
+    passed: bool
+    targets: List[str]
+    seconds: float
+    output: str = ""  # Head and tail of the output of failed runs
+    skipped: bool = False  # The check's tool isn't installed on the server
+
+
+@dataclass
+class ValidationReport:
+    passed: bool
+    seconds: float
+    results: List[CheckResult] = field(default_factory=list)
+
+    def summary(self) -> str:
+        """The failures, for GitResponse.error"""
+        failed = [r for r in self.results if not r.passed]
+        return "\n\n".join(f"{r.name} failed:\n{r.output}" for r in failed)
+
+
+async def _run(command: Sequence[str], cwd: Path, env: Mapping[str, str], timeout: float) -> Tuple[int, str]:
+    """Run a check process; returns (exit code, combined output)."""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            cwd=str(cwd),
+            env=dict(env),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+    except FileNotFoundError as e:
+        return 127, str(e)
+    try:
+        output, _ = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        return -1, f"Timed out after {timeout:.0f}s"
+    finally:
+        # Also on cancellation: the worktree goes back to the pool afterwards
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    return process.returncode, output.decode(errors="replace")
+
+
+class Validator:
+    """Runs checks on file changes in dedicated worktrees."""
+
+    def __init__(
+        self,
+        git: Git,
+        checks: Sequence[Check] = tuple(CHECKS.values()),
+        workers: int = 2,
+        max_processes: int = 4,
+    ):
+        """
+        Args:
+            git: Repository to validate branches of
+            checks: Checks to run; each one only runs if it has targets
+            workers: Validations that can run at once, one worktree each
+            max_processes: Check processes running at once, across validations
+        """
+        self.checks = list(checks)
+        self.worktrees = WorktreePool(git, size=workers, root=git.repo_path / ".git" / "basic-factory-validation")
+        self._processes = asyncio.Semaphore(max(max_processes, 1))
+
+    async def validate(self, ref: str, files: Mapping[str, str]) -> ValidationReport:
+        """Check `ref` with `files` (path -> content) written over it."""
+        start = time.monotonic()
+        async with self.worktrees.acquire() as worktree:
+            root = worktree.repo_path
+            await worktree._run_command(["checkout", "--detach", "-f", ref])
+            await worktree._run_command(["clean", "-fdq"])  # Files left by earlier validations
+            await asyncio.to_thread(_write_files, root, files)
+
+            env = check_env(os.environ)
+            paths = [str(root / "src"), str(root), env.get("PYTHONPATH", "")]
+            env["PYTHONPATH"] = os.pathsep.join(p for p in paths if p)
+
+            changed = sorted(files)
+            runs = []
+            for check in self.checks:
+                targets = check.targets(changed, root)
+                if not targets:
+                    continue
+                if check.module and importlib.util.find_spec(check.module) is None:
+                    # ruff and pytest are dev dependencies; a production install may lack them
+                    logger.warning(f"Skipping {check.name} check: {check.module} is not installed")
+                    runs.append(_skipped(check, targets))
+                    continue
+                size = check.batch_size or len(targets)
+                for i in range(0, len(targets), size):
+                    runs.append(self._check(check, targets[i:i + size], root, env))
+            results = _merge(await asyncio.gather(*runs))
+
+        report = ValidationReport(
+            passed=all(r.passed for r in results),
+            seconds=round(time.monotonic() - start, 3),
+            results=results,
+        )
+        metrics.observe("validation.seconds", report.seconds)
+        if not report.passed:
+            metrics.increment("validation.failed")
+            logger.warning(f"Validation of {ref} failed: {[r.name for r in results if not r.passed]}")
+        return report
+
+    async def _check(self, check: Check, targets: List[str], root: Path, env: Mapping[str, str]) -> CheckResult:
+        async with self._processes:
+            start = time.monotonic()
+            code, output = await _run([*check.command, *targets], root, env, check.timeout)
+        passed = code in check.ok_codes
+        return CheckResult(
+            name=check.name,
+            passed=passed,
+            targets=targets,
+            seconds=round(time.monotonic() - start, 3),
+            output="" if passed else truncate_text(output.strip(), OUTPUT_TOKENS),
+        )
+
+
+async def _skipped(check: Check, targets: List[str]) -> CheckResult:
+    return CheckResult(
+        name=check.name, passed=True, targets=targets, seconds=0.0,
+        output=f"{check.module} is not installed", skipped=True,
+    )
+
+
+def _write_files(root: Path, files: Mapping[str, str]) -> None:
+    for path, content in files.items():
+        target = root / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(content.encode())  # Same bytes as the commit, whatever the locale
+
+
+def _merge(results: List[CheckResult]) -> List[CheckResult]:
+    """Combine the batches of each check into one result, keeping check order."""
+    merged: Dict[str, CheckResult] = {}
+    for result in results:
+        found = merged.get(result.name)
+        if found is None:
+            merged[result.name] = result
+            continue
+        found.passed = found.passed and result.passed
+        found.targets += result.targets
+        found.seconds = max(found.seconds, result.seconds)  # Batches run side by side
+        found.output = truncate_text("\n".join(o for o in (found.output, result.output) if o), OUTPUT_TOKENS)
+    return list(merged.values())
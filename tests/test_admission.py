@@ -0,0 +1,136 @@
+"""Tests for admission control."""
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from basic_factory.admission import (
+    READ,
+    WRITE,
+    AdmissionController,
+    AdmissionGate,
+    AdmissionMiddleware,
+    EndpointRule,
+    Overloaded,
+)
+from basic_factory.metrics import metrics
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_gate_admits_higher_priority_first():
+    gate = AdmissionGate("test", concurrency=1)
+    await gate.acquire()
+    order = []
+
+    async def request(name, priority):
+        await gate.acquire(priority)
+        order.append(name)
+        gate.release()
+
+    tasks = [asyncio.create_task(request("write", WRITE))]
+    await _settle()
+    tasks.append(asyncio.create_task(request("read", READ)))
+    await _settle()
+
+    gate.release()
+    await asyncio.gather(*tasks)
+    assert order == ["read", "write"]
+    assert gate.active == 0
+
+
+@pytest.mark.asyncio
+async def test_full_queue_sheds_lowest_priority():
+    gate = AdmissionGate("test", concurrency=1, max_queue=1)
+    await gate.acquire()
+
+    write = asyncio.create_task(gate.acquire(WRITE))
+    await _settle()
+    with pytest.raises(Overloaded, match="queue full"):
+        await gate.acquire(WRITE)
+
+    # A read displaces the queued write rather than being turned away
+    read = asyncio.create_task(gate.acquire(READ))
+    await _settle()
+    with pytest.raises(Overloaded, match="displaced"):
+        await write
+
+    gate.release()
+    await read
+    gate.release()
+    assert gate.active == 0
+
+
+@pytest.mark.asyncio
+async def test_requests_shed_when_deadline_cannot_be_met():
+    gate = AdmissionGate("test", concurrency=1, max_wait=5)
+    await gate.acquire()
+    gate.service_time = 2.0
+
+    # Expected wait of 2s exceeds the client's 1s deadline: shed at once
+    with pytest.raises(Overloaded) as shed:
+        await gate.acquire(timeout=1.0)
+    assert shed.value.retry_after == pytest.approx(2.0)
+
+    # Within the deadline it waits, and gives up when the deadline passes
+    gate.service_time = 0.01
+    with pytest.raises(Overloaded, match="waited"):
+        await gate.acquire(timeout=0.05)
+    gate.release()
+    assert gate.active == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_slot():
+    gate = AdmissionGate("test", concurrency=1)
+    await gate.acquire()
+    waiter = asyncio.create_task(gate.acquire())
+    await _settle()
+    waiter.cancel()
+    await _settle()
+
+    gate.release()
+    assert gate.active == 0
+    await asyncio.wait_for(gate.acquire(), 1)
+
+
+@pytest.mark.asyncio
+async def test_middleware_returns_429_and_leaves_health_alone():
+    metrics.reset()
+    release = asyncio.Event()
+    app = FastAPI()
+
+    @app.post("/tools/slow")
+    async def slow():
+        await release.wait()
+        return {"success": True}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    controller = AdmissionController({"/tools/slow": EndpointRule(1)}, max_queue=0)
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        first = asyncio.create_task(client.post("/tools/slow"))
+        await asyncio.sleep(0.05)
+
+        shed = await client.post("/tools/slow")
+        assert shed.status_code == 429
+        assert int(shed.headers["Retry-After"]) >= 1
+        assert shed.json()["success"] is False
+        assert (await client.get("/health")).status_code == 200
+
+        release.set()
+        assert (await first).status_code == 200
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["admission.tools.slow.shed"] == 1
+    assert snapshot["histograms"]["admission.tools.slow.wait_ms"]["count"] == 1
@@ -210,4 +210,497 @@ async def test_gittools_methods(mock_git_tools):
 
     response = await mock_git_tools.commit_files(request)
     assert response.success is True
-    assert response.data["commit_sha"] == "abc123"
\ No newline at end of file
+    assert response.data["commit_sha"] == "abc123"
+
+def test_commit_files_request_accepts_validate():
+    """The wire name "validate" maps to run_checks, which doesn't shadow BaseModel.validate"""
+    body = {"branch_name": "b", "files": [], "commit_message": "m", "validate": True}
+    assert CommitFilesRequest.model_validate(body).run_checks is True
+    assert CommitFilesRequest(branch_name="b", files=[], commit_message="m").run_checks is False
+    assert callable(CommitFilesRequest.validate)
+
+def test_metrics_endpoint(client):
+    """Metrics are exposed as a JSON snapshot"""
+    from basic_factory.metrics import metrics
+    metrics.increment("github.write_calls_saved", 3)
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.json()["counters"]["github.write_calls_saved"] >= 3
+
+
+def test_create_app_sets_up_resources_in_lifespan(tmp_path, monkeypatch):
+    """GitTools and logging are created on startup, not at import"""
+    from basic_factory.api import create_app
+    from basic_factory.settings import Settings
+
+    monkeypatch.chdir(tmp_path)
+    settings = Settings(repo_path=tmp_path, github_repo="owner/repo", log_file=None)
+    app = create_app(settings)
+
+    assert not hasattr(app.state, "git_tools")
+
+    with TestClient(app) as client:
+        assert isinstance(app.state.git_tools, GitTools)
+        assert app.state.git_tools.repo_path == tmp_path
+        assert app.state.git_tools.repo_name == "owner/repo"
+        assert client.get("/health").status_code == 200
+
+    assert not (tmp_path / "basic_factory.log").exists()
+
+
+def test_settings_from_env():
+    """Settings are read from environment variables"""
+    from basic_factory.settings import Settings
+
+    settings = Settings.from_env({
+        "BASIC_FACTORY_REPO_PATH": "/srv/repo",
+        "GITHUB_REPO": "owner/repo",
+        "BASIC_FACTORY_LOG_FILE": "",
+    })
+
+    assert settings.repo_path == Path("/srv/repo")
+    assert settings.github_repo == "owner/repo"
+    assert settings.github_token is None
+    assert settings.log_file is None
+
+
+def test_admission_limits_from_settings():
+    """Endpoint limits from the environment override the defaults"""
+    from basic_factory.api import create_admission_controller
+    from basic_factory.settings import Settings
+
+    settings = Settings.from_env({
+        "BASIC_FACTORY_ENDPOINT_LIMITS": "/tools/git/commit-files=1, /tools/repo/=64",
+        "BASIC_FACTORY_MAX_INFLIGHT": "8",
+    })
+    controller = create_admission_controller(settings)
+
+    assert controller.server.concurrency == 8
+    assert controller.rule_for("/tools/git/commit-files")[1].concurrency == 1
+    assert controller.rule_for("/tools/repo/read-file")[1].concurrency == 64
+    assert controller.rule_for("/health") is None
+
+
+def test_import_has_no_side_effects(tmp_path):
+    """Importing the API module doesn't open log files or create clients"""
+    import subprocess
+    import sys
+
+    result = subprocess.run(
+        [sys.executable, "-c", "import sys, basic_factory.api; print('github' in sys.modules)"],
+        cwd=tmp_path,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "False"
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.fixture
+def repo_with_remote(tmp_path):
+    """A repo on main with one commit and a bare origin remote"""
+    import subprocess
+
+    remote = tmp_path / "remote.git"
+    repo = tmp_path / "repo"
+    subprocess.run(["git", "init", "--bare", "-b", "main", str(remote)], check=True, capture_output=True)
+    subprocess.run(["git", "init", "-b", "main", str(repo)], check=True, capture_output=True)
+    for args in (
+        ["config", "user.name", "Test User"],
+        ["config", "user.email", "test@example.com"],
+        ["commit", "--allow-empty", "-m", "Initial commit"],
+        ["remote", "add", "origin", str(remote)],
+        ["push", "-u", "origin", "main"],
+    ):
+        subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True)
+    return repo, remote
+
+
+def test_batch_endpoint_streams_per_item_results(repo_with_remote):
+    """Batch items are committed in worktrees, pushed together and reported per line"""
+    import json
+    import subprocess
+    from unittest.mock import MagicMock
+
+    repo, remote = repo_with_remote
+    tools = GitTools(repo, repo_name="owner/repo", batch_concurrency=2)
+    tools.github = MagicMock()
+    tools.github.get_repo.return_value.create_pull.side_effect = lambda **kw: MagicMock(
+        title=kw["title"], number=len(kw["head"]), html_url=f"https://github.com/pr/{kw['head']}"
+    )
+
+    items = [
+        {
+            "branch_name": f"deps/update-{n}",
+            "files": [{"path": f"pkg{n}/requirements.txt", "content": f"lib=={n}\n"}],
+            "commit_message": f"Update pkg{n}",
+            "pr_title": f"Update pkg{n}" if n % 2 else None,
+        }
+        for n in range(5)
+    ]
+    items.append({
+        "branch_name": "bad..name",
+        "files": [{"path": "x.txt", "content": "x"}],
+        "commit_message": "Broken",
+    })
+
+    app.dependency_overrides[get_git_tools] = lambda: tools
+    try:
+        response = TestClient(app).post("/tools/git/batch", json={"items": items})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    results = {r["data"]["index"]: r for r in map(json.loads, response.text.splitlines())}
+    assert sorted(results) == list(range(6))
+
+    assert results[5]["success"] is False
+    for n in range(5):
+        assert results[n]["success"] is True, results[n]
+        assert results[n]["data"]["pushed"] is True
+        assert ("pr_url" in results[n]["data"]) == bool(n % 2)
+
+    remote_heads = subprocess.run(
+        ["git", "for-each-ref", "--format=%(refname:short)", "refs/heads"],
+        cwd=remote, capture_output=True, text=True, check=True,
+    ).stdout.split()
+    assert sorted(remote_heads) == ["deps/update-0", "deps/update-1", "deps/update-2",
+                                    "deps/update-3", "deps/update-4", "main"]
+    # The main working tree was left alone
+    assert not (repo / "pkg0").exists()
+
+
+@pytest.mark.asyncio
+async def test_read_endpoints_use_the_offload_pool(repo_with_remote):
+    """Repository reads run on the bounded offload thread pool"""
+    from basic_factory.api import ReadFileRequest, SearchRequest
+    from basic_factory.metrics import metrics
+
+    repo, _ = repo_with_remote
+    (repo / "notes.md").write_text("hello\n")
+    tools = GitTools(repo)
+    await tools.commit_files(CommitFilesRequest(
+        branch_name="main", files=[FileContent(path="notes.md", content="hello\n")],
+        commit_message="Add notes", push=False,
+    ))
+    metrics.reset()
+    try:
+        assert (await tools.read_file(ReadFileRequest(path="notes.md"))).success
+        assert (await tools.search(SearchRequest(query="hello"))).success
+    finally:
+        tools.offload.shutdown()
+
+    assert metrics.snapshot()["histograms"]["offload.io_seconds"]["count"] == 2
+
+
+def test_batch_rejects_duplicate_branches(client):
+    """Two items on one branch would race in separate worktrees, so the batch is refused"""
+    item = {"branch_name": "fix/a", "files": [], "commit_message": "Fix"}
+    response = client.post("/tools/git/batch", json={"items": [item, {**item, "commit_message": "Again"}]})
+
+    assert response.status_code == 422
+    assert "Duplicate branch_name in batch: fix/a" in response.text
+
+
+def test_status_endpoint_returns_typed_status(repo_with_remote):
+    """Status is returned as typed entries rather than git's text output"""
+    repo, _ = repo_with_remote
+    (repo / "new.txt").write_text("new")
+    tools = GitTools(repo)
+
+    app.dependency_overrides[get_git_tools] = lambda: tools
+    try:
+        client = TestClient(app)
+        tracked_only = client.post("/tools/git/status", json={}).json()
+        with_untracked = client.post("/tools/git/status", json={"untracked": "all"}).json()
+    finally:
+        app.dependency_overrides.clear()
+
+    assert tracked_only["success"] is True
+    assert tracked_only["status"]["branch"] == "main"
+    assert tracked_only["status"]["upstream"] == "origin/main"
+    assert tracked_only["status"]["entries"] == []
+    assert with_untracked["status"]["entries"] == [{
+        "path": "new.txt", "kind": "untracked", "index": "?", "worktree": "?",
+        "orig_path": None, "score": None,
+    }]
+
+
+def test_repo_read_endpoints(repo_with_remote):
+    """Files, trees, log and grep are read without a working tree checkout"""
+    repo, _ = repo_with_remote
+    tools = GitTools(repo)
+
+    app.dependency_overrides[get_git_tools] = lambda: tools
+    try:
+        client = TestClient(app)
+        client.post("/tools/git/commit-files", json={
+            "branch_name": "main",
+            "files": [{"path": "docs/guide.md", "content": "one\ntwo\nthree\n"}],
+            "commit_message": "Add guide",
+            "push": False,
+        })
+        read = client.post("/tools/repo/read-file", json={"path": "docs/guide.md", "start_line": 2, "end_line": 2}).json()
+        tree = client.post("/tools/repo/list-tree", json={"path": "docs"}).json()
+        log = client.post("/tools/repo/log", json={"path": "docs/guide.md"}).json()
+        grep = client.post("/tools/repo/grep", json={"pattern": "three"}).json()
+        blame = client.post("/tools/repo/blame", json={"path": "docs/guide.md"}).json()
+        missing = client.post("/tools/repo/read-file", json={"path": "nope.md"}).json()
+    finally:
+        app.dependency_overrides.clear()
+
+    assert read["data"]["content"] == "two\n"
+    assert read["data"]["total_lines"] == 3
+    assert [e["path"] for e in tree["data"]["entries"]] == ["docs/guide.md"]
+    assert [c["subject"] for c in log["data"]["commits"]] == ["Add guide"]
+    assert grep["data"]["matches"] == [{"path": "docs/guide.md", "line": 3, "text": "three"}]
+    assert blame["data"]["hunks"][0]["end_line"] == 3
+    assert missing["success"] is False
+
+
+def test_search_endpoint_indexes_incrementally(repo_with_remote):
+    repo, _ = repo_with_remote
+    tools = GitTools(repo)
+
+    app.dependency_overrides[get_git_tools] = lambda: tools
+    try:
+        client = TestClient(app)
+        for n in range(2):
+            client.post("/tools/git/commit-files", json={
+                "branch_name": "main",
+                "files": [{"path": f"lib/mod{n}.py", "content": f"def parse_token_{n}():\n    pass\n"}],
+                "commit_message": f"Add mod{n}",
+                "push": False,
+            })
+            result = client.post("/tools/repo/search", json={"query": "parse_token"}).json()
+    finally:
+        app.dependency_overrides.clear()
+
+    assert result["success"] is True
+    assert result["data"]["indexed_changes"] == 1
+    assert [h["path"] for h in result["data"]["hits"]] == ["lib/mod0.py", "lib/mod1.py"]
+
+
+def test_write_if_changed_skips_identical_content(tmp_path):
+    from basic_factory.api import _write_if_changed
+
+    path = tmp_path / "pkg" / "module.py"
+    assert _write_if_changed(path, "x = 1\n") is True
+    mtime = path.stat().st_mtime_ns
+    assert _write_if_changed(path, "x = 1\n") is False
+    assert path.stat().st_mtime_ns == mtime
+    assert _write_if_changed(path, "x = 2\n") is True
+    assert path.read_text() == "x = 2\n"
+
+
+@pytest.mark.asyncio
+async def test_commit_files_stages_untracked_file_with_same_content(repo_with_remote):
+    """A file already on disk with the requested content is still committed"""
+    import subprocess
+
+    repo, _ = repo_with_remote
+    (repo / "notes.md").write_text("hello\n")
+    request = CommitFilesRequest(
+        branch_name="main",
+        files=[FileContent(path="notes.md", content="hello\n")],
+        commit_message="Add notes",
+        push=False,
+    )
+
+    response = await GitTools(repo).commit_files(request)
+
+    assert response.success, response.error
+    tracked = subprocess.run(["git", "ls-files"], cwd=repo, check=True, capture_output=True, text=True).stdout
+    assert tracked.split() == ["notes.md"]
+
+
+def test_large_bodies_are_decoded_off_the_event_loop(tmp_path, monkeypatch):
+    """Bodies over the threshold go through the offloader; small ones don't"""
+    import json
+
+    from basic_factory.api import create_app
+    from basic_factory.offload import Offloader
+    from basic_factory.settings import Settings
+
+    calls = []
+    original = Offloader.cpu
+
+    async def cpu(self, fn, *args, size=0):
+        calls.append((fn, size))
+        return await original(self, fn, *args, size=size)
+
+    monkeypatch.setattr(Offloader, "cpu", cpu)
+    monkeypatch.chdir(tmp_path)
+    settings = Settings(repo_path=tmp_path, log_file=None, cpu_workers=0, offload_threshold=1024)
+    tools_app = create_app(settings)
+
+    with TestClient(tools_app) as client:
+        tools_app.state.git_tools.commit_files = AsyncMock(
+            return_value=GitResponse(success=True, message="ok")
+        )
+        big = {"branch_name": "b", "commit_message": "m", "push": False,
+               "files": [{"path": "big.txt", "content": "x" * 4096}]}
+        assert client.post("/tools/git/commit-files", json=big).json()["success"] is True
+        client.get("/health")
+
+    # Only the large body was offloaded; /health has none
+    assert len(calls) == 1
+    assert calls[0][0] is json.loads and calls[0][1] > 4096
+    request = tools_app.state.git_tools.commit_files.call_args.args[0]
+    assert request.files[0].content == "x" * 4096
+
+
+def test_idempotency_key_replays_commit(repo_with_remote):
+    """A retried commit with the same key returns the first result without committing again"""
+    import subprocess
+
+    repo, _ = repo_with_remote
+    tools = GitTools(repo)
+    body = {
+        "branch_name": "main",
+        "files": [{"path": "notes.txt", "content": "hello\n"}],
+        "commit_message": "Add notes",
+        "push": False,
+    }
+
+    app.dependency_overrides[get_git_tools] = lambda: tools
+    try:
+        client = TestClient(app)
+        headers = {"Idempotency-Key": "retry-1"}
+        first = client.post("/tools/git/commit-files", json=body, headers=headers)
+        retry = client.post("/tools/git/commit-files", json=body, headers=headers)
+        conflict = client.post(
+            "/tools/git/commit-files", json={**body, "commit_message": "Other"}, headers=headers
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert first.json()["success"] is True
+    assert "Idempotent-Replayed" not in first.headers
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert conflict.status_code == 422
+    log = subprocess.run(["git", "log", "--format=%s"], cwd=repo, capture_output=True, text=True).stdout
+    assert log.split("\n").count("Add notes") == 1
+
+
+def test_compact_results_fit_token_budget(repo_with_remote):
+    """Compact mode summarizes diffs and max_tokens shrinks results to fit"""
+    from unittest.mock import MagicMock
+
+    repo, _ = repo_with_remote
+    tools = GitTools(repo, max_response_tokens=4000)
+    big = "".join(f"line {n}: some fairly long content for the agent to read\n" for n in range(2000))
+
+    app.dependency_overrides[get_git_tools] = lambda: tools
+    try:
+        client = TestClient(app)
+        client.post("/tools/git/commit-files", json={
+            "branch_name": "main",
+            "files": [{"path": "big.txt", "content": big}, {"path": "small.txt", "content": "x\n"}],
+            "commit_message": "Add files",
+            "push": False,
+        })
+        full = client.post("/tools/repo/read-file", json={"path": "small.txt"}).json()
+        capped = client.post("/tools/repo/read-file", json={"path": "big.txt"}).json()
+        budgeted = client.post("/tools/repo/read-file", json={"path": "big.txt", "max_tokens": 500}).json()
+        diff = client.post("/tools/repo/diff", json={"base": "HEAD~1", "compact": True}).json()
+        negative = client.post("/tools/repo/read-file", json={"path": "big.txt", "max_tokens": -1})
+
+        run = MagicMock(id=1, conclusion="failure", status="completed", html_url="https://ci/1")
+        run.name = "tests"
+        tools.github = MagicMock()
+        tools.github.get_repo.return_value.get_workflow_runs.return_value = [run] * 30
+        workflows = client.post("/tools/git/workflow-status", json={"pr_number": 1, "compact": True}).json()
+    finally:
+        app.dependency_overrides.clear()
+
+    assert full["omitted"] is None
+    assert 0 < full["tokens"] < 200
+    # The server budget applies to every request
+    assert capped["tokens"] <= 4000
+    assert capped["omitted"] == {"data.content": "truncated from 2000 lines"}
+    assert capped["data"]["content"].startswith("line 0:")
+    assert "lines omitted" in capped["data"]["content"]
+    assert budgeted["tokens"] <= 500
+    assert negative.status_code == 422
+
+    assert "diff" not in diff["data"]
+    assert sorted(diff["data"]["files"], key=lambda f: f["path"]) == [
+        {"path": "big.txt", "status": "added", "additions": 2000, "deletions": 0},
+        {"path": "small.txt", "status": "added", "additions": 1, "deletions": 0},
+    ]
+    assert workflows["data"]["workflow_summary"]["outcomes"] == {"failure": 30}
+    assert "workflow_runs" not in workflows["data"]
+
+
+def test_commit_files_validation_blocks_push(repo_with_remote):
+    """A commit that fails validation is reported, discarded and not pushed"""
+    import subprocess
+
+    repo, remote = repo_with_remote
+    tools = GitTools(repo, validation_checks=["ruff"])
+    commit = {
+        "branch_name": "main",
+        "files": [{"path": "app.py", "content": "import os\n"}],
+        "commit_message": "Add app",
+        "validate": True,
+    }
+
+    app.dependency_overrides[get_git_tools] = lambda: tools
+    try:
+        client = TestClient(app)
+        failed = client.post("/tools/git/commit-files", json=commit).json()
+        head_after_failure = subprocess.run(
+            ["git", "log", "--format=%s", "-1"], cwd=repo, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        commit["files"] = [{"path": "app.py", "content": "import os\n\nprint(os.name)\n"}]
+        commit["commit_message"] = "Fix app"
+        passed = client.post("/tools/git/commit-files", json=commit).json()
+    finally:
+        app.dependency_overrides.clear()
+
+    assert failed["success"] is False
+    assert failed["data"]["pushed"] is False
+    assert failed["data"]["commit_discarded"] is True
+    assert head_after_failure == "Initial commit"
+    assert failed["data"]["validation"]["results"][0]["name"] == "ruff"
+    assert "F401" in failed["error"]
+
+    assert passed["success"] is True, passed
+    assert passed["data"]["pushed"] is True
+    assert passed["data"]["validation"]["passed"] is True
+    remote_log = subprocess.run(
+        ["git", "log", "--format=%s", "main"], cwd=remote, capture_output=True, text=True, check=True
+    ).stdout.split("\n")
+    assert remote_log[:2] == ["Fix app", "Initial commit"]
+
+
+@pytest.mark.asyncio
+async def test_create_pull_request_is_not_retried(tmp_path, monkeypatch):
+    """A failed PR creation is reported, not repeated: the first attempt may have succeeded"""
+    from unittest.mock import MagicMock
+
+    from basic_factory import resilience
+    from basic_factory.api import CreatePRRequest
+
+    async def no_sleep(delay):
+        pass
+
+    monkeypatch.setattr(resilience.asyncio, "sleep", no_sleep)
+    resilience.reset()
+    tools = GitTools(tmp_path)
+    tools.github = MagicMock()
+    create = tools.github.get_repo.return_value.create_pull
+    create.side_effect = ConnectionError("reset by peer")
+
+    response = await tools.create_pull_request(
+        CreatePRRequest(title="T", description="D", branch_name="feature", base_branch="main")
+    )
+
+    assert response.success is False
+    assert create.call_count == 1
+    resilience.reset()
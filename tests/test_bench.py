@@ -0,0 +1,60 @@
+"""Tests for the load-test harness."""
+import socket
+
+import pytest
+
+from basic_factory.bench import (
+    BenchConfig, BenchReport, OpStats, _ThreadedServer, compare, fake_github_app, format_report, run_benchmark
+)
+
+
+def _report(throughput=100.0, p50=10.0, p99=50.0, errors=0, peak=100.0):
+    return BenchReport(
+        duration=10.0,
+        concurrency=4,
+        total_ops=int(throughput * 10),
+        throughput=throughput,
+        ops={"status": OpStats(count=1000, errors=errors, p50_ms=p50, p99_ms=p99, max_ms=p99 * 2)},
+        rss_mb=peak,
+        peak_rss_mb=peak,
+    )
+
+
+def test_report_round_trips_through_json():
+    report = _report()
+    assert BenchReport.from_json(report.to_json()) == report
+    assert "status" in format_report(report)
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = _report()
+
+    assert compare(_report(throughput=90, p50=11, p99=55), baseline) == []
+    regressions = compare(_report(throughput=70, p99=80, errors=2, peak=150), baseline)
+    assert regressions == [
+        "throughput 70 ops/s < baseline 100.0",
+        "status p99_ms 80 > baseline 50.0",
+        "status errors 2 > baseline 0",
+        "peak RSS 150MB > baseline 100.0MB",
+    ]
+
+
+def test_threaded_server_fails_fast_when_port_is_taken():
+    with socket.socket() as taken:
+        taken.bind(("127.0.0.1", 0))
+        taken.listen()
+        with pytest.raises(RuntimeError, match="did not start"):
+            with _ThreadedServer(fake_github_app(), taken.getsockname()[1]):
+                pass
+
+
+@pytest.mark.integration
+@pytest.mark.asyncio
+async def test_benchmark_runs_real_server():
+    """A short run drives every operation through the real server without errors"""
+    report = await run_benchmark(BenchConfig(duration=1.5, concurrency=2, files_per_commit=2))
+
+    assert set(report.ops) == {"commit", "pr", "status", "read"}
+    assert report.total_ops > 0
+    assert sum(stats.errors for stats in report.ops.values()) == 0
+    assert report.ops["status"].count > 0
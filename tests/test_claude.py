@@ -1,31 +1,217 @@
 """Tests for Claude integration."""
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import anthropic
+import httpx
 import pytest
+from basic_factory import resilience
 from basic_factory.claude import Claude, CodeReview
+from basic_factory.review import ReviewComment
+from basic_factory.context import ReviewContext, ContextSection
+
+DIFF = """
+diff --git a/src/basic_factory/hello.py b/src/basic_factory/hello.py
+new file mode 100644
+--- /dev/null
++++ b/src/basic_factory/hello.py
+@@ -0,0 +1,5 @@
++
++def hello_world() -> str:
++    return "Hello from Basic Factory!"
+"""
+
+
+REVIEW = {
+    "comments": [
+        {"path": "src/basic_factory/hello.py", "line": 2, "body": "Add a docstring."},
+        {"path": "src/basic_factory/hello.py", "line": 40, "body": "Outside the diff."},
+    ],
+    "summary": "Adds a hello world function.",
+    "suggestions": ["Add a test."],
+    "approval": False,
+}
+
+
+class FakeStream:
+    """Stands in for the SDK's MessageStream, replaying tool input in chunks."""
+
+    def __init__(self, tool_input, usage, chunk_size=7):
+        text = json.dumps(tool_input)
+        self.events = [
+            SimpleNamespace(type="input_json", partial_json=text[i:i + chunk_size])
+            for i in range(0, len(text), chunk_size)
+        ]
+        self.consumed = 0
+        self.message = SimpleNamespace(
+            content=[SimpleNamespace(type="tool_use", name="submit_review", input=tool_input)],
+            usage=usage,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self._events()
+
+    async def _events(self):
+        for event in self.events:
+            self.consumed += 1
+            yield event
+
+    async def get_final_message(self):
+        return self.message
+
+
+def _stream(tool_input=REVIEW, read=0, written=0, uncached=0):
+    usage = SimpleNamespace(
+        cache_read_input_tokens=read,
+        cache_creation_input_tokens=written,
+        input_tokens=uncached,
+    )
+    return FakeStream(tool_input, usage)
+
+
+@pytest.fixture
+def claude():
+    context = ReviewContext(sections=(ContextSection("notes", "Be nice.", "CLAUDE.md"),))
+    claude = Claude("test-key", context=context)
+    claude.client.messages.stream = MagicMock()
+    return claude
+
+
+@pytest.mark.asyncio
+async def test_review_changes(claude):
+    """Test basic code review functionality."""
+    claude.client.messages.stream.return_value = _stream(written=1500, uncached=200)
+
+    review = await claude.review_changes(DIFF, "Add hello world function with tests")
+
+    assert isinstance(review, CodeReview)
+    assert review.summary == "Adds a hello world function."
+    assert review.approval is False
+    assert review.comments == [
+        ReviewComment("src/basic_factory/hello.py", 2, "Add a docstring.")
+    ]
+    # The comment outside every hunk is kept as a general suggestion
+    assert review.suggestions == [
+        "Add a test.",
+        "src/basic_factory/hello.py:40: Outside the diff.",
+    ]
+
+    kwargs = claude.client.messages.stream.call_args.kwargs
+    assert kwargs["tool_choice"] == {"type": "tool", "name": "submit_review"}
+
+
+@pytest.mark.asyncio
+async def test_review_changes_emits_comments_while_streaming(claude):
+    """Comments reach the callback before the stream has finished."""
+    stream = _stream()
+    claude.client.messages.stream.return_value = stream
+    seen = []
+
+    async def on_comment(comment):
+        seen.append((comment.line, stream.consumed))
+
+    await claude.review_changes(DIFF, on_comment=on_comment)
+
+    assert len(seen) == 1
+    line, consumed = seen[0]
+    assert line == 2
+    assert consumed < len(stream.events)
+
+
+@pytest.mark.asyncio
+async def test_review_changes_sends_stable_cached_prefix(claude):
+    """The system prefix is identical across reviews; only the diff varies."""
+    claude.client.messages.stream.side_effect = [
+        _stream(written=1500, uncached=200),
+        _stream(read=1500, uncached=180),
+    ]
+
+    await claude.review_changes(DIFF, "first")
+    await claude.review_changes(DIFF.replace("Hello", "Hi"), "second")
+
+    first, second = [c.kwargs for c in claude.client.messages.stream.call_args_list]
+    assert first["system"] == second["system"]
+    assert first["system"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert "Be nice." in first["system"][0]["text"]
+    assert first["messages"] != second["messages"]
+
+    assert claude.cache_stats.requests == 2
+    assert claude.cache_stats.hit_rate == pytest.approx(1500 / 3380)
 
 
 @pytest.mark.asyncio
-async def test_review_changes():
-    pass
-
-#     """Test basic code review functionality."""
-#     claude = Claude("test-key")  # We'll need to mock the API calls
-#
-#     diff = """
-# diff --git a/src/basic_factory/hello.py b/src/basic_factory/hello.py
-# new file mode 100644
-# --- /dev/null
-# +++ b/src/basic_factory/hello.py
-# @@ -0,0 +1,5 @@
-# +
-# +def hello_world() -> str:
-# +    return "Hello from Basic Factory!"
-# """
-#
-#     description = "Add hello world function with tests"
-#
-#     review = await claude.review_changes(diff, description)
-#
-#     assert isinstance(review, CodeReview)
-#     assert isinstance(review.summary, str)
-#     assert isinstance(review.suggestions, list)
-#     assert isinstance(review.approval, bool)
\ No newline at end of file
+async def test_review_changes_puts_related_code_in_user_message(claude):
+    """Related snippets vary per review, so they stay out of the cached system prompt"""
+    claude.client.messages.stream.side_effect = [_stream(), _stream()]
+    related = [ContextSection("related", "def greet(): ...", "src/basic_factory/greet.py:1-1")]
+
+    await claude.review_changes(DIFF)
+    await claude.review_changes(DIFF, related=related)
+
+    plain, with_related = [c.kwargs for c in claude.client.messages.stream.call_args_list]
+    assert plain["system"] == with_related["system"]
+    prompt = with_related["messages"][0]["content"]
+    assert '<related path="src/basic_factory/greet.py:1-1">\ndef greet(): ...\n</related>' in prompt
+
+
+class OverloadedStream(FakeStream):
+    """Streams `fail_after` events, then fails as an overloaded API would."""
+
+    def __init__(self, fail_after=0):
+        super().__init__(REVIEW, SimpleNamespace())
+        self.fail_after = fail_after
+
+    async def _events(self):
+        for event in self.events[:self.fail_after]:
+            yield event
+        request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+        raise anthropic.APIStatusError(
+            "Overloaded", response=httpx.Response(529, request=request), body=None
+        )
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    async def sleep(delay):
+        pass
+
+    monkeypatch.setattr(resilience.asyncio, "sleep", sleep)
+    resilience.reset()
+    yield
+    resilience.reset()
+
+
+@pytest.mark.asyncio
+async def test_review_changes_retries_when_overloaded(claude, no_backoff):
+    """A 529 before any comment was emitted is retried with a fresh parser."""
+    claude.client.messages.stream.side_effect = [OverloadedStream(fail_after=3), _stream()]
+    seen = []
+
+    async def on_comment(comment):
+        seen.append(comment)
+
+    review = await claude.review_changes(DIFF, on_comment=on_comment)
+
+    assert claude.client.messages.stream.call_count == 2
+    assert review.comments == seen == [ReviewComment("src/basic_factory/hello.py", 2, "Add a docstring.")]
+
+
+@pytest.mark.asyncio
+async def test_review_changes_does_not_retry_after_emitting_comments(claude, no_backoff):
+    """Retrying after a comment was posted would post it twice."""
+    stream = OverloadedStream(fail_after=len(_stream().events) - 1)
+    claude.client.messages.stream.side_effect = [stream, _stream()]
+
+    async def on_comment(comment):
+        pass
+
+    with pytest.raises(anthropic.APIStatusError):
+        await claude.review_changes(DIFF, on_comment=on_comment)
+    assert claude.client.messages.stream.call_count == 1
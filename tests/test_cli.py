@@ -0,0 +1,59 @@
+"""Tests for CLI startup cost."""
+import subprocess
+import sys
+
+from typer.testing import CliRunner
+
+from basic_factory import __version__
+from basic_factory.cli import app
+
+# Modules that must not be imported just to start the CLI
+HEAVY_MODULES = (
+    "github",
+    "loguru",
+    "pygit2",
+    "httpx",
+    "anthropic",
+    "fastapi",
+    "basic_factory.git",
+    "basic_factory.github",
+)
+
+# Cumulative `python -X importtime` budget for `import basic_factory.cli`, in
+# microseconds. Nearly all of it is typer itself; generous for slow CI runners.
+IMPORT_BUDGET_US = 250_000
+
+
+def _import_times(module: str) -> dict:
+    """Run `python -X importtime -c "import module"` and parse the report."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_cli_import_is_lazy():
+    """Importing the CLI pulls in typer only; commands import the rest."""
+    times = _import_times("basic_factory.cli")
+
+    loaded = [m for m in HEAVY_MODULES if m in times]
+    assert loaded == []
+    assert times["basic_factory.cli"] < IMPORT_BUDGET_US
+
+
+def test_version_command():
+    """`version` prints the package version."""
+    result = CliRunner().invoke(app, ["version"])
+
+    assert result.exit_code == 0
+    assert f"Basic Factory v{__version__}" in result.output
@@ -0,0 +1,119 @@
+"""Tests for token-budgeted compaction of tool results."""
+from basic_factory.compact import (
+    compact_result,
+    count_tokens,
+    diff_stats,
+    estimate_tokens,
+    fit_to_budget,
+    summarize,
+    summarize_workflow_runs,
+    truncate_text,
+)
+
+DIFF = """diff --git a/app.py b/app.py
+--- a/app.py
++++ b/app.py
+@@ -1,2 +1,3 @@
+ import os
++import sys
+ print(os.name)
+diff --git a/old.py b/new.py
+similarity index 90%
+rename from old.py
+rename to new.py
+--- a/old.py
++++ b/new.py
+@@ -1 +1 @@
+-x = 1
++x = 2
+"""
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcdefg") == 2
+    assert count_tokens({"a": "é" * 35}) == estimate_tokens('{"a": "' + "é" * 35 + '"}')
+
+
+def test_truncate_text_keeps_head_and_tail():
+    text = "".join(f"line {n}\n" for n in range(1000))
+    short = truncate_text(text, 100)
+
+    assert estimate_tokens(short) <= 100
+    assert short.startswith("line 0\nline 1\n")
+    assert short.endswith("line 999\n")
+    assert "lines omitted ..." in short
+    assert truncate_text("short", 100) == "short"
+
+    one_line = truncate_text("x" * 10_000, 100)
+    assert estimate_tokens(one_line) <= 100
+    assert "characters omitted" in one_line
+
+    # Budgets too small for any text still never grow it
+    assert truncate_text("a" * 1000, 5) == "[... 1000 characters omitted ...]"
+    assert len(truncate_text("line\n" * 200, 1)) < 1000
+
+
+def test_diff_stats():
+    assert diff_stats(DIFF) == [
+        {"path": "app.py", "status": "modified", "additions": 1, "deletions": 0},
+        {"path": "new.py", "status": "renamed", "additions": 1, "deletions": 1, "old_path": "old.py"},
+    ]
+
+
+def test_summarize_workflow_runs():
+    runs = [
+        {"name": "tests", "status": "completed", "conclusion": "failure", "url": "u1"},
+        {"name": "lint", "status": "completed", "conclusion": "success", "url": "u2"},
+        {"name": "build", "status": "in_progress", "conclusion": None, "url": "u3"},
+    ]
+    assert summarize_workflow_runs(runs) == {
+        "total": 3,
+        "outcomes": {"failure": 1, "success": 1, "in_progress": 1},
+        "failed": [{"name": "tests", "url": "u1"}],
+        "pending": ["build"],
+    }
+
+
+def test_summarize_drops_commit_bodies():
+    data = summarize({"commits": [{"sha": "abc", "subject": "Fix", "body": "Long explanation"}]})
+    assert data == {"commits": [{"sha": "abc", "subject": "Fix"}]}
+
+
+def test_fit_to_budget_shrinks_largest_fields_first():
+    data = {
+        "path": "a.py",
+        "content": "".join(f"line {n}\n" for n in range(5000)),
+        "matches": [{"path": f"f{n}.py", "line": n} for n in range(50)],
+    }
+    fitted, omitted = fit_to_budget(data, 400)
+
+    assert count_tokens(fitted) <= 400
+    assert fitted["path"] == "a.py"
+    assert omitted["content"] == "truncated from 5000 lines"
+    assert fitted["content"].count("lines omitted") == 1
+    # The original is left untouched
+    assert len(data["content"]) > len(fitted["content"])
+
+    untouched, omitted = fit_to_budget({"a": "b"}, 10)
+    assert untouched == {"a": "b"} and omitted == {}
+
+
+def test_fit_to_budget_cuts_lists_and_reports_paths():
+    data = {"data": {"matches": [{"path": f"src/module_{n}.py", "line": n, "text": "x"} for n in range(500)]}}
+    fitted, omitted = fit_to_budget(data, 300)
+
+    assert count_tokens(fitted) <= 300
+    kept = len(fitted["data"]["matches"])
+    assert 3 <= kept < 500
+    assert omitted == {"data.matches": f"kept {kept} of 500 items"}
+    assert fitted["data"]["matches"][0]["path"] == "src/module_0.py"
+
+
+def test_compact_result_shortens_errors():
+    error = "Git command failed\nCommand: git add " + " ".join(f"file{n}.py" for n in range(2000))
+    result, omitted = compact_result({"success": False, "error": error, "data": None}, True, None)
+
+    assert estimate_tokens(result["error"]) <= 256
+    assert result["error"].startswith("Git command failed")
+    assert omitted == {}
@@ -0,0 +1,44 @@
+"""Tests for review context building."""
+from basic_factory.context import build_review_context, ReviewContext
+
+
+def test_build_review_context_is_byte_stable(tmp_path):
+    """Rendering twice from the same files gives identical bytes."""
+    (tmp_path / "CLAUDE.md").write_text("Use loguru for logging.\r\n\r\n")
+    (tmp_path / "pyproject.toml").write_text("[tool.ruff]\nline-length = 88   \n")
+    src = tmp_path / "src" / "pkg"
+    src.mkdir(parents=True)
+    (src / "b.py").write_text("B = 2\n")
+    (src / "a.py").write_text("A = 1\n")
+
+    first = build_review_context(tmp_path, key_modules=["src/pkg/a.py"])
+    second = build_review_context(tmp_path, key_modules=["src/pkg/a.py"])
+
+    assert first.render().encode() == second.render().encode()
+    assert first.digest == second.digest
+
+    rendered = first.render()
+    assert '<notes path="CLAUDE.md">\nUse loguru for logging.\n</notes>' in rendered
+    assert "line-length = 88\n" in rendered
+    assert "<module_map>\nsrc/pkg/a.py\nsrc/pkg/b.py\n</module_map>" in rendered
+    assert '<module path="src/pkg/a.py">\nA = 1\n</module>' in rendered
+
+
+def test_build_review_context_skips_missing_files(tmp_path):
+    """Missing notes and modules are left out rather than rendered empty."""
+    context = build_review_context(tmp_path, key_modules=["missing.py"])
+
+    assert context.sections == ()
+    assert context.render() == ReviewContext().render()
+
+
+def test_system_blocks_mark_prefix_for_caching(tmp_path):
+    """The rendered context is sent as a single cached system block."""
+    (tmp_path / "README.md").write_text("readme")
+    context = build_review_context(tmp_path)
+
+    blocks = context.system_blocks()
+
+    assert len(blocks) == 1
+    assert blocks[0]["text"] == context.render()
+    assert blocks[0]["cache_control"] == {"type": "ephemeral"}
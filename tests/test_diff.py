@@ -0,0 +1,166 @@
+"""Tests for diff parsing."""
+import time
+
+from basic_factory.diff import new_line_ranges, parse_diff
+
+DIFF = """diff --git a/src/app.py b/src/app.py
+index 1111111..2222222 100644
+--- a/src/app.py
++++ b/src/app.py
+@@ -1,3 +1,4 @@
+ import os
++import sys
+ 
+ def main():
+@@ -20,2 +21 @@ def helper():
+-    a = 1
+-    return a
++    return 1
+@@ -40,2 +40,0 @@
+-x = 1
+-y = 2
+diff --git a/old.py b/old.py
+deleted file mode 100644
+--- a/old.py
++++ /dev/null
+@@ -1 +0,0 @@
+-print('bye')
+"""
+
+
+def test_new_line_ranges():
+    """New-side hunk ranges are collected per file."""
+    assert new_line_ranges(DIFF) == {"src/app.py": [(1, 4), (21, 21)]}
+
+
+RENAME_AND_BINARY = """diff --git a/docs/old name.md b/docs/new name.md
+similarity index 90%
+rename from docs/old name.md
+rename to docs/new name.md
+index 3333333..4444444 100644
+--- a/docs/old name.md
++++ b/docs/new name.md
+@@ -1,2 +1,2 @@
+ # Title
+-old
++new
+diff --git a/logo.png b/logo.png
+new file mode 100644
+index 0000000..5555555
+Binary files /dev/null and b/logo.png differ
+diff --git a/sql/a.sql b/sql/a.sql
+--- a/sql/a.sql
++++ b/sql/a.sql
+@@ -1,2 +1 @@
+--- a comment that looks like a file header
+ select 1;
+\\ No newline at end of file
+"""
+
+
+def test_parse_diff_positions():
+    """Positions count from the first hunk header and run through later hunks."""
+    diff = parse_diff(DIFF)
+    app = diff.files["src/app.py"]
+
+    assert app.status == "modified"
+    assert [h.position for h in app.hunks] == [0, 5, 9]
+    assert (app.additions, app.deletions) == (2, 4)
+
+    assert diff.position("src/app.py", 1).position == 1
+    assert diff.position("src/app.py", 2).position == 2
+    assert diff.position("src/app.py", 2).added is True
+    assert diff.position("src/app.py", 4).position == 4
+    # Second hunk: header at 5, two removals at 6-7, the addition at 8
+    assert diff.position("src/app.py", 21).position == 8
+    assert diff.position("src/app.py", 21).hunk is app.hunks[1]
+    assert diff.position("src/app.py", 5) is None
+
+    assert diff.files["old.py"].status == "deleted"
+    assert not any(path == "old.py" for path, _ in diff.index)
+
+
+def test_parse_diff_only_splits_on_newlines():
+    """Form feeds and Unicode line separators inside a line don't shift positions."""
+    diff = parse_diff(
+        "diff --git a/a.py b/a.py\n"
+        "--- a/a.py\n"
+        "+++ b/a.py\n"
+        "@@ -1,3 +1,4 @@\n"
+        " x = 1\n"
+        " \x0c\n"
+        "+s = 'a\u2028b'\r\n"
+        " y = 2\n"
+    )
+    a = diff.files["a.py"]
+
+    assert a.additions == 1
+    assert diff.position("a.py", 3).position == 3
+    assert diff.position("a.py", 3).added is True
+    assert diff.position("a.py", 4).position == 4
+
+
+def test_parse_diff_renames_and_binary_files():
+    """Renamed files are keyed by their new path; binary files have no hunks."""
+    diff = parse_diff(RENAME_AND_BINARY)
+
+    renamed = diff.files["docs/new name.md"]
+    assert renamed.status == "renamed"
+    assert renamed.old_path == "docs/old name.md"
+    assert renamed.similarity == 90
+    assert diff.position("docs/new name.md", 2).position == 3
+
+    logo = diff.files["logo.png"]
+    assert logo.is_binary and logo.status == "added" and logo.hunks == []
+
+    # A removed line starting with "--" stays inside its hunk
+    sql = diff.files["sql/a.sql"]
+    assert sql.deletions == 1
+    assert diff.position("sql/a.sql", 1).position == 2
+    assert list(diff.files) == ["docs/new name.md", "logo.png", "sql/a.sql"]
+
+
+def test_parse_plain_unified_diff():
+    """Diffs without `diff --git` headers are parsed from their ---/+++ lines."""
+    diff = parse_diff(
+        "--- /dev/null\n+++ b/new.py\n@@ -0,0 +1 @@\n+x = 1\n"
+        "--- a/mod.py\n+++ b/mod.py\n@@ -1 +1 @@\n-a\n+b\n"
+    )
+
+    assert diff.files["new.py"].status == "added"
+    assert diff.files["mod.py"].status == "modified"
+    assert diff.position("mod.py", 1).position == 2
+
+
+def _large_diff(files: int, lines_per_file: int) -> str:
+    parts = []
+    for n in range(files):
+        parts.append(
+            f"diff --git a/pkg/mod_{n}.py b/pkg/mod_{n}.py\n"
+            f"--- a/pkg/mod_{n}.py\n+++ b/pkg/mod_{n}.py\n"
+            f"@@ -1,{lines_per_file} +1,{lines_per_file} @@\n"
+        )
+        for i in range(lines_per_file // 2):
+            parts.append(f"-old line {i}\n+new line {i}\n context {i}\n")
+    return "".join(parts)
+
+
+def test_parse_diff_benchmark_50k_lines():
+    """A 50k-line diff parses in one pass and lookups are dictionary hits."""
+    text = _large_diff(files=100, lines_per_file=334)
+    assert text.count("\n") > 50_000
+
+    start = time.perf_counter()
+    diff = parse_diff(text)
+    elapsed = time.perf_counter() - start
+
+    assert len(diff.files) == 100
+    assert diff.position("pkg/mod_99.py", 334).position == 501
+    # Generous bound so slow CI machines pass; typically well under 0.2s
+    assert elapsed < 2.0
+
+    start = time.perf_counter()
+    for n in range(100):
+        for line in range(1, 335):
+            assert diff.position(f"pkg/mod_{n}.py", line) is not None
+    assert time.perf_counter() - start < 0.5
@@ -2,7 +2,10 @@
 from pathlib import Path
 import pytest
 import pygit2
-from basic_factory.git import Git, GitConfig
+from basic_factory.diff import parse_diff
+from basic_factory.git import (
+    Git, GitConfig, GitError, GitTimeoutError, StatusEntry, WorktreePool
+)
 
 
 @pytest.fixture
@@ -62,4 +65,391 @@ def git_repo(tmp_path):
 #
 #     # Verify content
 #     assert "Hello from Basic Factory" in hello_path.read_text()
-#     assert "test_hello_world" in test_path.read_text()
\ No newline at end of file
+#     assert "test_hello_world" in test_path.read_text()
+
+@pytest.fixture
+async def work_repo(git_repo):
+    """git_repo checked out on main with a committer configured."""
+    await git_repo._run_command(["checkout", "-f", "main"])
+    await git_repo._run_command(["config", "--local", "user.name", "Test User"])
+    await git_repo._run_command(["config", "--local", "user.email", "test@example.com"])
+    return git_repo
+
+
+async def _commit(git: Git, files: dict, message: str) -> str:
+    for name, content in files.items():
+        path = git.repo_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+        await git.add(name)
+    await git.commit(message)
+    return await git.get_current_commit_sha()
+
+
+@pytest.mark.asyncio
+async def test_diff_detects_renames_and_is_cached(work_repo, monkeypatch):
+    """Local diffs detect renames and are computed once per SHA pair."""
+    git = work_repo
+    content = "".join(f"line {i}\n" for i in range(20))
+    base = await _commit(git, {"a.txt": content, "keep.txt": "x\n"}, "Add files")
+
+    await git._run_command(["mv", "a.txt", "b.txt"])
+    head = await _commit(git, {"b.txt": content + "line 20\n"}, "Rename a to b")
+
+    calls = _count_commands(git, monkeypatch)
+
+    diff = parse_diff(await git.diff(base, head))
+    assert list(diff.files) == ["b.txt"]
+    assert diff.files["b.txt"].status == "renamed"
+    assert diff.files["b.txt"].old_path == "a.txt"
+    assert diff.position("b.txt", 21).added is True
+    assert calls.count("diff") == 1
+
+    # Same pair again, by full SHA: served from the cache without running git
+    calls.clear()
+    assert parse_diff(await git.diff(base, head)).files.keys() == diff.files.keys()
+    assert calls == []
+
+
+@pytest.mark.asyncio
+async def test_diff_files_streams_one_file_at_a_time(work_repo):
+    """diff_files yields a separate section per changed file."""
+    git = work_repo
+    base = await _commit(git, {"one.py": "1\n"}, "One")
+    head = await _commit(git, {"one.py": "2\n", "two.py": "2\n"}, "Two")
+
+    sections = [s async for s in git.diff_files(base, head)]
+
+    assert [s.splitlines()[0] for s in sections] == [
+        "diff --git a/one.py b/one.py",
+        "diff --git a/two.py b/two.py",
+    ]
+    assert "".join(sections) == await git.diff(base, head)
+
+
+@pytest.mark.asyncio
+async def test_merge_base_diff_ignores_changes_on_base(work_repo):
+    """A PR diff only contains the branch's changes, not newer base commits."""
+    git = work_repo
+    await _commit(git, {"shared.txt": "v1\n"}, "Shared")
+    await git.create_branch("feature")
+    head = await _commit(git, {"feature.txt": "feature\n"}, "Feature work")
+    await git.checkout("main")
+    base = await _commit(git, {"shared.txt": "v2\n"}, "Base moved on")
+
+    diff = parse_diff(await git.merge_base_diff(base, head))
+
+    assert list(diff.files) == ["feature.txt"]
+
+
+@pytest.mark.asyncio
+async def test_push_branches_pushes_all_refs_at_once(work_repo):
+    """Several branches go to the remote in one push with per-branch results."""
+    git = work_repo
+    await _commit(git, {"a.txt": "a\n"}, "A")
+    await git._run_command(["branch", "one"])
+    await git._run_command(["branch", "two"])
+
+    results = await git.push_branches(["one", "two"])
+
+    assert results == {"one": True, "two": True}
+    remote = pygit2.Repository(str(git.repo_path.parent / "remote_repo"))
+    assert {"refs/heads/one", "refs/heads/two"} <= set(remote.references)
+
+
+@pytest.mark.asyncio
+async def test_worktree_pool_reuses_worktrees(work_repo):
+    """Worktrees are created up to the pool size and handed out again."""
+    pool = WorktreePool(work_repo, size=1, root=work_repo.repo_path.parent / "wts")
+
+    async with pool.acquire() as first:
+        await first._run_command(["checkout", "-B", "wt-branch", "main"])
+    async with pool.acquire() as second:
+        assert second.repo_path == first.repo_path
+        # Released worktrees are detached so their branch is free again
+        assert await second.get_current_branch() == "HEAD"
+
+
+def _count_commands(git: Git, monkeypatch) -> list:
+    """Record the git subcommand of every command the wrapper runs."""
+    calls = []
+    run_command = git._run_command
+    stream_command = git._stream_command
+
+    async def counting_run_command(args, *rest, **kwargs):
+        calls.append(args[0])
+        return await run_command(args, *rest, **kwargs)
+
+    def counting_stream_command(args, *rest, **kwargs):
+        calls.append(args[0])
+        return stream_command(args, *rest, **kwargs)
+
+    monkeypatch.setattr(git, "_run_command", counting_run_command)
+    monkeypatch.setattr(git, "_stream_command", counting_stream_command)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_concurrent_pushes_are_coalesced(work_repo, monkeypatch):
+    """Concurrent pushes to one remote become a single multi-ref git push."""
+    import asyncio
+
+    git = work_repo
+    await _commit(git, {"a.txt": "a\n"}, "A")
+    branches = [f"feature/{n}" for n in range(8)]
+    for branch in branches:
+        await git._run_command(["branch", branch])
+    calls = _count_commands(git, monkeypatch)
+
+    await asyncio.gather(*(git.push(branch) for branch in branches), git.push(branches[0]))
+
+    assert calls.count("push") == 1
+    remote = pygit2.Repository(str(git.repo_path.parent / "remote_repo"))
+    assert {f"refs/heads/{b}" for b in branches} <= set(remote.references)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_push_caller_does_not_cancel_others(work_repo):
+    """A coalesced push still completes for callers that weren't cancelled."""
+    import asyncio
+
+    git = work_repo
+    await _commit(git, {"a.txt": "a\n"}, "A")
+    first = asyncio.create_task(git.push("main"))
+    second = asyncio.create_task(git.push("main"))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    cancelled, pushed = await asyncio.gather(first, second, return_exceptions=True)
+    await git._push_tasks["origin"]
+    assert isinstance(cancelled, asyncio.CancelledError)
+    assert pushed == "[new branch]"
+
+
+@pytest.mark.asyncio
+async def test_push_skips_branches_the_remote_already_has(work_repo, monkeypatch):
+    """Pushing an unchanged branch again doesn't start a git push."""
+    git = work_repo
+    await _commit(git, {"a.txt": "a\n"}, "A")
+    await git.push("main")
+    calls = _count_commands(git, monkeypatch)
+
+    assert await git.push("main") == "Already up to date"
+    assert calls == ["for-each-ref"]
+
+    await _commit(git, {"a.txt": "b\n"}, "B")
+    await git.push("main")
+    assert calls.count("push") == 1
+
+
+@pytest.mark.asyncio
+async def test_push_does_not_trust_stale_tracking_refs(work_repo):
+    """A branch deleted on the remote is pushed again though the tracking ref matches."""
+    git = work_repo
+    await _commit(git, {"a.txt": "a\n"}, "A")
+    await git._run_command(["push", "-u", "origin", "main"])  # Pushed outside this instance
+    remote = pygit2.Repository(str(git.repo_path.parent / "remote_repo"))
+    remote.references.delete("refs/heads/main")
+
+    await git.push("main")
+
+    assert "refs/heads/main" in remote.references
+
+
+@pytest.mark.asyncio
+async def test_rejected_push_raises(work_repo):
+    """A push the remote rejects raises GitError for that branch."""
+    git = work_repo
+    await _commit(git, {"a.txt": "a\n"}, "A")
+    await git.push("main")
+    # Rewrite local history so the push is a non-fast-forward
+    await git._run_command(["commit", "--amend", "-m", "Rewritten"])
+
+    with pytest.raises(GitError):
+        await git.push("main")
+
+
+
+@pytest.mark.asyncio
+async def test_push_retries_network_failures(work_repo, monkeypatch):
+    """Pushes that fail to reach the remote are retried, then fail fast."""
+    from basic_factory import resilience
+
+    async def no_sleep(delay):
+        pass
+
+    monkeypatch.setattr(resilience.asyncio, "sleep", no_sleep)
+    resilience.reset()
+    git = work_repo
+    await _commit(git, {"a.txt": "a\n"}, "A")
+    await git._run_command(["remote", "set-url", "origin", "http://127.0.0.1:9/repo.git"])
+    attempts = []
+    run_command = git._run_command
+
+    async def counting(args, **kwargs):
+        if args[0] == "push":
+            attempts.append(args)
+        return await run_command(args, **kwargs)
+
+    monkeypatch.setattr(git, "_run_command", counting)
+    try:
+        with pytest.raises(GitError):
+            await git.push("main")
+        assert len(attempts) == resilience.DEFAULT_POLICIES["git"].attempts
+
+        resilience.dependency("git:origin").breaker.opened_at = 0.0
+        resilience.dependency("git:origin").breaker.reset_timeout = 1e9
+        with pytest.raises(resilience.CircuitOpenError):
+            await git.push("main")
+    finally:
+        resilience.reset()
+
+@pytest.mark.asyncio
+async def test_ssh_connections_are_shared(tmp_path, monkeypatch):
+    """Network commands get an SSH ControlMaster setup unless one is configured."""
+    monkeypatch.delenv("GIT_SSH_COMMAND", raising=False)
+    monkeypatch.delenv("GIT_SSH", raising=False)
+    git = Git(GitConfig(tmp_path, ssh_control_persist=300))
+    assert not git._network_env_ready  # Nothing is looked up until a remote is used
+    env = await git._command_env()
+    assert "ControlMaster=auto" in env["GIT_SSH_COMMAND"]
+    assert "ControlPersist=300s" in env["GIT_SSH_COMMAND"]
+
+    monkeypatch.setenv("GIT_SSH_COMMAND", "ssh -i key")
+    assert await Git(GitConfig(tmp_path))._command_env() is None
+    monkeypatch.delenv("GIT_SSH_COMMAND")
+
+    monkeypatch.setenv("GIT_SSH", "/usr/local/bin/my-ssh")
+    assert await Git(GitConfig(tmp_path))._command_env() is None
+    monkeypatch.delenv("GIT_SSH")
+
+    pygit2.init_repository(str(tmp_path)).config["core.sshCommand"] = "ssh -i key"
+    assert await Git(GitConfig(tmp_path))._command_env() is None
+
+
+@pytest.mark.asyncio
+async def test_stream_command_yields_records_incrementally(work_repo):
+    """Output is split on the separator, including multi-byte text across chunks."""
+    git = work_repo
+    names = [f"dir/ünïcødé-{n}.txt" for n in range(3000)]
+    await _commit(git, {name: "x\n" for name in names}, "Many files")
+
+    records = [r async for r in git._stream_command(
+        ["-c", "core.quotePath=false", "ls-files", "-z"], separator="\0"
+    )]
+
+    assert records == sorted(names)
+
+
+@pytest.mark.asyncio
+async def test_stream_command_bounds_long_records(work_repo):
+    """A record longer than the cap is yielded in pieces instead of buffered."""
+    git = work_repo
+    await _commit(git, {"long.txt": "y" * 10_000}, "Long line")
+
+    pieces = [r async for r in git._stream_command(["show", "HEAD:long.txt"], max_record_chars=4096)]
+
+    assert [len(p) for p in pieces] == [4096, 4096, 1808]
+
+
+@pytest.mark.asyncio
+async def test_diff_keeps_long_lines_whole(work_repo):
+    """A changed line over a megabyte, e.g. minified code, isn't split in the diff."""
+    git = work_repo
+    base = await _commit(git, {"bundle.js": "a\n"}, "Bundle")
+    long_line = "x" * (3 * 1024 * 1024)
+    head = await _commit(git, {"bundle.js": long_line + "\n"}, "Minify")
+
+    diff = await git.diff(base, head)
+
+    assert f"\n+{long_line}\n" in diff
+    assert diff == await git._run_command(["diff", "--no-color", "--no-ext-diff", "--find-renames", base, head], strip=False)
+
+
+@pytest.mark.asyncio
+async def test_stream_command_raises_on_failure(work_repo):
+    """A failing command raises GitError once its output is consumed."""
+    with pytest.raises(GitError):
+        [r async for r in work_repo._stream_command(["show", "HEAD:missing.txt"])]
+
+
+@pytest.mark.asyncio
+async def test_timeouts_kill_the_child(tmp_path):
+    """Timed-out commands raise GitTimeoutError and leave no process behind."""
+    import asyncio
+    import time
+
+    # A fake "git" that hangs, standing in for a stalled network operation
+    fake_git = tmp_path / "slow-git"
+    fake_git.write_text("#!/bin/sh\necho started\nexec sleep 30\n")
+    fake_git.chmod(0o755)
+    git = Git(GitConfig(tmp_path, git_path=str(fake_git)))
+
+    start = time.monotonic()
+    with pytest.raises(GitTimeoutError):
+        await git._run_command(["fetch"], timeout=0.2)
+    with pytest.raises(GitTimeoutError):
+        async for _ in git._stream_command(["log"], timeout=0.2):
+            pass
+    assert time.monotonic() - start < 5
+
+    # Cancelling the awaiting task also kills the child
+    task = asyncio.create_task(git._run_command(["fetch"]))
+    await asyncio.sleep(0.2)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+@pytest.mark.asyncio
+async def test_repo_status_is_structured(work_repo):
+    """Porcelain v2 output is parsed into typed entries."""
+    git = work_repo
+    content = "".join(f"line {i}\n" for i in range(20))
+    await _commit(git, {"keep.txt": "keep\n", "old.txt": content, "edit.txt": "a\n"}, "Base")
+
+    await git._run_command(["mv", "old.txt", "new name.txt"])
+    (git.repo_path / "edit.txt").write_text("b\n")
+    (git.repo_path / "staged.txt").write_text("s\n")
+    await git.add("staged.txt")
+    (git.repo_path / "untracked dir").mkdir()
+    (git.repo_path / "untracked dir" / "u.txt").write_text("u\n")
+
+    status = await git.repo_status(untracked="all")
+
+    assert status.branch == "main"
+    assert status.oid == await git.get_current_commit_sha()
+    by_path = {entry.path: entry for entry in status.entries}
+    assert by_path["new name.txt"] == StatusEntry(
+        "new name.txt", "renamed", "R", ".", orig_path="old.txt", score=100
+    )
+    assert by_path["edit.txt"] == StatusEntry("edit.txt", "changed", ".", "M")
+    assert by_path["staged.txt"] == StatusEntry("staged.txt", "changed", "A", ".")
+    assert by_path["untracked dir/u.txt"].kind == "untracked"
+    assert not status.clean
+
+
+@pytest.mark.asyncio
+async def test_repo_status_options(work_repo):
+    """Untracked scans can be skipped, paths limited and output capped."""
+    git = work_repo
+    await _commit(git, {f"src/{n}.py": "x\n" for n in range(50)} | {"docs/a.md": "a\n"}, "Base")
+    for n in range(50):
+        (git.repo_path / "src" / f"{n}.py").write_text("y\n")
+    (git.repo_path / "docs" / "a.md").write_text("b\n")
+    (git.repo_path / "scratch.txt").write_text("tmp\n")
+
+    no_untracked = await git.repo_status(untracked="no")
+    assert all(entry.kind == "changed" for entry in no_untracked.entries)
+    assert len(no_untracked.entries) == 51
+
+    docs_only = await git.repo_status(pathspecs=["docs"])
+    assert [entry.path for entry in docs_only.entries] == ["docs/a.md"]
+
+    capped = await git.repo_status(untracked="no", max_entries=10)
+    assert len(capped.entries) == 10
+    assert capped.truncated
+
+    await git._run_command(["checkout", "--", "."])
+    (git.repo_path / "scratch.txt").unlink()
+    assert (await git.repo_status()).clean
@@ -0,0 +1,99 @@
+"""Tests for coalesced GitHub writes."""
+from unittest.mock import AsyncMock
+
+import pytest
+from basic_factory.github import GitHub, GitHubWriteBuffer, PullRequestState
+from basic_factory.metrics import metrics
+from basic_factory.review import ReviewComment
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.fixture
+def gh():
+    gh = AsyncMock()
+    gh.get_pr_state.return_value = PullRequestState(
+        head_sha="h" * 40,
+        comments={("a.py", 3, "Already said this.")},
+        labels={"reviewed"},
+        statuses={"review/claude": ("pending", "Reviewing")},
+    )
+    return gh
+
+
+@pytest.mark.asyncio
+async def test_flush_coalesces_and_deduplicates(gh):
+    """Comments go out in one review; existing comments, labels and statuses are skipped."""
+    buffer = GitHubWriteBuffer(gh, "owner/repo", 5)
+    buffer.add_comment(ReviewComment("a.py", 3, "Already said this.  ", position=3))
+    buffer.add_comment(ReviewComment("a.py", 4, "New point.", position=4))
+    buffer.add_comment(ReviewComment("a.py", 4, "New point.", position=4))
+    buffer.add_comment(ReviewComment("b.py", 1, "Another.", position=1))
+    buffer.add_label("reviewed")
+    buffer.add_label("needs-work")
+    buffer.add_label("needs-work")
+    buffer.set_status("review/claude", "pending", "Reviewing")
+    buffer.set_status("review/claude", "success", "Reviewed")
+
+    calls = await buffer.flush("Summary", approve=False)
+
+    gh.get_pr_state.assert_awaited_once_with("owner/repo", 5)
+    gh.create_review.assert_awaited_once()
+    assert gh.create_review.call_args.args[4] == [
+        ReviewComment("a.py", 4, "New point.", position=4),
+        ReviewComment("b.py", 1, "Another.", position=1),
+    ]
+    gh.add_labels.assert_awaited_once_with("owner/repo", 5, ["needs-work"])
+    gh.create_status.assert_awaited_once_with(
+        "owner/repo", "h" * 40, "review/claude", "success", "Reviewed", None
+    )
+
+    assert calls == 3
+    # 9 buffered writes + the review itself, done in 3 calls
+    assert metrics.counters["github.write_calls_saved"] == 7
+    assert metrics.counters["github.comments_deduplicated"] == 2
+
+
+@pytest.mark.asyncio
+async def test_flush_skips_unchanged_status(gh):
+    """A status identical to the one on the PR is not written again."""
+    buffer = GitHubWriteBuffer(gh, "owner/repo", 5)
+    buffer.set_status("review/claude", "pending", "Reviewing")
+
+    assert await buffer.flush("Summary") == 1
+    gh.create_status.assert_not_called()
+    gh.add_labels.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_pr_state_reads_everything_in_one_query():
+    """Existing comments, labels and statuses come from a single GraphQL call."""
+    github = GitHub("token")
+    github.graphql = AsyncMock(return_value={
+        "repository": {"pullRequest": {
+            "headRefOid": "h" * 40,
+            "labels": {"nodes": [{"name": "bug"}]},
+            "reviewThreads": {"nodes": [
+                {"path": "a.py", "line": 3, "comments": {"nodes": [{"body": " Hi \n"}]}},
+            ]},
+            "commits": {"nodes": [{"commit": {"status": {"contexts": [
+                {"context": "ci", "state": "SUCCESS", "description": None},
+            ]}}}]},
+        }}
+    })
+
+    state = await github.get_pr_state("owner/repo", 5)
+
+    github.graphql.assert_awaited_once()
+    assert github.graphql.call_args.args[1] == {"owner": "owner", "name": "repo", "number": 5}
+    assert state == PullRequestState(
+        head_sha="h" * 40,
+        comments={("a.py", 3, "Hi")},
+        labels={"bug"},
+        statuses={"ci": ("success", "")},
+    )
@@ -0,0 +1,78 @@
+"""Tests for GitHub webhook handlers."""
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from basic_factory.claude import CodeReview
+from basic_factory.github import PullRequestState
+from basic_factory.handlers import ReviewComment, get_local_pr_diff, handle_pr_opened
+
+DIFF = """diff --git a/src/basic_factory/hello.py b/src/basic_factory/hello.py
+new file mode 100644
+--- /dev/null
++++ b/src/basic_factory/hello.py
+@@ -0,0 +1,3 @@
++
++def hello_world() -> str:
++    return "Hello from Basic Factory!"
+"""
+
+
+@pytest.mark.asyncio
+async def test_handle_pr_opened_anchors_comments_to_diff_positions():
+    """Comments get their diff position; ones without a position are dropped."""
+    gh = AsyncMock()
+    gh.get_pr.return_value = SimpleNamespace(title="Add hello", body=None)
+    gh.get_pr_diff.return_value = DIFF
+
+    gh.get_pr_state.return_value = PullRequestState(head_sha="h" * 40)
+
+    comments = [
+        ReviewComment("src/basic_factory/hello.py", 2, "Add a docstring."),
+        ReviewComment("src/basic_factory/other.py", 1, "Not in the diff."),
+    ]
+
+    async def review_changes(diff, description, on_comment, related=()):
+        for comment in comments:
+            await on_comment(comment)
+        return CodeReview(
+            summary="Adds hello world.",
+            suggestions=["Add tests."],
+            approval=True,
+            comments=comments,
+        )
+
+    claude = AsyncMock()
+    claude.review_changes.side_effect = review_changes
+
+    await handle_pr_opened(gh, claude, "basicmachines-co/basic-factory", 7)
+
+    gh.create_review.assert_called_once()
+    repo, pr_number, body, approve, submitted = gh.create_review.call_args.args
+    assert (repo, pr_number) == ("basicmachines-co/basic-factory", 7)
+    assert approve is True
+    assert submitted == [
+        ReviewComment("src/basic_factory/hello.py", 2, "Add a docstring.", position=2)
+    ]
+    assert "- Add tests.\n" in body
+
+
+@pytest.mark.asyncio
+async def test_get_local_pr_diff_fetches_only_missing_commits():
+    """The PR is diffed locally; commits are fetched only when not present."""
+    pr = SimpleNamespace(
+        number=7,
+        base=SimpleNamespace(sha="b" * 40, ref="main"),
+        head=SimpleNamespace(sha="h" * 40, ref="feature"),
+    )
+    git = AsyncMock()
+    git.merge_base_diff.return_value = DIFF
+
+    git.has_commit.return_value = True
+    assert await get_local_pr_diff(git, pr) == DIFF
+    git.fetch.assert_not_called()
+    git.merge_base_diff.assert_called_with("b" * 40, "h" * 40)
+
+    git.has_commit.return_value = False
+    await get_local_pr_diff(git, pr)
+    git.fetch.assert_called_once_with("origin", "main", "+refs/pull/7/head")
@@ -0,0 +1,104 @@
+"""Tests for idempotency keys."""
+import asyncio
+
+import pytest
+
+from basic_factory.idempotency import IdempotencyConflict, IdempotencyKeys, IdempotencyStore
+
+
+def _keys(path=None, ttl=3600):
+    return IdempotencyKeys(IdempotencyStore(path, ttl=ttl))
+
+
+@pytest.mark.asyncio
+async def test_replays_stored_response():
+    keys = _keys()
+    calls = []
+
+    async def execute():
+        calls.append(1)
+        return '{"success": true}', True
+
+    assert await keys.run("commit-files", "k1", "fp", execute) == ('{"success": true}', False)
+    assert await keys.run("commit-files", "k1", "fp", execute) == ('{"success": true}', True)
+    # Keys are scoped per endpoint
+    assert await keys.run("create-pr", "k1", "fp", execute) == ('{"success": true}', False)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_reused_key_with_different_request_conflicts():
+    keys = _keys()
+
+    async def execute():
+        return "ok", True
+
+    await keys.run("commit-files", "k1", "fp-a", execute)
+    with pytest.raises(IdempotencyConflict):
+        await keys.run("commit-files", "k1", "fp-b", execute)
+
+
+@pytest.mark.asyncio
+async def test_failures_are_not_stored():
+    keys = _keys()
+    results = iter([("failed", False), ("ok", True)])
+
+    async def execute():
+        return next(results)
+
+    assert await keys.run("push-branch", "k1", "fp", execute) == ("failed", False)
+    assert await keys.run("push-branch", "k1", "fp", execute) == ("ok", False)
+    assert await keys.run("push-branch", "k1", "fp", execute) == ("ok", True)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates_share_one_execution():
+    keys = _keys()
+    started = asyncio.Event()
+    finish = asyncio.Event()
+    calls = []
+
+    async def execute():
+        calls.append(1)
+        started.set()
+        await finish.wait()
+        return "done", True
+
+    first = asyncio.create_task(keys.run("create-pr", "k1", "fp", execute))
+    await started.wait()
+    duplicates = [asyncio.create_task(keys.run("create-pr", "k1", "fp", execute)) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    finish.set()
+
+    assert await first == ("done", False)
+    assert [await d for d in duplicates] == [("done", True)] * 3
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_responses_survive_restart_until_expiry(tmp_path):
+    db = tmp_path / "idempotency.sqlite3"
+
+    async def execute():
+        return "ok", True
+
+    await _keys(db).run("commit-files", "k1", "fp", execute)
+    assert await _keys(db).run("commit-files", "k1", "fp", execute) == ("ok", True)
+    assert await _keys(db, ttl=0).run("commit-files", "k1", "fp", execute) == ("ok", False)
+
+
+@pytest.mark.asyncio
+async def test_stream_replays_complete_body():
+    keys = _keys()
+
+    async def execute():
+        yield "line 1\n", True
+        yield "line 2\n", True
+
+    lines, replayed = await keys.stream("batch", "k1", "fp", execute)
+    assert [line async for line in lines] == ["line 1\n", "line 2\n"]
+    assert replayed is False
+
+    lines, replayed = await keys.stream("batch", "k1", "fp", execute)
+    assert [line async for line in lines] == ["line 1\nline 2\n"]
+    assert replayed is True
@@ -0,0 +1,163 @@
+"""Tests for the shared mirror cache."""
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from basic_factory.metrics import metrics
+from basic_factory.mirror import MirrorCache, MirrorConfig, mirror_name
+
+
+def _git(cwd: Path, *args: str, input_: str = None) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True, input=input_
+    ).stdout.strip()
+
+
+@pytest.fixture
+def upstream(tmp_path):
+    """Bare upstream repository with one commit on main, plus a clone to push from."""
+    remote = tmp_path / "upstream.git"
+    _git(tmp_path, "init", "--bare", "-b", "main", str(remote))
+    author = tmp_path / "author"
+    _git(tmp_path, "clone", str(remote), str(author))
+    _git(author, "config", "user.name", "Test User")
+    _git(author, "config", "user.email", "test@example.com")
+    _git(author, "checkout", "-b", "main")
+    (author / "README.md").write_text("hello\n")
+    _git(author, "add", ".")
+    _git(author, "commit", "-m", "Initial commit")
+    _git(author, "push", "origin", "main")
+    return remote, author
+
+
+def _push_commit(author: Path, name: str) -> str:
+    (author / name).write_text(name)
+    _git(author, "add", name)
+    _git(author, "commit", "-m", f"Add {name}")
+    _git(author, "push", "origin", "main")
+    return _git(author, "rev-parse", "HEAD")
+
+
+def test_mirror_name_is_unique_per_url():
+    assert mirror_name("https://github.com/org/repo.git").startswith("https-github.com-org-repo-")
+    assert mirror_name("https://github.com/org/repo.git") != mirror_name("git@github.com:org/repo.git")
+
+
+@pytest.mark.asyncio
+async def test_provision_borrows_objects_from_mirror(upstream, tmp_path):
+    remote, author = upstream
+    url = str(remote)
+    cache = MirrorCache(MirrorConfig(tmp_path / "mirrors"))
+
+    first = await cache.provision(url, tmp_path / "work1")
+    second = await cache.provision(url, tmp_path / "work2", refresh=False)
+
+    for git in (first, second):
+        alternates = (git.repo_path / ".git" / "objects" / "info" / "alternates").read_text()
+        assert alternates.strip() == str(cache.path(url) / "objects")
+        # Nothing was copied: every object comes from the mirror
+        assert list((git.repo_path / ".git" / "objects" / "pack").glob("*.pack")) == []
+        assert (git.repo_path / "README.md").read_text() == "hello\n"
+        assert await git._run_command(["remote", "get-url", "origin"]) == url
+        await git._run_command(["fsck", "--connectivity-only"])
+    assert len(list((tmp_path / "mirrors").iterdir())) == 1
+    await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_update_refreshes_incrementally_when_stale(upstream, tmp_path):
+    remote, author = upstream
+    url = str(remote)
+    cache = MirrorCache(MirrorConfig(tmp_path / "mirrors", refresh_interval=3600))
+    path = await cache.update(url)
+    new_sha = _push_commit(author, "a.txt")
+
+    # Still fresh: no fetch
+    metrics.reset()
+    await cache.update(url)
+    assert metrics.snapshot()["counters"]["mirror.fresh"] == 1
+    assert _git(path, "rev-parse", "main") != new_sha
+
+    await cache.update(url, force=True)
+    assert _git(path, "rev-parse", "main") == new_sha
+
+    work = await cache.provision(url, tmp_path / "work", refresh=False)
+    assert await work.get_current_commit_sha() == new_sha
+    await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_unreachable_remote_uses_stale_mirror(upstream, tmp_path):
+    remote, _ = upstream
+    url = str(remote)
+    cache = MirrorCache(MirrorConfig(tmp_path / "mirrors", refresh_interval=0))
+    await cache.update(url)
+    remote.rename(tmp_path / "gone.git")
+
+    work = await cache.provision(url, tmp_path / "work")
+    assert (work.repo_path / "README.md").exists()
+    await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_repack_keeps_objects_borrowers_need(upstream, tmp_path):
+    remote, author = upstream
+    url = str(remote)
+    cache = MirrorCache(MirrorConfig(tmp_path / "mirrors", refresh_interval=0, max_loose_objects=0))
+    work = await cache.provision(url, tmp_path / "work")
+
+    # A force-push upstream makes the commit the working copy has unreachable in the mirror
+    borrowed = _push_commit(author, "a.txt")
+    await cache.update(url)
+    await cache.close()  # The borrowed commit is now packed in the mirror
+    await work._run_command(["fetch", "origin"])
+    await work._run_command(["reset", "--hard", borrowed])
+    _git(author, "reset", "--hard", "HEAD~1")
+    _git(author, "push", "--force", "origin", "main")
+
+    # A loose object exceeds max_loose_objects and triggers another repack
+    _git(cache.path(url), "hash-object", "-w", "--stdin", input_="force a repack")
+    await cache.update(url)
+    await cache.close()
+    stats = await cache.stats(cache.path(url))
+    assert stats.packs == 1
+    _git(cache.path(url), "cat-file", "-e", borrowed)
+    await work._run_command(["fsck", "--connectivity-only"])
+    assert await work.get_current_commit_sha() == borrowed
+
+
+def test_provision_command(upstream, tmp_path):
+    from typer.testing import CliRunner
+
+    from basic_factory.cli import app
+
+    remote, _ = upstream
+    dest = tmp_path / "work"
+    args = ["provision", str(remote), str(dest), "--mirror-dir", str(tmp_path / "mirrors")]
+
+    result = CliRunner().invoke(app, args)
+    assert result.exit_code == 0, result.output
+    assert (dest / "README.md").read_text() == "hello\n"
+
+    assert CliRunner().invoke(app, args).exit_code == 1
+
+
+def test_server_provisions_missing_repo(upstream, tmp_path):
+    from fastapi.testclient import TestClient
+
+    from basic_factory.api import create_app
+    from basic_factory.settings import Settings
+
+    remote, _ = upstream
+    settings = Settings(
+        repo_path=tmp_path / "work",
+        repo_url=str(remote),
+        mirror_dir=tmp_path / "mirrors",
+        log_file=None,
+        cpu_workers=0,
+    )
+    with TestClient(create_app(settings)) as client:
+        assert client.get("/health").status_code == 200
+    assert (tmp_path / "work" / "README.md").read_text() == "hello\n"
+    assert (tmp_path / "work" / ".git" / "objects" / "info" / "alternates").exists()
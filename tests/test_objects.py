@@ -0,0 +1,122 @@
+"""Tests for in-process repository object reads."""
+import subprocess
+
+import pytest
+
+from basic_factory.objects import ObjectNotFoundError, ObjectStore
+
+
+def _git(repo, *args):
+    return subprocess.run(
+        ["git", *args], cwd=repo, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """A repo with two commits touching different files"""
+    repo = tmp_path / "repo"
+    subprocess.run(["git", "init", "-b", "main", str(repo)], check=True, capture_output=True)
+    _git(repo, "config", "user.name", "Test User")
+    _git(repo, "config", "user.email", "test@example.com")
+
+    (repo / "src" / "pkg").mkdir(parents=True)
+    (repo / "src" / "pkg" / "app.py").write_text("".join(f"line {n}\n" for n in range(1, 11)))
+    (repo / "README.md").write_text("# Project\n")
+    (repo / "logo.png").write_bytes(b"\x89PNG\0\0binary")
+    _git(repo, "add", ".")
+    _git(repo, "commit", "-m", "Initial commit")
+
+    (repo / "README.md").write_text("# Project\n\nTODO: write docs\n")
+    _git(repo, "commit", "-am", "Update readme\n\nMore detail.")
+    return repo
+
+
+def test_read_file_range(repo):
+    """Range reads return only the requested lines plus the file's length"""
+    store = ObjectStore(repo)
+
+    part = store.read_file("HEAD", "src/pkg/app.py", 3, 5)
+    assert part.content == "line 3\nline 4\nline 5\n"
+    assert (part.start_line, part.end_line, part.total_lines) == (3, 5, 10)
+    assert part.commit == _git(repo, "rev-parse", "HEAD")
+
+    # Past the end is clamped; older refs see older content
+    assert store.read_file("HEAD", "src/pkg/app.py", 9, 50).content == "line 9\nline 10\n"
+    assert store.read_file("HEAD~1", "README.md").content == "# Project\n"
+    assert store.read_file("HEAD", "logo.png").is_binary
+
+    with pytest.raises(ObjectNotFoundError):
+        store.read_file("HEAD", "missing.py")
+    with pytest.raises(ObjectNotFoundError):
+        store.read_file("no-such-branch", "README.md")
+
+
+def test_lines_split_on_newlines_only(repo):
+    """Form feeds and Unicode line separators don't shift line numbers"""
+    (repo / "paged.py").write_text("a = 1\n\x0c\nb = '\u2028'\nc = 3", encoding="utf-8")
+    _git(repo, "add", "paged.py")
+    _git(repo, "commit", "-m", "Add paged")
+    store = ObjectStore(repo)
+
+    text = store.read_file("HEAD", "paged.py", 3, 4)
+    assert text.total_lines == 4
+    assert text.content == "b = '\u2028'\nc = 3"
+    assert [(m.path, m.line) for m in store.grep("HEAD", "c = 3")] == [("paged.py", 4)]
+
+
+def test_objects_are_cached_by_id(repo):
+    """Repeated reads of unchanged objects are served from the cache"""
+    store = ObjectStore(repo)
+    store.read_file("HEAD", "src/pkg/app.py")
+    misses = store._blobs.misses
+
+    # HEAD~1 has the same app.py blob, so only the ref is resolved again
+    store.read_file("HEAD~1", "src/pkg/app.py", 1, 2)
+    assert store._blobs.misses == misses
+    assert store._blobs.hits >= 1
+
+
+def test_list_tree(repo):
+    store = ObjectStore(repo)
+
+    top = {e.path: e.kind for e in store.list_tree("HEAD")}
+    assert top == {"README.md": "blob", "logo.png": "blob", "src": "tree"}
+
+    nested = [e.path for e in store.list_tree("HEAD", "src", recursive=True)]
+    assert nested == ["src/pkg", "src/pkg/app.py"]
+
+    with pytest.raises(ObjectNotFoundError):
+        store.list_tree("HEAD", "README.md")
+
+
+def test_log_filters_by_path(repo):
+    store = ObjectStore(repo)
+
+    assert [c.subject for c in store.log("HEAD")] == ["Update readme", "Initial commit"]
+    assert store.log("HEAD")[0].body == "More detail."
+    assert [c.subject for c in store.log("HEAD", path="src/pkg/app.py")] == ["Initial commit"]
+    assert len(store.log("HEAD", limit=1)) == 1
+
+
+def test_grep(repo):
+    store = ObjectStore(repo)
+
+    matches = store.grep("HEAD", "TODO")
+    assert [(m.path, m.line, m.text) for m in matches] == [("README.md", 3, "TODO: write docs")]
+
+    assert [m.line for m in store.grep("HEAD", r"line 1\d?$", regex=True)] == [1, 10]
+    assert store.grep("HEAD", "todo", ignore_case=True, path="src") == []
+    assert len(store.grep("HEAD", "line", max_results=3)) == 3
+
+
+def test_blame_range(repo):
+    store = ObjectStore(repo)
+    first, second = _git(repo, "rev-list", "--reverse", "HEAD").split()
+
+    hunks = store.blame("HEAD", "README.md")
+    assert [(h.start_line, h.end_line, h.commit) for h in hunks] == [
+        (1, 1, first),
+        (2, 3, second),
+    ]
+    assert [h.commit for h in store.blame("HEAD", "README.md", 3, 3)] == [second]
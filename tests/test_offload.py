@@ -0,0 +1,66 @@
+"""Tests for offloading blocking work from the event loop."""
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from basic_factory.diff import parse_diff
+from basic_factory.metrics import metrics
+from basic_factory.offload import LoopLagMonitor, Offloader
+
+DIFF = """diff --git a/app.py b/app.py
+--- a/app.py
++++ b/app.py
+@@ -1,2 +1,3 @@
+ import os
++import sys
+ print(os.name)
+"""
+
+
+@pytest.mark.asyncio
+async def test_cpu_work_runs_inline_below_threshold():
+    offload = Offloader(process_threshold=1024)
+    # Lambdas can't be pickled, so this only works because it runs inline
+    assert await offload.cpu(lambda text: text.upper(), "small", size=5) == "SMALL"
+    assert offload._processes is None
+
+
+@pytest.mark.asyncio
+async def test_cpu_work_runs_in_worker_process():
+    offload = Offloader(cpu_workers=1, process_threshold=0)
+    try:
+        assert await offload.cpu(os.getpid, size=1) != os.getpid()
+        parsed = await offload.cpu(parse_diff, DIFF, size=len(DIFF))
+        assert parsed.position("app.py", 2).position == 2
+    finally:
+        offload.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_io_work_runs_in_thread_pool():
+    offload = Offloader()
+    try:
+        name = await offload.io(lambda: threading.current_thread().name)
+        assert name.startswith("offload-io")
+    finally:
+        offload.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_lag_monitor_records_blocked_loop():
+    metrics.reset()
+    monitor = LoopLagMonitor(interval=0.01)
+    monitor.start()
+    try:
+        await asyncio.sleep(0.03)
+        time.sleep(0.1)  # Block the loop
+        await asyncio.sleep(0.03)
+    finally:
+        await monitor.stop()
+
+    lag = metrics.snapshot()["histograms"]["event_loop.lag_ms"]
+    assert lag["count"] >= 2
+    assert lag["max"] >= 80
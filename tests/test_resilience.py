@@ -0,0 +1,251 @@
+"""Tests for retries and circuit breaking of remote calls."""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from basic_factory import resilience
+from basic_factory.git import GitError, GitTimeoutError
+from basic_factory.metrics import metrics
+from basic_factory.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    Dependency,
+    RetryPolicy,
+    classify,
+    dependency,
+)
+
+
+class FakeGithubException(Exception):
+    """Shaped like github.GithubException."""
+
+    def __init__(self, status, data, headers=None):
+        super().__init__(status, data, headers)
+        self.status = status
+        self.data = data
+        self.headers = headers or {}
+
+
+class FakeAPIStatusError(Exception):
+    """Shaped like anthropic.APIStatusError."""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+        self.response = httpx.Response(status_code, headers=headers or {})
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    """Record backoff delays instead of sleeping through them."""
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(resilience.asyncio, "sleep", sleep)
+    resilience.reset()
+    yield delays
+    resilience.reset()
+
+
+def test_classify_errors():
+    assert classify(GitTimeoutError("timed out", ["push"], "")) == (True, None)
+    assert classify(GitError("failed", ["push"], "fatal: unable to access: Could not resolve host: github.com"))[0]
+    assert not classify(GitError("failed", ["push"], "error: src refspec nope does not match any"))[0]
+
+    # GitHub secondary rate limit: 403 with Retry-After
+    secondary = FakeGithubException(403, {"message": "You have exceeded a secondary rate limit"}, {"retry-after": "7"})
+    assert classify(secondary) == (True, 7.0)
+    # Primary rate limit exhausted: wait until the reset time
+    reset = str(int(time.time()) + 30)
+    retryable, wait = classify(FakeGithubException(403, {"message": "API rate limit exceeded"},
+                                                   {"x-ratelimit-remaining": "0", "x-ratelimit-reset": reset}))
+    assert retryable and 25 < wait <= 30
+    assert not classify(FakeGithubException(403, {"message": "Resource not accessible by integration"}))[0]
+    assert not classify(FakeGithubException(422, {"message": "A pull request already exists"}))[0]
+
+    # Anthropic overloaded and rate limited
+    assert classify(FakeAPIStatusError(529)) == (True, None)
+    assert classify(FakeAPIStatusError(429, {"retry-after": "3"})) == (True, 3.0)
+    assert not classify(FakeAPIStatusError(400))[0]
+    assert not classify(ValueError("bad input"))[0]
+
+
+@pytest.mark.asyncio
+async def test_retries_transient_errors_with_backoff(no_sleep):
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise FakeAPIStatusError(529)
+        return "ok"
+
+    dep = Dependency("flaky", RetryPolicy(attempts=3, base_delay=1.0))
+    assert await dep.call(flaky) == "ok"
+    assert len(calls) == 3
+    assert len(no_sleep) == 2
+    assert 0 <= no_sleep[0] <= 1.0 and 0 <= no_sleep[1] <= 2.0
+    assert dep.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_honours_retry_after_and_does_not_retry_client_errors(no_sleep):
+    calls = []
+
+    async def limited():
+        calls.append(1)
+        if len(calls) == 1:
+            raise FakeGithubException(403, {"message": "secondary rate limit"}, {"Retry-After": "5"})
+        raise FakeGithubException(404, {"message": "Not Found"})
+
+    dep = Dependency("github", RetryPolicy(attempts=4, base_delay=0.1))
+    with pytest.raises(FakeGithubException):
+        await dep.call(limited)
+    assert len(calls) == 2
+    assert no_sleep == [5.0]
+
+
+@pytest.mark.asyncio
+async def test_gives_up_when_server_asks_for_too_long_a_wait(no_sleep):
+    async def limited():
+        raise FakeAPIStatusError(429, {"retry-after": "3600"})
+
+    dep = Dependency("slow", RetryPolicy(attempts=3, max_delay=60))
+    with pytest.raises(FakeAPIStatusError):
+        await dep.call(limited)
+    assert no_sleep == []
+
+
+@pytest.mark.asyncio
+async def test_can_retry_stops_retries():
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        raise ConnectionError("reset")
+
+    with pytest.raises(ConnectionError):
+        await Dependency("partial").call(failing, can_retry=lambda: False)
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_timeout_per_attempt():
+    attempts = []
+
+    async def hangs():
+        attempts.append(1)
+        await asyncio.Event().wait()
+
+    with pytest.raises(TimeoutError):
+        await Dependency("hangs", RetryPolicy(attempts=2, timeout=0.01)).call(hangs)
+    assert len(attempts) == 2
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_fails_fast_and_probes(monkeypatch):
+    metrics.reset()
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    dep = Dependency("down", RetryPolicy(attempts=1), CircuitBreaker("down", failure_threshold=2, reset_timeout=30))
+    calls = []
+
+    async def down():
+        calls.append(1)
+        raise ConnectionError("refused")
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            await dep.call(down)
+    assert dep.breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError) as excinfo:
+        await dep.call(down)
+    assert len(calls) == 2
+    assert excinfo.value.retry_after == 30
+
+    # After the cool-down one probe goes through; its failure re-opens the circuit
+    now[0] += 30
+    assert dep.breaker.state == "half-open"
+    with pytest.raises(ConnectionError):
+        await dep.call(down)
+    assert len(calls) == 3
+    assert dep.breaker.state == "open"
+
+    now[0] += 30
+
+    async def up():
+        return "ok"
+
+    assert await dep.call(up) == "ok"
+    assert dep.breaker.state == "closed"
+    counters = metrics.snapshot()["counters"]
+    assert counters["resilience.down.opened"] == 2
+    assert counters["resilience.down.rejected"] == 1
+
+
+def test_dependency_registry_shares_breakers():
+    assert dependency("git:origin") is dependency("git:origin")
+    assert dependency("git:origin").policy == resilience.DEFAULT_POLICIES["git"]
+    assert dependency("github").policy.timeout == 60
+    assert dependency("git:upstream").breaker is not dependency("git:origin").breaker
+
+
+@pytest.mark.asyncio
+async def test_cancelled_probe_frees_half_open_slot(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    dep = Dependency("flappy", RetryPolicy(attempts=1), CircuitBreaker("flappy", failure_threshold=1, reset_timeout=30))
+
+    async def down():
+        raise ConnectionError("refused")
+
+    with pytest.raises(ConnectionError):
+        await dep.call(down)
+    now[0] += 30
+
+    started = asyncio.Event()
+
+    async def hangs():
+        started.set()
+        await asyncio.Event().wait()
+
+    probe = asyncio.create_task(dep.call(hangs))
+    await started.wait()
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+
+    async def up():
+        return "ok"
+
+    assert await dep.call(up) == "ok"
+    assert dep.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_non_idempotent_calls_are_not_retried(no_sleep):
+    calls = []
+
+    async def create():
+        calls.append(1)
+        raise FakeGithubException(502, {"message": "Bad Gateway"})
+
+    dep = Dependency("github", RetryPolicy(attempts=4, timeout=0.01))
+    with pytest.raises(FakeGithubException):
+        await dep.call(create, idempotent=False)
+    assert len(calls) == 1
+    assert no_sleep == []
+
+    async def slow_create():
+        # Outlasts the policy timeout, which must not abandon a running write
+        done = asyncio.Event()
+        asyncio.get_running_loop().call_later(0.05, done.set)
+        await done.wait()
+        return "created"
+
+    assert await dep.call(slow_create, idempotent=False) == "created"
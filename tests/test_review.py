@@ -0,0 +1,63 @@
+"""Tests for structured review parsing."""
+import json
+
+import pytest
+from basic_factory.review import ReviewComment, ReviewStreamParser, parse_comment
+
+PAYLOAD = {
+    "comments": [
+        {"path": "a.py", "line": 3, "body": "Tricky \"quoted\" {braces} and [brackets]"},
+        {"path": "b/b.py", "line": "12", "body": "Line given as a string"},
+        {"path": "a.py", "line": 99, "body": "Outside the hunk"},
+        {"path": "a.py", "body": "Missing line"},
+    ],
+    "summary": "A summary mentioning \"comments\": [ {",
+    "suggestions": ["one"],
+    "approval": True,
+}
+
+RANGES = {"a.py": [(1, 10)], "b.py": [(10, 20)]}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 64, 10_000])
+def test_parser_emits_comments_regardless_of_chunking(chunk_size):
+    """Comments are decoded the same way however the JSON is split."""
+    text = json.dumps(PAYLOAD)
+    parser = ReviewStreamParser(RANGES)
+
+    emitted = []
+    for i in range(0, len(text), chunk_size):
+        emitted.extend(parser.feed(text[i:i + chunk_size]))
+
+    assert emitted == [
+        ReviewComment("a.py", 3, "Tricky \"quoted\" {braces} and [brackets]"),
+        ReviewComment("b.py", 12, "Line given as a string"),
+    ]
+    assert parser.comments == emitted
+    assert parser.rejected == [ReviewComment("a.py", 99, "Outside the hunk")]
+
+
+def test_b_prefix_is_kept_for_a_real_b_directory():
+    """Only a diff prefix is stripped, not a top-level directory named b/."""
+    paths = {"b/foo.py", "bar.py"}
+
+    assert parse_comment({"path": "b/foo.py", "line": 1, "body": "x"}, paths).path == "b/foo.py"
+    assert parse_comment({"path": "b/bar.py", "line": 1, "body": "x"}, paths).path == "bar.py"
+    assert parse_comment({"path": "b/bar.py", "line": 1, "body": "x"}).path == "bar.py"
+
+
+def test_parser_emits_comment_as_soon_as_it_closes():
+    """A comment is returned by the chunk containing its closing brace."""
+    parser = ReviewStreamParser()
+
+    assert parser.feed('{"comments": [{"path": "a.py", "line": 1, "body": "x"') == []
+    assert parser.feed('}, {"path"') == [ReviewComment("a.py", 1, "x")]
+
+
+def test_parser_ignores_nested_objects_outside_comments():
+    """Only elements of the top-level comments array are treated as comments."""
+    parser = ReviewStreamParser()
+
+    text = json.dumps({"extra": [{"path": "a.py", "line": 1, "body": "no"}], "comments": []})
+
+    assert parser.feed(text) == []
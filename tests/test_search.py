@@ -0,0 +1,137 @@
+"""Tests for the incremental code search index."""
+import subprocess
+import threading
+import time
+
+import pytest
+
+from basic_factory.objects import ObjectStore
+from basic_factory.search import SearchIndex, related_snippets
+
+
+def _git(repo, *args):
+    return subprocess.run(
+        ["git", *args], cwd=repo, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def _commit(repo, files, message="Change"):
+    for path, content in files.items():
+        target = repo / path
+        if content is None:
+            target.unlink()
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(content)
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-q", "-m", message)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = tmp_path / "repo"
+    subprocess.run(["git", "init", "-b", "main", str(repo)], check=True, capture_output=True)
+    _git(repo, "config", "user.name", "Test User")
+    _git(repo, "config", "user.email", "test@example.com")
+    _commit(repo, {
+        "src/app/users.py": "class UserStore:\n    def load_user(self, user_id):\n        return self.db.get(user_id)\n",
+        "src/app/billing.py": "from app.users import UserStore\n\ndef charge(user_id):\n    store = UserStore()\n    return store.load_user(user_id)\n",
+        "docs/index.md": "# Docs\n\nThe UserStore keeps users.\n",
+    }, "Initial commit")
+    return repo
+
+
+def test_search_ranks_files_by_terms(repo):
+    index = SearchIndex(ObjectStore(repo))
+    assert index.update("HEAD") == 3
+
+    hits = index.search("load_user charge")
+    assert [h.path for h in hits] == ["src/app/billing.py", "src/app/users.py"]
+    assert hits[0].lines == [(3, "def charge(user_id):"), (5, "    return store.load_user(user_id)")]
+
+    assert [h.path for h in index.search("userstore", path="docs")] == ["docs/index.md"]
+    assert index.search("nothing_like_this") == []
+
+
+def test_update_only_touches_changed_files(repo):
+    store = ObjectStore(repo)
+    index = SearchIndex(store)
+    index.update("HEAD")
+
+    _commit(repo, {
+        "src/app/users.py": "class AccountStore:\n    pass\n",
+        "docs/index.md": None,
+    })
+    reads = store._blobs.misses
+    assert index.update("HEAD") == 2
+    # Only the new users.py blob was read; billing.py was never looked at again
+    assert store._blobs.misses == reads + 1
+
+    assert [h.path for h in index.search("AccountStore")] == ["src/app/users.py"]
+    assert [h.path for h in index.search("UserStore")] == ["src/app/billing.py"]
+    assert len(index) == 2
+
+    # Going back restores the old contents
+    assert index.update("HEAD~1") == 2
+    assert {h.path for h in index.search("UserStore")} == {
+        "src/app/users.py", "src/app/billing.py", "docs/index.md"
+    }
+
+
+def test_pinned_index_waits_for_other_updates(repo):
+    index = SearchIndex(ObjectStore(repo))
+    first = _git(repo, "rev-parse", "HEAD")
+    _commit(repo, {"src/app/users.py": "class AccountStore:\n    pass\n"})
+
+    with index.pinned(first):
+        mover = threading.Thread(target=index.update, args=("HEAD",))
+        mover.start()
+        mover.join(0.2)
+        # Another caller's update can't move the index mid-search
+        assert mover.is_alive()
+        assert index.commit == first
+        assert [h.path for h in index.search("AccountStore")] == []
+    mover.join()
+    assert index.commit == _git(repo, "rev-parse", "HEAD")
+
+
+def test_related_snippets_skip_changed_files(repo):
+    index = SearchIndex(ObjectStore(repo))
+    index.update("HEAD")
+    diff = """diff --git a/src/app/users.py b/src/app/users.py
+--- a/src/app/users.py
++++ b/src/app/users.py
+@@ -2,2 +2,3 @@ class UserStore:
+     def load_user(self, user_id):
++        self.audit(user_id)
+         return self.db.get(user_id)
+"""
+    sections = related_snippets(index, diff)
+
+    assert sections
+    assert all(not s.path.startswith("src/app/users.py") for s in sections)
+    billing = next(s for s in sections if s.path.startswith("src/app/billing.py"))
+    assert "store.load_user(user_id)" in billing.content
+
+
+def test_search_is_fast_on_many_files(tmp_path):
+    """Queries only scan files containing the query's trigrams"""
+    repo = tmp_path / "big"
+    subprocess.run(["git", "init", "-b", "main", str(repo)], check=True, capture_output=True)
+    _git(repo, "config", "user.name", "Test User")
+    _git(repo, "config", "user.email", "test@example.com")
+    _commit(repo, {
+        f"pkg{n % 20}/mod{n}.py": f"def handler_{n}(request):\n    return render(request, 'page{n}')\n"
+        for n in range(2000)
+    })
+    _commit(repo, {"pkg3/mod3.py": "def special_case():\n    pass\n"})
+
+    index = SearchIndex(ObjectStore(repo))
+    index.update("HEAD~1")
+    assert index.update("HEAD") == 1
+
+    start = time.perf_counter()
+    hits = index.search("special_case")
+    elapsed = time.perf_counter() - start
+    assert [h.path for h in hits] == ["pkg3/mod3.py"]
+    assert elapsed < 0.05
@@ -0,0 +1,144 @@
+"""Tests for pre-push validation."""
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+from basic_factory.git import Git, GitConfig
+from basic_factory.validation import Check, Validator, changed_files, check_env, covering_tests
+
+MODULE = "def add(a, b):\n    return a + b\n"
+TEST = "from calc import add\n\n\ndef test_add():\n    assert add(1, 2) == 3\n"
+
+
+@pytest.fixture
+def project(tmp_path):
+    """A repo with a src-layout module and its test on main."""
+    repo = tmp_path / "project"
+    (repo / "src").mkdir(parents=True)
+    (repo / "tests").mkdir()
+    (repo / "src" / "calc.py").write_text(MODULE)
+    (repo / "tests" / "test_calc.py").write_text(TEST)
+    (repo / "tests" / "test_other.py").write_text("def test_other():\n    assert True\n")
+    for args in (
+        ["init", "-b", "main"],
+        ["config", "user.name", "Test User"],
+        ["config", "user.email", "test@example.com"],
+        ["add", "."],
+        ["commit", "-m", "Initial commit"],
+    ):
+        subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True)
+    return repo
+
+
+def test_covering_tests(project):
+    assert covering_tests(["src/calc.py"], project) == ["tests/test_calc.py"]
+    assert covering_tests(["tests/test_other.py", "README.md"], project) == ["tests/test_other.py"]
+    assert covering_tests(["src/unknown.py"], project) == []
+
+
+def test_changed_files_skips_deleted_and_unmatched(project):
+    select = changed_files(("*.py",))
+    assert select(["src/calc.py", "notes.md", "src/gone.py"], project) == ["src/calc.py"]
+
+
+@pytest.mark.asyncio
+async def test_validation_passes_and_fails(project):
+    validator = Validator(Git(GitConfig(project)))
+
+    ok = await validator.validate("main", {"src/calc.py": MODULE + "\n\ndef sub(a, b):\n    return a - b\n"})
+    assert ok.passed
+    assert [(r.name, r.targets) for r in ok.results] == [
+        ("ruff", ["src/calc.py"]),
+        ("pytest", ["tests/test_calc.py"]),
+    ]
+
+    broken = await validator.validate("main", {"src/calc.py": "import os\n\ndef add(a, b):\n    return a - b\n"})
+    assert not broken.passed
+    results = {r.name: r for r in broken.results}
+    assert "F401" in results["ruff"].output
+    assert "assert -1 == 3" in results["pytest"].output
+    assert "pytest failed" in broken.summary()
+
+    # The next validation starts from a clean checkout of the ref
+    clean = await validator.validate("main", {"tests/test_other.py": "def test_other():\n    assert True\n"})
+    assert clean.passed
+    assert (project / "src" / "calc.py").read_text() == MODULE
+
+
+@pytest.mark.asyncio
+async def test_batched_checks_run_in_parallel(project):
+    sleepy = Check(
+        "sleepy",
+        (sys.executable, "-c", "import sys, time; time.sleep(0.5); sys.exit('fail' in sys.argv[1])"),
+        changed_files(("*.txt",)),
+        batch_size=1,
+    )
+    validator = Validator(Git(GitConfig(project)), [sleepy], max_processes=4)
+    files = {f"notes/{name}.txt": "x" for name in ("a", "b", "c", "fail")}
+
+    report = await validator.validate("main", files)
+
+    assert not report.passed
+    assert sorted(report.results[0].targets) == sorted(files)
+    assert report.seconds < 1.5  # Four half-second runs, side by side
+
+
+@pytest.mark.asyncio
+async def test_cancelled_validation_kills_check_processes(project, tmp_path):
+    pid_file = tmp_path / "pid"
+    hang = Check(
+        "hang",
+        (sys.executable, "-c", f"import os, time; open({str(pid_file)!r}, 'w').write(str(os.getpid())); time.sleep(60)"),
+        changed_files(("*.txt",)),
+    )
+    validator = Validator(Git(GitConfig(project)), [hang])
+    task = asyncio.create_task(validator.validate("main", {"a.txt": "x"}))
+    for _ in range(200):
+        if pid_file.exists() and pid_file.read_text():
+            break
+        await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    pid = int(pid_file.read_text())
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
+
+
+@pytest.mark.asyncio
+async def test_check_with_missing_tool_is_skipped(project):
+    missing = Check(
+        "lint", (sys.executable, "-m", "no_such_linter"), changed_files(("*.py",)), module="no_such_linter"
+    )
+    report = await Validator(Git(GitConfig(project)), [missing]).validate("main", {"src/calc.py": MODULE})
+
+    assert report.passed
+    assert report.results[0].skipped
+    assert report.results[0].output == "no_such_linter is not installed"
+
+
+def test_check_env_leaves_out_secrets():
+    environ = {
+        "PATH": "/usr/bin",
+        "HOME": "/home/factory",
+        "GITHUB_TOKEN": "ghp_secret",
+        "ANTHROPIC_API_KEY": "sk-secret",
+        "BASIC_FACTORY_GITHUB_TOKEN": "ghp_secret",
+    }
+    assert check_env(environ) == {"PATH": "/usr/bin", "HOME": "/home/factory"}
+
+
+@pytest.mark.asyncio
+async def test_checks_do_not_see_secrets(project, monkeypatch):
+    monkeypatch.setenv("GITHUB_TOKEN", "ghp_secret")
+    leak = Check(
+        "leak",
+        (sys.executable, "-c", "import os, sys; sys.exit('GITHUB_TOKEN' in os.environ)"),
+        changed_files(("*.txt",)),
+    )
+    report = await Validator(Git(GitConfig(project)), [leak]).validate("main", {"a.txt": "x"})
+    assert report.passed